@@ -2,38 +2,42 @@
 パパになるための禁煙 - ホーム（ダッシュボード）画面
 """
 from datetime import date
+from typing import TYPE_CHECKING, Optional
 
-import plotly.graph_objects as go
 import streamlit as st
 
 from utils.supabase_client import (
     get_user_settings,
+    get_settings_history,
     upsert_user_settings,
     get_today_fertility_log,
     achieve_milestone,
     get_achieved_milestones,
-    get_partner_share_by_code,
+    get_custom_milestones,
     add_partner_message,
-    get_partner_messages,
+    get_partner_snapshot,
 )
 from utils.calculations import (
     get_smoke_free_days,
-    get_saved_money,
     get_cigarettes_not_smoked,
     format_money,
     format_days_hours,
-    get_daily_savings_data,
+    get_quit_start,
+    build_savings_index,
+    SavingsIndex,
     to_jst_str,
 )
-from utils.milestones import (
-    get_achieved_milestones as calc_achieved_milestones,
-    get_next_milestone,
-)
-from utils.discord_notifier import (
-    is_discord_configured,
-    send_milestone_notification,
-    send_daily_reminder,
-)
+from utils.milestones import KIND_DAYS, KIND_MONEY, build_milestone_registry
+from utils.figure_cache import cached_figure, fingerprint
+from utils.widgets import quit_counter
+from utils.metrics import start_exporters_from_env
+from utils.profiling import finish_profile, start_profile
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go  # 実行時はグラフを組み立てるときに初めて読み込む
+
+start_exporters_from_env("app")  # METRICS_PORT / METRICS_FILE が設定されていればメトリクスを書き出す（プロセスごとに1回）
+start_profile("app")  # ?profile=1 のときだけ計測する
 
 # ─── ページ設定 ───────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -51,79 +55,63 @@ st.markdown("""
 <meta name="theme-color" content="#FF69B4">
 """, unsafe_allow_html=True)
 
-# ─── パートナービュー分岐 ─────────────────────────────────────────────────────
-share_code = st.query_params.get("share")
-
-if share_code:
-    # パートナー閲覧ビュー
-    share = get_partner_share_by_code(share_code)
-    if not share:
-        st.error("❌ 共有コードが無効または共有が停止されています。")
-        st.stop()
+# ─── 画面セクション ───────────────────────────────────────────────────────────
+# 各セクションは st.fragment として独立して再実行されるため、
+# あるセクションの操作（メッセージ送信など）で他のセクションのDB取得やグラフ生成は走らない。
 
-    settings = get_user_settings()
-    if not settings:
-        st.warning("まだ設定が完了していません。")
-        st.stop()
-
-    quit_date = date.fromisoformat(settings["quit_date"])
-    quit_datetime_str = settings.get("quit_datetime")
-    cigarettes_per_day = settings["cigarettes_per_day"]
-    price_per_pack = settings["price_per_pack"]
-    cigarettes_per_pack = settings.get("cigarettes_per_pack", 20)
-
-    smoke_free_days = get_smoke_free_days(quit_date)
-    saved_money = get_saved_money(quit_date, cigarettes_per_day, price_per_pack, cigarettes_per_pack)
-    cigarettes_not_smoked = get_cigarettes_not_smoked(quit_date, cigarettes_per_day)
-
-    st.title("👶 パパになるための禁煙")
-    st.caption("パートナーの禁煙進捗を応援しよう！")
+@st.fragment
+def today_check_section(partner: bool = False, today_log: Optional[dict] = None) -> None:
+    """本日の妊活チェック状況
 
+    パートナービューでは DB を読まず、スナップショットの today_log を表示する。
+    """
     st.markdown("---")
-    st.subheader("⏱️ 禁煙継続中")
+    st.subheader("📋 本日の妊活チェック状況" if partner else "📋 本日のチェック状況")
+    if not partner:
+        today_log = get_today_fertility_log()
+    if today_log:
+        col_a, col_b, col_c, col_d = st.columns(4)
+        with col_a:
+            st.metric("亜鉛", "✅" if today_log.get("zinc") else "⬜")
+        with col_b:
+            st.metric("葉酸", "✅" if today_log.get("folate") else "⬜")
+        with col_c:
+            st.metric("運動", "✅" if today_log.get("exercise") else "⬜")
+        with col_d:
+            sleep = today_log.get("sleep_hours")
+            st.metric("睡眠", f"{sleep}h" if sleep else "未記録")
+    elif partner:
+        st.warning("今日の妊活チェックはまだ未入力です。")
+    else:
+        st.warning("本日の妊活チェックをまだ入力していません。")
+        st.page_link("pages/2_妊活チェック.py", label="妊活チェックへ →", icon="🌿")
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("禁煙期間", format_days_hours(quit_date, quit_datetime_str))
-    with col2:
-        st.metric("赤ちゃん貯金", format_money(saved_money))
-    with col3:
-        st.metric("吸わなかった本数", f"{cigarettes_not_smoked:,} 本")
 
-    # マイルストーン
+@st.fragment
+def partner_milestones_section(smoke_free_days: int, saved_money: int,
+                               custom_milestones: list[dict]) -> None:
+    """パートナービューの達成マイルストーン"""
     st.markdown("---")
     st.subheader("🏆 達成マイルストーン")
-    achieved_locally = calc_achieved_milestones(smoke_free_days)
+    registry = build_milestone_registry(custom_milestones)
+    achieved_locally = (
+        registry.achieved(smoke_free_days) + registry.achieved(saved_money, KIND_MONEY)
+    )
     if achieved_locally:
         for m in reversed(achieved_locally[-5:]):
             st.write(f"{m.emoji} **{m.title}** — {m.description}")
     else:
         st.info("まだマイルストーンは達成されていません。一緒に応援しよう！")
 
-    next_ms = get_next_milestone(smoke_free_days)
+    next_ms = registry.next(smoke_free_days)
     if next_ms:
         remaining = next_ms.days - smoke_free_days
         st.info(f"{next_ms.emoji} **次の目標：{next_ms.title}** — あと {remaining}日！")
 
-    # 本日の妊活チェック状況
-    st.markdown("---")
-    st.subheader("📋 本日の妊活チェック状況")
-    today_log = get_today_fertility_log()
-    if today_log:
-        col_a, col_b, col_c, col_d = st.columns(4)
-        with col_a:
-            st.metric("亜鉛", "✅" if today_log.get("zinc") else "⬜")
-        with col_b:
-            st.metric("葉酸", "✅" if today_log.get("folate") else "⬜")
-        with col_c:
-            st.metric("運動", "✅" if today_log.get("exercise") else "⬜")
-        with col_d:
-            sleep = today_log.get("sleep_hours")
-            st.metric("睡眠", f"{sleep}h" if sleep else "未記録")
-    else:
-        st.warning("今日の妊活チェックはまだ未入力です。")
 
-    # パートナーからの応援メッセージ送信
+@st.fragment
+def partner_messages_section(share_code: str) -> None:
+    """パートナーからの応援メッセージ送信・メッセージ履歴"""
     st.markdown("---")
     st.subheader("💌 応援メッセージを送る")
 
@@ -137,13 +125,17 @@ if share_code:
 
     if send_btn and partner_message.strip():
         add_partner_message(share_code, "partner", partner_message.strip())
-        st.success("✅ 応援メッセージを送りました！")
-        st.rerun()
+        st.session_state["partner_message_sent"] = True
+        st.rerun(scope="fragment")
     elif send_btn:
         st.warning("メッセージを入力してください。")
+    if st.session_state.pop("partner_message_sent", False):
+        st.success("✅ 応援メッセージを送りました！")
 
     # メッセージ履歴（パートナービューでも確認可能）
-    messages = get_partner_messages(share_code)
+    # 送信するとスナップショットが作り直されるため、再実行で新しいメッセージが見える
+    snapshot = get_partner_snapshot(share_code)
+    messages = snapshot["messages"] if snapshot else []
     if messages:
         st.markdown("---")
         st.subheader("📩 メッセージ履歴")
@@ -158,6 +150,166 @@ if share_code:
                     st.markdown(msg["message"])
                     st.caption(f"パートナー · {sent_at}")
 
+
+def _build_savings_figure(savings_index: SavingsIndex) -> "go.Figure":
+    """赤ちゃん貯金の累積グラフを組み立てる"""
+    import plotly.graph_objects as go
+
+    savings_data = savings_index.daily_series()
+    dates = [row["date"] for row in savings_data]
+    cumulative = [row["cumulative"] for row in savings_data]
+
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=dates,
+            y=cumulative,
+            mode="lines",
+            fill="tozeroy",
+            line=dict(color="#FF69B4", width=2),
+            fillcolor="rgba(255, 105, 180, 0.15)",
+            name="累積節約金額",
+            hovertemplate="%{x}<br>¥%{y:,}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        xaxis_title="日付",
+        yaxis_title="節約金額（円）",
+        yaxis_tickformat=",",
+        height=280,
+        margin=dict(l=10, r=10, t=10, b=10),
+        showlegend=False,
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+    )
+    return fig
+
+
+@st.fragment
+def savings_chart_section(savings_index: SavingsIndex) -> None:
+    """赤ちゃん貯金の累積グラフ"""
+    st.markdown("---")
+    st.subheader("💰 赤ちゃん貯金の推移")
+
+    today = date.today()
+    if today > savings_index.quit_date:
+        # 設定履歴と日付が同じなら、前回組み立てたグラフをそのまま使う
+        key = fingerprint(savings_index.quit_date, savings_index.starts, savings_index.rates, today)
+        fig = cached_figure("savings", key, lambda: _build_savings_figure(savings_index))
+        st.plotly_chart(fig, width='stretch')
+    else:
+        st.info("2日以上経過するとグラフが表示されます。")
+
+
+@st.fragment
+def milestones_section(smoke_free_days: int, saved_money: int) -> None:
+    """マイルストーンの達成チェック・次の目標・達成済み一覧"""
+    st.markdown("---")
+    st.subheader("🏆 マイルストーン")
+
+    # 達成チェック＆DB保存（Discord通知は worker.py が別プロセスで送信する）
+    # 前回評価した時点（日数・金額）から新しく越えたしきい値だけを調べる。
+    # DBの達成済みセットはセッション初回か、新たに越えたものがあるときだけ読む。
+    registry = build_milestone_registry(get_custom_milestones())
+    current_point = {KIND_DAYS: smoke_free_days, KIND_MONEY: saved_money}
+    last_point = st.session_state.get("milestone_last_point")
+    if last_point and last_point.get("signature") != registry.signature:
+        last_point = None  # マイルストーン定義が変わったら全件を再評価
+
+    crossed = [
+        m
+        for kind, value in current_point.items()
+        for m in registry.crossed(last_point.get(kind) if last_point else None, value, kind)
+    ]
+    if crossed:
+        achieved_in_db = get_achieved_milestones()
+        for m in crossed:
+            if m.key not in achieved_in_db:
+                achieve_milestone(m.key)
+                st.balloons()
+                st.success(f"🎉 **{m.title}** を達成しました！")
+    st.session_state["milestone_last_point"] = {**current_point, "signature": registry.signature}
+
+    # 次のマイルストーン表示
+    next_ms = registry.next(smoke_free_days)
+    if next_ms:
+        remaining = next_ms.days - smoke_free_days
+        st.info(
+            f"{next_ms.emoji} **次のマイルストーン：{next_ms.title}**\n\n"
+            f"あと **{remaining}日** で達成！\n\n"
+            f"{next_ms.description}"
+        )
+    else:
+        st.success("🥇 全マイルストーンを達成しました！おめでとうございます！")
+
+    next_money_ms = registry.next(saved_money, KIND_MONEY)
+    if next_money_ms:
+        st.info(
+            f"{next_money_ms.emoji} **次の貯金目標：{next_money_ms.title}**\n\n"
+            f"あと **{format_money(next_money_ms.amount - saved_money)}** で達成！"
+        )
+
+    # 最近の達成マイルストーン表示（最大3件）
+    achieved_locally = (
+        registry.achieved(smoke_free_days) + registry.achieved(saved_money, KIND_MONEY)
+    )
+    if achieved_locally:
+        with st.expander("達成済みマイルストーンを見る"):
+            for m in reversed(achieved_locally[-3:]):
+                st.write(f"{m.emoji} **{m.title}** — {m.description}")
+
+
+# ─── パートナービュー分岐 ─────────────────────────────────────────────────────
+share_code = st.query_params.get("share")
+
+if share_code:
+    # パートナー閲覧ビュー（書き込み時に作り直されるスナップショットだけを読む）
+    snapshot = get_partner_snapshot(share_code)
+    if not snapshot:
+        st.error("❌ 共有コードが無効または共有が停止されています。")
+        finish_profile()
+        st.stop()
+
+    settings = snapshot["settings"]
+    if not settings:
+        st.warning("まだ設定が完了していません。")
+        finish_profile()
+        st.stop()
+
+    quit_date = date.fromisoformat(settings["quit_date"])
+    quit_datetime_str = settings.get("quit_datetime")
+    cigarettes_per_day = settings["cigarettes_per_day"]
+
+    smoke_free_days = get_smoke_free_days(quit_date)
+    savings_index = build_savings_index(settings, snapshot["settings_history"])
+    saved_money = savings_index.total()
+    cigarettes_not_smoked = get_cigarettes_not_smoked(quit_date, cigarettes_per_day)
+    latest_log = snapshot["latest_fertility_log"]
+    today_log = latest_log if latest_log and latest_log["date"] == str(date.today()) else None
+
+    st.title("👶 パパになるための禁煙")
+    st.caption("パートナーの禁煙進捗を応援しよう！")
+
+    st.markdown("---")
+    st.subheader("⏱️ 禁煙継続中")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        # 経過時間はブラウザ側で毎秒更新する
+        quit_counter(
+            get_quit_start(quit_date, quit_datetime_str),
+            initial=format_days_hours(quit_date, quit_datetime_str),
+        )
+    with col2:
+        st.metric("赤ちゃん貯金", format_money(saved_money))
+    with col3:
+        st.metric("吸わなかった本数", f"{cigarettes_not_smoked:,} 本")
+
+    partner_milestones_section(smoke_free_days, saved_money, snapshot["custom_milestones"])
+    today_check_section(partner=True, today_log=today_log)
+    partner_messages_section(share_code)
+
+    finish_profile()
     st.stop()  # パートナービュー表示後は通常画面をスキップ
 
 # ─── 通常ビュー（本人） ──────────────────────────────────────────────────────
@@ -208,17 +360,17 @@ if not settings:
 
     st.markdown("---")
     st.page_link("pages/4_設定.py", label="詳細な設定画面へ →", icon="⚙️")
+    finish_profile()
     st.stop()
 
 quit_date = date.fromisoformat(settings["quit_date"])
 quit_datetime_str = settings.get("quit_datetime")
 cigarettes_per_day = settings["cigarettes_per_day"]
-price_per_pack = settings["price_per_pack"]
-cigarettes_per_pack = settings.get("cigarettes_per_pack", 20)
 
 # ─── 禁煙カウンター ───────────────────────────────────────────────────────────
 smoke_free_days = get_smoke_free_days(quit_date)
-saved_money = get_saved_money(quit_date, cigarettes_per_day, price_per_pack, cigarettes_per_pack)
+savings_index = build_savings_index(settings, get_settings_history())
+saved_money = savings_index.total()
 cigarettes_not_smoked = get_cigarettes_not_smoked(quit_date, cigarettes_per_day)
 
 st.markdown("---")
@@ -226,9 +378,10 @@ st.subheader("⏱️ 禁煙継続中")
 
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric(
-        label="禁煙期間",
-        value=format_days_hours(quit_date, quit_datetime_str),
+    # 経過時間はブラウザ側で毎秒更新する（見るためだけの再実行は不要）
+    quit_counter(
+        get_quit_start(quit_date, quit_datetime_str),
+        initial=format_days_hours(quit_date, quit_datetime_str),
     )
 with col2:
     st.metric(
@@ -241,113 +394,13 @@ with col3:
         value=f"{cigarettes_not_smoked:,} 本",
     )
 
-# ─── 節約金額累積グラフ ───────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("💰 赤ちゃん貯金の推移")
-
-savings_data = get_daily_savings_data(
-    quit_date, cigarettes_per_day, price_per_pack, cigarettes_per_pack
-)
-
-if len(savings_data) >= 2:
-    dates = [row["date"] for row in savings_data]
-    cumulative = [row["cumulative"] for row in savings_data]
-
-    fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=dates,
-            y=cumulative,
-            mode="lines",
-            fill="tozeroy",
-            line=dict(color="#FF69B4", width=2),
-            fillcolor="rgba(255, 105, 180, 0.15)",
-            name="累積節約金額",
-            hovertemplate="%{x}<br>¥%{y:,}<extra></extra>",
-        )
-    )
-    fig.update_layout(
-        xaxis_title="日付",
-        yaxis_title="節約金額（円）",
-        yaxis_tickformat=",",
-        height=280,
-        margin=dict(l=10, r=10, t=10, b=10),
-        showlegend=False,
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
-    )
-    st.plotly_chart(fig, width='stretch')
-else:
-    st.info("2日以上経過するとグラフが表示されます。")
-
-# ─── マイルストーン ───────────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("🏆 マイルストーン")
-
-# 達成チェック＆DB保存・Discord通知
-achieved_locally = calc_achieved_milestones(smoke_free_days)
-achieved_in_db = get_achieved_milestones()
-notify_enabled = st.session_state.get("discord_notify_enabled", True)
-
-for m in achieved_locally:
-    if m.key not in achieved_in_db:
-        achieve_milestone(m.key)
-        st.balloons()
-        st.success(f"🎉 **{m.title}** を達成しました！")
-        # Discord通知（有効かつ設定済みの場合のみ）
-        if notify_enabled and is_discord_configured():
-            send_milestone_notification(m.title, m.description)
-
-# 次のマイルストーン表示
-next_ms = get_next_milestone(smoke_free_days)
-if next_ms:
-    remaining = next_ms.days - smoke_free_days
-    st.info(
-        f"{next_ms.emoji} **次のマイルストーン：{next_ms.title}**\n\n"
-        f"あと **{remaining}日** で達成！\n\n"
-        f"{next_ms.description}"
-    )
-else:
-    st.success("🥇 全マイルストーンを達成しました！おめでとうございます！")
-
-# 最近の達成マイルストーン表示（最大3件）
-if achieved_locally:
-    with st.expander("達成済みマイルストーンを見る"):
-        for m in reversed(achieved_locally[-3:]):
-            st.write(f"{m.emoji} **{m.title}** — {m.description}")
-
-# ─── 本日のチェック状況 ───────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("📋 本日のチェック状況")
-
-today_log = get_today_fertility_log()
-if today_log:
-    col_a, col_b, col_c, col_d = st.columns(4)
-    with col_a:
-        icon = "✅" if today_log.get("zinc") else "⬜"
-        st.metric("亜鉛", icon)
-    with col_b:
-        icon = "✅" if today_log.get("folate") else "⬜"
-        st.metric("葉酸", icon)
-    with col_c:
-        icon = "✅" if today_log.get("exercise") else "⬜"
-        st.metric("運動", icon)
-    with col_d:
-        sleep = today_log.get("sleep_hours")
-        st.metric("睡眠", f"{sleep}h" if sleep else "未記録")
-else:
-    st.warning("本日の妊活チェックをまだ入力していません。")
-    st.page_link("pages/2_妊活チェック.py", label="妊活チェックへ →", icon="🌿")
-
-    # 妊活チェック未入力リマインダー（1セッション1回のみ）
-    if (
-        not st.session_state.get("reminder_sent")
-        and notify_enabled
-        and is_discord_configured()
-    ):
-        send_daily_reminder(smoke_free_days, saved_money)
-        st.session_state["reminder_sent"] = True
+# ─── 節約金額累積グラフ・マイルストーン・本日のチェック状況 ──────────────────
+savings_chart_section(savings_index)
+milestones_section(smoke_free_days, saved_money)
+today_check_section()
 
 # ─── フッター ────────────────────────────────────────────────────────────────
 st.markdown("---")
 st.caption(f"禁煙開始日：{quit_date.strftime('%Y年%m月%d日')}")
+
+finish_profile()
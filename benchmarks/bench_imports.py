@@ -0,0 +1,108 @@
+"""
+起動時のインポート時間の計測
+
+各画面（app.py・pages/*.py・worker.py）の先頭にある import 文だけを取り出し、
+新しいプロセスで `python -X importtime` を付けて実行する。プロセス再起動直後の
+初回表示までにかかるインポート時間と、重いモジュール（Plotly・pandas・requests など）が
+起動時に読み込まれているかを確認できる。
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --target app.py --top 15 --repeat 5
+"""
+import argparse
+import ast
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 起動時に読み込まれていないことが望ましい重いモジュール
+HEAVY_MODULES = ("plotly", "pandas", "numpy", "requests", "dotenv")
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def default_targets() -> list[Path]:
+    """計測対象の既定値（ホーム・各ページ・通知ワーカー）"""
+    return [ROOT / "app.py", *sorted((ROOT / "pages").glob("*.py")), ROOT / "worker.py"]
+
+
+def top_level_imports(path: Path) -> str:
+    """スクリプトのモジュール直下にある import 文だけを抜き出したコードを返す
+
+    関数内・TYPE_CHECKING ブロック内の import（遅延読み込み）は含めない。
+    """
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return ast.unparse(ast.Module(body=nodes, type_ignores=[]))
+
+
+def profile_imports(code: str) -> dict:
+    """新しいプロセスで code を -X importtime 付きで実行し、計測結果を返す"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+
+    modules = []  # （モジュール名, 自身の時間 us, 累積時間 us, 深さ）
+    errors = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        elif not line.startswith("import time:"):
+            errors.append(line)
+    loaded = {name.split(".")[0] for name, *_ in modules}
+    return {
+        "ok": proc.returncode == 0,
+        "error": errors[-1] if errors else "",
+        "wall": wall,
+        "total_ms": sum(m[1] for m in modules) / 1000,
+        "modules": modules,
+        "heavy": [name for name in HEAVY_MODULES if name in loaded],
+    }
+
+
+def run_target(path: Path, repeat: int) -> dict:
+    """1画面分を repeat 回計測し、インポート時間の中央値の回の結果を返す"""
+    code = top_level_imports(path)
+    runs = [profile_imports(code) for _ in range(repeat)]
+    runs.sort(key=lambda r: r["total_ms"])
+    result = runs[len(runs) // 2]
+    result["wall_median"] = statistics.median(r["wall"] for r in runs)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="起動時のインポート時間の計測")
+    parser.add_argument("--target", action="append", help="計測するスクリプト（複数指定可、既定は全画面）")
+    parser.add_argument("--repeat", type=int, default=3, help="1画面あたりの計測回数（中央値を表示）")
+    parser.add_argument("--top", type=int, default=0, help="累積時間の大きい直下のモジュールを N 件表示する")
+    args = parser.parse_args()
+
+    targets = [ROOT / t for t in args.target] if args.target else default_targets()
+    print(f"Python {sys.version.split()[0]} / {args.repeat} 回計測の中央値")
+    print(f"{'画面':<24}{'import(ms)':>12}{'プロセス(s)':>12}  起動時に読み込まれる重いモジュール")
+    for path in targets:
+        r = run_target(path, args.repeat)
+        name = path.relative_to(ROOT).as_posix()
+        if not r["ok"]:
+            print(f"{name:<24}{'—':>12}{'—':>12}  失敗: {r['error']}")
+            continue
+        heavy = ", ".join(r["heavy"]) or "なし"
+        print(f"{name:<24}{r['total_ms']:>12.1f}{r['wall_median']:>12.3f}  {heavy}")
+        if args.top:
+            top = sorted((m for m in r["modules"] if m[3] == 0), key=lambda m: m[2], reverse=True)
+            for module, _, cumulative_us, _ in top[:args.top]:
+                print(f"    {cumulative_us / 1000:>9.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Discord通知ディスパッチャーのベンチマーク
+
+ローカルの Webhook スタブ（benchmarks/discord_stub.py）に対して通知を送り、
+スループット・通知ごとの遅延（p50/p95/p99）・再試行回数・束ね効果を計測する。
+
+    python -m benchmarks.bench_notifier
+    python -m benchmarks.bench_notifier --count 500 --burst 20 --window 0.2 --latency 0.05
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.discord_stub import DiscordWebhookStub, StubConfig
+from utils.discord_notifier import STATUS_SENT, DiscordDispatcher
+
+# 計測するシナリオ（名前 → スタブ設定）
+SCENARIOS = {
+    "正常": lambda latency: StubConfig(latency=latency),
+    "429を5回に1回注入": lambda latency: StubConfig(latency=latency, inject_429_every=5, retry_after=0.2),
+    "レート制限 5回/2秒": lambda latency: StubConfig(latency=latency, rate_limit=(5, 2.0)),
+}
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(config: StubConfig, count: int, burst: int, interval: float,
+                 window: float, queue_size: int) -> dict:
+    """1シナリオを実行して計測結果を返す"""
+    with DiscordWebhookStub(config) as stub:
+        dispatcher = DiscordDispatcher(queue_size=queue_size, coalesce_window=window)
+        tickets = []
+        started = time.perf_counter()
+        for i in range(count):
+            tickets.append(dispatcher.submit(
+                stub.url,
+                {"title": f"通知 {i}", "description": "ベンチマーク", "color": 0xFF69B4},
+                label=f"bench-{i}",
+            ))
+            if burst and (i + 1) % burst == 0:
+                time.sleep(interval)
+        dispatcher.flush()
+        elapsed = time.perf_counter() - started
+
+    sent = [t for t in tickets if t.status == STATUS_SENT]
+    latencies = [t.finished_at - t.created_at for t in sent]
+    return {
+        "sent": len(sent),
+        "failed": len(tickets) - len(sent),
+        "elapsed": elapsed,
+        "throughput": len(sent) / elapsed if elapsed else 0.0,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "retries": sum(max(0, t.attempts - 1) for t in tickets),
+        "requests": stub.stats.requests,
+        "rate_limited": stub.stats.rate_limited,
+        "messages": dispatcher.stats.messages,
+        "saved": dispatcher.stats.saved,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Discord通知ディスパッチャーのベンチマーク")
+    parser.add_argument("--count", type=int, default=200, help="送信する通知の件数")
+    parser.add_argument("--burst", type=int, default=10, help="この件数ごとに間隔を空ける（0 で一気に投入）")
+    parser.add_argument("--interval", type=float, default=0.1, help="バースト間の間隔（秒）")
+    parser.add_argument("--window", type=float, default=0.5, help="束ねる待ち時間（秒）")
+    parser.add_argument("--latency", type=float, default=0.02, help="スタブの応答遅延（秒）")
+    parser.add_argument("--queue-size", type=int, default=1000, help="キューの上限")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), help="1シナリオだけ実行する")
+    args = parser.parse_args()
+
+    names = [args.scenario] if args.scenario else list(SCENARIOS)
+    print(f"通知 {args.count} 件 / バースト {args.burst} 件ごと {args.interval}s / "
+          f"束ね {args.window}s / スタブ遅延 {args.latency}s")
+    header = (f"{'シナリオ':<16}{'送信':>6}{'失敗':>6}{'件/秒':>9}{'p50':>8}{'p95':>8}{'p99':>8}"
+              f"{'再試行':>7}{'HTTP':>6}{'429':>5}{'通数':>6}{'削減':>6}")
+    print(header)
+    for name in names:
+        r = run_scenario(SCENARIOS[name](args.latency), args.count, args.burst,
+                         args.interval, args.window, args.queue_size)
+        print(f"{name:<16}{r['sent']:>6}{r['failed']:>6}{r['throughput']:>9.1f}"
+              f"{r['p50']:>8.3f}{r['p95']:>8.3f}{r['p99']:>8.3f}{r['retries']:>7}"
+              f"{r['requests']:>6}{r['rate_limited']:>5}{r['messages']:>6}{r['saved']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Discord Webhook のローカル代替サーバー
+
+本物の Webhook URL なしで utils/discord_notifier.py を動かすためのスタブ。
+Discord の Webhook と同じく、成功時は 204、レート制限時は 429 と retry_after を返す。
+
+    python -m benchmarks.discord_stub --port 8765 --latency 0.05 --rate-limit 5/2
+
+    # 別のターミナルで
+    DISCORD_WEBHOOK_URL=http://127.0.0.1:8765/webhook python worker.py --once
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+_MAX_EMBEDS = 10
+
+
+@dataclass
+class StubConfig:
+    """スタブの応答設定"""
+    latency: float = 0.0               # 応答までの遅延（秒）
+    rate_limit: Optional[tuple[int, float]] = None  # (回数, 秒)：この窓を超えたら 429
+    inject_429_every: int = 0          # N 回に1回、必ず 429 を返す（0 なら無効）
+    retry_after: float = 0.2           # 注入した 429 の retry_after（秒）
+    error_every: int = 0               # N 回に1回 500 を返す（0 なら無効）
+
+
+@dataclass
+class StubStats:
+    """スタブが受け取ったリクエストの集計"""
+    requests: int = 0
+    accepted: int = 0
+    embeds: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    bad_requests: int = 0
+    payloads: list = field(default_factory=list)
+
+
+class DiscordWebhookStub:
+    """Discord Webhook の挙動を真似るローカル HTTP サーバー"""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1",
+                 port: int = 0, keep_payloads: bool = False):
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self._keep_payloads = keep_payloads
+        self._lock = threading.Lock()
+        self._window: deque[float] = deque()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/webhook"
+
+    def start(self) -> "DiscordWebhookStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "DiscordWebhookStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _decide(self, payload: Optional[dict]) -> tuple[int, Optional[float]]:
+        """（ステータスコード, retry_after）を決める"""
+        config = self.config
+        with self._lock:
+            self.stats.requests += 1
+            n = self.stats.requests
+            if payload is None or not (payload.get("content") or payload.get("embeds")) \
+                    or len(payload.get("embeds") or []) > _MAX_EMBEDS:
+                self.stats.bad_requests += 1
+                return 400, None
+            if config.error_every and n % config.error_every == 0:
+                self.stats.errors += 1
+                return 500, None
+            if config.inject_429_every and n % config.inject_429_every == 0:
+                self.stats.rate_limited += 1
+                return 429, config.retry_after
+            if config.rate_limit:
+                limit, per = config.rate_limit
+                now = time.monotonic()
+                while self._window and now - self._window[0] >= per:
+                    self._window.popleft()
+                if len(self._window) >= limit:
+                    self.stats.rate_limited += 1
+                    return 429, round(per - (now - self._window[0]), 3)
+                self._window.append(now)
+            self.stats.accepted += 1
+            self.stats.embeds += len(payload.get("embeds") or []) or 1
+            if self._keep_payloads:
+                self.stats.payloads.append(payload)
+            return 204, None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive で接続を使い回せるようにする
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    payload = None
+                if stub.config.latency:
+                    time.sleep(stub.config.latency)
+                status, retry_after = stub._decide(payload)
+                if status == 429:
+                    data = json.dumps({
+                        "message": "You are being rate limited.",
+                        "retry_after": retry_after,
+                        "global": False,
+                    }).encode()
+                    self.send_response(429)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Retry-After", str(max(1, round(retry_after))))
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self.send_response(status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parse_rate_limit(value: str) -> Optional[tuple[int, float]]:
+    """"5/2" → (5, 2.0)"""
+    if not value:
+        return None
+    count, per = value.split("/")
+    return int(count), float(per)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Discord Webhook のローカル代替サーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延（秒）")
+    parser.add_argument("--rate-limit", default="", help="レート制限（例：5/2 = 2秒に5回）")
+    parser.add_argument("--inject-429-every", type=int, default=0, help="N回に1回 429 を返す")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="注入する 429 の retry_after（秒）")
+    parser.add_argument("--error-every", type=int, default=0, help="N回に1回 500 を返す")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        rate_limit=_parse_rate_limit(args.rate_limit),
+        inject_429_every=args.inject_429_every,
+        retry_after=args.retry_after,
+        error_every=args.error_every,
+    )
+    stub = DiscordWebhookStub(config, port=args.port).start()
+    print(f"Discord Webhook スタブ起動: {stub.url}")
+    try:
+        while True:
+            time.sleep(5)
+            s = stub.stats
+            print(f"requests={s.requests} accepted={s.accepted} embeds={s.embeds} "
+                  f"429={s.rate_limited} 500={s.errors} 400={s.bad_requests}")
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
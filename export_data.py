@@ -0,0 +1,59 @@
+"""
+全データのエクスポート（コマンドライン）
+
+smoke スキーマの各テーブルを Parquet・CSV に書き出し、件数とチェックサムを
+manifest.json に記録する。テーブルはページ単位で読みながら書き出すため、
+記録が何年分あってもメモリ使用量は変わらない。
+
+    python export_data.py                          # exports/<日時>/ に Parquet と CSV
+    python export_data.py --out backup --format csv
+    python export_data.py --zip                    # 書き出したディレクトリを zip にもまとめる
+    python export_data.py --keep 10                # exports/ に残す過去のエクスポートの数（既定 3）
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from utils.data_export import (
+    FORMATS,
+    KEEP_EXPORTS,
+    default_export_dir,
+    export_all,
+    prune_exports,
+    zip_export,
+)
+
+logger = logging.getLogger("export")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="全データのエクスポート")
+    parser.add_argument("--out", type=Path, help="出力先ディレクトリ（既定 exports/<日時>）")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="出力形式（複数指定可）")
+    parser.add_argument("--page-size", type=int, default=1000, help="1回に取得する行数")
+    parser.add_argument("--zip", action="store_true", help="書き出したディレクトリを zip にまとめる")
+    parser.add_argument("--keep", type=int, default=KEEP_EXPORTS,
+                        help="--out を省略したとき exports/ に残す過去のエクスポートの数（0 以下で削除しない）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    out_dir = args.out or default_export_dir()
+
+    def progress(table_name: str, rows: int) -> None:
+        logger.info("%s: %d行", table_name, rows)
+
+    manifest = export_all(out_dir, formats=args.format, page_size=args.page_size, progress=progress)
+    total = sum(t["rows"] for t in manifest["tables"].values())
+    logger.info("%d テーブル・%d 行を %s に書き出しました", len(manifest["tables"]), total, out_dir)
+    if args.zip:
+        logger.info("zip: %s", zip_export(out_dir))
+    if args.out is None and args.keep > 0:
+        for path in prune_exports(out_dir.parent, keep=args.keep):
+            logger.info("古いエクスポートを削除しました: %s", path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+過去の記録の一括インポート（コマンドライン）
+
+CSV・JSON・JSON Lines のファイルを検証しながら読み込み、まとめて書き込む。
+パートナービューのスナップショットなどの集計は最後に1回だけ作り直す。
+
+    python import_data.py cravings.csv --table craving_logs
+    python import_data.py habits.json --table fertility_logs --overwrite
+    python import_data.py cravings.csv --table craving_logs --dry-run   # 検証だけ行う
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from utils.data_import import IMPORT_TABLES, import_file
+
+logger = logging.getLogger("import")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="過去の記録の一括インポート")
+    parser.add_argument("path", type=Path, help="取り込むファイル（.csv / .json / .jsonl）")
+    parser.add_argument("--table", required=True, choices=list(IMPORT_TABLES), help="取り込み先のテーブル")
+    parser.add_argument("--format", choices=("csv", "json", "jsonl"), help="形式（省略時は拡張子から判断）")
+    parser.add_argument("--chunk-size", type=int, default=500, help="1回の書き込みにまとめる行数")
+    parser.add_argument("--overwrite", action="store_true", help="同じ日付の妊活チェックを上書きする")
+    parser.add_argument("--dry-run", action="store_true", help="検証だけ行い書き込まない")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    def progress(read: int, written: int) -> None:
+        logger.info("読み込み %d行 / 書き込み %d行", read, written)
+
+    report = import_file(
+        args.path, args.table, fmt=args.format, overwrite=args.overwrite,
+        chunk_size=args.chunk_size, dry_run=args.dry_run, progress=progress,
+    )
+    for line, message in report.errors:
+        logger.warning("%d行目: %s", line, message)
+    if report.error_count > len(report.errors):
+        logger.warning("ほか %d 件のエラー", report.error_count - len(report.errors))
+    logger.info(
+        "読み込み %d行・正常 %d行・書き込み %d行・既存のため読み飛ばし %d行・エラー %d行%s",
+        report.read, report.valid, report.written, report.skipped, report.error_count,
+        "（検証のみ）" if report.dry_run else "",
+    )
+    return 1 if report.error_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,88 @@
 """
 禁煙トラッカー画面 - 衝動ログ入力・マイルストーン一覧
 """
-from datetime import date, datetime
+import functools
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
-import plotly.graph_objects as go
 import streamlit as st
-import streamlit.components.v1 as components
 
 from utils.supabase_client import (
+    CONNECTION_ERRORS,
     get_user_settings,
+    get_settings_history,
+    get_custom_milestones,
     add_craving_log,
     get_craving_logs,
+    count_craving_logs,
+    get_pending_writes,
     restart_quit,
     get_quit_attempts,
+    get_quit_attempt_stats,
     get_coping_strategies,
+    get_craving_forecaster,
+    get_craving_trends,
 )
-from utils.calculations import get_smoke_free_days, to_jst_str
-from utils.milestones import MILESTONES, get_achieved_milestones, get_next_milestone
+from utils.calculations import (
+    get_smoke_free_days,
+    build_savings_index,
+    build_craving_heatmap,
+    get_range_start,
+    format_money,
+    HEATMAP_RANGES,
+    to_jst_str,
+)
+from utils.craving_forecast import RISK_HIGH, RISK_MEDIUM
+from utils.milestones import KIND_DAYS, KIND_MONEY, build_milestone_registry
+from utils.figure_cache import cached_figure, fingerprint
+from utils.widgets import breathing_guide, emergency_timer
+from utils.profiling import finish_profile, start_profile
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go  # 実行時はグラフを組み立てるときに初めて読み込む
+
+start_profile("1_禁煙トラッカー")  # ?profile=1 のときだけ計測する
 
 st.set_page_config(page_title="禁煙トラッカー", page_icon="🚭", layout="centered")
 
+_ATTEMPTS_SHOWN = 10  # 挑戦履歴に表示する直近の挑戦数
+_TREND_RANGES = {"30日": 30, "90日": 90, "180日": 180}  # 推移グラフの表示期間
+_JST = timezone(timedelta(hours=9))
+
+
+@st.cache_resource
+def _last_known() -> dict:
+    """最後に DB から読めた設定・対処法（プロセス内で共有。接続できないときの表示に使う）"""
+    return {}
+
+
+def _load_or_last_known(key: str, load: Callable[[], Any]) -> tuple[Any, bool]:
+    """DB から読めたら覚えておき、接続できなければ最後に読めた値を返す
+
+    Returns:
+        （値, 接続できなかったか）。一度も読めていなければ値は None
+    """
+    try:
+        value = load()
+    except CONNECTION_ERRORS:
+        return _last_known().get(key), True
+    _last_known()[key] = value
+    return value, False
+
+
+def _offline_safe(section_name: str):
+    """セクションの DB 読み込みが通信エラーになったら、例外ではなく案内を表示する"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except CONNECTION_ERRORS:
+                st.caption(f"📴 サーバーに接続できないため、{section_name}を表示できません。")
+        return wrapper
+    return decorator
+
+
 st.title("🚭 禁煙トラッカー")
 
 # 再スタートUIの表示フラグを初期化
@@ -28,352 +91,506 @@ if "show_restart_ui" not in st.session_state:
 if "restart_smoke_free_days" not in st.session_state:
     st.session_state["restart_smoke_free_days"] = 0
 
-settings = get_user_settings()
-if not settings:
+# 設定は最後に読めた値で代用し、接続できなくても衝動の記録（ローカルジャーナルに保存）はできるようにする
+settings, offline = _load_or_last_known("settings", get_user_settings)
+if offline:
+    st.warning(
+        "📴 サーバーに接続できません。記録はこの端末に保存され、接続が回復すると自動で送信されます。"
+    )
+elif not settings:
     st.warning("設定画面から禁煙開始日を入力してください。")
     st.page_link("pages/4_設定.py", label="設定画面へ →", icon="⚙️")
+    finish_profile()
     st.stop()
 
-quit_date = date.fromisoformat(settings["quit_date"])
-smoke_free_days = get_smoke_free_days(quit_date)
+# 設定を一度も読めていない場合は、禁煙日数を使う表示（再スタート時の日数・マイルストーン・挑戦履歴）を省く
+smoke_free_days = get_smoke_free_days(date.fromisoformat(settings["quit_date"])) if settings else None
+
+# 各セクションは st.fragment として独立して再実行されるため、
+# あるセクションの操作で他のセクションのDB取得やグラフ生成は走らない。
+
+# ─── 衝動リスク予報 ──────────────────────────────────────────────────────────
+@st.fragment(run_every="5m")
+@_offline_safe("衝動リスク予報")
+def risk_section() -> None:
+    """これまでの記録の曜日・時間帯の傾向から、次の1時間の衝動リスクを表示する
+
+    予測の状態は衝動ログの追加時に更新済みのため、ここでは1行読むだけ。
+    """
+    forecaster = get_craving_forecaster()
+    risk = forecaster.forecast(datetime.now(_JST)) if forecaster else None
+    if risk is None:
+        return
+    if risk.level == RISK_HIGH:
+        st.warning(
+            f"⚠️ **この1時間は衝動が起きやすい時間帯です**（{risk.label}・いつもの {risk.ratio:.1f} 倍）\n\n"
+            "先に水を用意したり、下の「今すぐ衝動をかわす」を開いておきましょう。"
+        )
+    elif risk.level == RISK_MEDIUM:
+        st.info(f"🔔 この1時間はやや衝動が起きやすい時間帯です（{risk.label}）")
 
-# ─── 緊急回避モード ───────────────────────────────────────────────────────────
-with st.expander("🆘 今すぐ衝動をかわす", expanded=False):
-    st.markdown("**衝動のピークは約5分で過ぎます。一緒に乗り越えましょう！**")
-
-    st.markdown("##### ⏱️ 5分タイマー")
-    components.html("""
-    <div style="text-align:center; font-family:sans-serif;">
-      <div id="timer" style="font-size:3rem; font-weight:bold; color:#e74c3c; letter-spacing:2px;">05:00</div>
-      <div style="margin-top:8px; display:flex; gap:8px; justify-content:center;">
-        <button onclick="startTimer()" style="padding:6px 16px; font-size:1rem; border-radius:6px; border:none; background:#e74c3c; color:white; cursor:pointer;">スタート</button>
-        <button onclick="resetTimer()" style="padding:6px 16px; font-size:1rem; border-radius:6px; border:none; background:#95a5a6; color:white; cursor:pointer;">リセット</button>
-      </div>
-      <p style="color:#666; margin-top:8px; font-size:0.9rem;">「衝動のピークは5分で過ぎます。この時間を乗り切れば大丈夫！」</p>
-    </div>
-    <script>
-      let remaining = 300;
-      let interval = null;
-      function updateDisplay() {
-        const m = Math.floor(remaining / 60).toString().padStart(2, '0');
-        const s = (remaining % 60).toString().padStart(2, '0');
-        document.getElementById('timer').textContent = m + ':' + s;
-      }
-      function startTimer() {
-        if (interval) return;
-        interval = setInterval(() => {
-          remaining--;
-          updateDisplay();
-          if (remaining <= 0) {
-            clearInterval(interval);
-            interval = null;
-            document.getElementById('timer').textContent = '✅ 乗り越えました！';
-          }
-        }, 1000);
-      }
-      function resetTimer() {
-        clearInterval(interval);
-        interval = null;
-        remaining = 300;
-        updateDisplay();
-      }
-    </script>
-    """, height=160)
-
-    st.markdown("##### 🧘 深呼吸ガイド（ボックス呼吸）")
-    components.html("""
-    <div style="text-align:center; font-family:sans-serif; padding:8px 0;">
-      <div id="breath-text" style="font-size:1.6rem; font-weight:bold; color:#2980b9; min-height:2.5rem;">準備完了</div>
-      <div id="breath-bar-wrap" style="width:200px; height:12px; background:#ecf0f1; border-radius:6px; margin:10px auto;">
-        <div id="breath-bar" style="height:100%; width:0%; background:#3498db; border-radius:6px; transition:width linear;"></div>
-      </div>
-      <button onclick="startBreath()" style="padding:6px 16px; font-size:1rem; border-radius:6px; border:none; background:#2980b9; color:white; cursor:pointer; margin-top:4px;">開始</button>
-      <p style="color:#666; margin-top:6px; font-size:0.85rem;">4秒吸う → 4秒止める → 4秒吐く → 4秒止める</p>
-    </div>
-    <script>
-      const phases = [
-        {label:'吸う（4秒）', duration:4},
-        {label:'止める（4秒）', duration:4},
-        {label:'吐く（4秒）', duration:4},
-        {label:'止める（4秒）', duration:4},
-      ];
-      let running = false;
-      async function startBreath() {
-        if (running) return;
-        running = true;
-        for (let cycle = 0; cycle < 3; cycle++) {
-          for (const phase of phases) {
-            document.getElementById('breath-text').textContent = phase.label;
-            const bar = document.getElementById('breath-bar');
-            bar.style.transition = 'none';
-            bar.style.width = '0%';
-            setTimeout(() => {
-              bar.style.transition = 'width ' + phase.duration + 's linear';
-              bar.style.width = '100%';
-            }, 50);
-            await new Promise(r => setTimeout(r, phase.duration * 1000));
-          }
-        }
-        document.getElementById('breath-text').textContent = '✅ お疲れ様でした';
-        document.getElementById('breath-bar').style.width = '100%';
-        running = false;
-      }
-    </script>
-    """, height=180)
-
-    st.markdown("##### ✅ 今すぐできる行動")
-    st.markdown("""
-- 💧 冷たい水を1杯飲む
-- 🦷 歯磨きをする
-- 🚶 外を5分間歩く
-- ✉️ 未来の子どもへ手紙を書く
-- 📞 家族や友人に電話する
-- 🧊 氷を口に含む
-- 🤲 手を温かい水で洗う
-""")
 
-st.markdown("---")
+# ─── 緊急回避モード ───────────────────────────────────────────────────────────
+@st.fragment
+def emergency_section() -> None:
+    """5分タイマー・深呼吸ガイド・代替行動リスト"""
+    with st.expander("🆘 今すぐ衝動をかわす", expanded=False):
+        st.markdown("**衝動のピークは約5分で過ぎます。一緒に乗り越えましょう！**")
+
+        st.markdown("##### ⏱️ 5分タイマー")
+        emergency_timer()
+
+        st.markdown("##### 🧘 深呼吸ガイド（ボックス呼吸）")
+        breathing_guide()
+
+        st.markdown("##### ✅ 今すぐできる行動")
+        st.markdown("""
+    - 💧 冷たい水を1杯飲む
+    - 🦷 歯磨きをする
+    - 🚶 外を5分間歩く
+    - ✉️ 未来の子どもへ手紙を書く
+    - 📞 家族や友人に電話する
+    - 🧊 氷を口に含む
+    - 🤲 手を温かい水で洗う
+    """)
 
-# ─── コーピング戦略をロード ───────────────────────────────────────────────────
-coping_strategies = get_coping_strategies()
 
 # ─── 衝動ログ入力フォーム ────────────────────────────────────────────────────
-st.subheader("😤 「吸いたい」衝動を記録する")
-st.caption("衝動を記録することで、トリガーのパターンを把握できます。")
-
-# トリガー選択（コーピング戦略をリアルタイム表示するためフォーム外に配置）
-trigger_options = [
-    "食後",
-    "ストレス・イライラ",
-    "仕事の合間",
-    "お酒を飲んでいる",
-    "友人が吸っているのを見た",
-    "手持ち無沙汰",
-    "眠い・疲れた",
-    "その他",
-]
-trigger_select = st.selectbox("きっかけ（トリガー）", trigger_options)
-trigger_other = st.text_input(
-    "その他のきっかけ（「その他」を選んだ場合に入力）",
-    placeholder="例：会議のプレッシャー、コーヒーを飲んだ",
-    max_chars=50,
-)
-
-# コーピング戦略をリアルタイム表示
-_lookup_key = (trigger_other.strip() or "その他") if trigger_select == "その他" else trigger_select
-_strategy = coping_strategies.get(_lookup_key) or coping_strategies.get(trigger_select)
-if _strategy:
-    st.info(f"💡 **対処法のヒント：** {_strategy}")
-
-with st.form("craving_form", clear_on_submit=True):
-    intensity = st.slider(
-        "衝動の強さ",
-        min_value=1,
-        max_value=5,
-        value=3,
-        help="1=軽い気持ち / 5=かなり強い衝動",
-    )
-    intensity_labels = {1: "😌 ちょっとだけ", 2: "😐 やや気になる", 3: "😟 かなり気になる", 4: "😣 強い衝動", 5: "😰 我慢が限界"}
-    st.caption(intensity_labels.get(intensity, ""))
-
-    resisted = st.radio(
-        "結果",
-        options=[True, False],
-        format_func=lambda x: "💪 我慢できた" if x else "😔 吸ってしまった",
-        horizontal=True,
+@st.fragment
+def craving_form_section(smoke_free_days: Optional[int]) -> None:
+    """衝動ログの入力フォーム・トリガー別対処法・再禁煙サポート
+
+    記録はローカルジャーナルに保存するため、サーバーに接続できなくても使える。
+    """
+    # コーピング戦略をロード（接続できなければ最後に読めたもの）
+    coping_strategies, _ = _load_or_last_known("coping_strategies", get_coping_strategies)
+    coping_strategies = coping_strategies or {}
+
+    st.subheader("😤 「吸いたい」衝動を記録する")
+    st.caption("衝動を記録することで、トリガーのパターンを把握できます。")
+
+    # トリガー選択（コーピング戦略をリアルタイム表示するためフォーム外に配置）
+    trigger_options = [
+        "食後",
+        "ストレス・イライラ",
+        "仕事の合間",
+        "お酒を飲んでいる",
+        "友人が吸っているのを見た",
+        "手持ち無沙汰",
+        "眠い・疲れた",
+        "その他",
+    ]
+    trigger_select = st.selectbox("きっかけ（トリガー）", trigger_options)
+    trigger_other = st.text_input(
+        "その他のきっかけ（「その他」を選んだ場合に入力）",
+        placeholder="例：会議のプレッシャー、コーヒーを飲んだ",
+        max_chars=50,
     )
 
-    message = st.text_area(
-        "未来の子どもへひとこと（気を紛らわせましょう）",
-        placeholder="例：○○ちゃん、パパ今日も頑張ったよ。早く会いたいな。",
-        max_chars=200,
-    )
+    # コーピング戦略をリアルタイム表示
+    _lookup_key = (trigger_other.strip() or "その他") if trigger_select == "その他" else trigger_select
+    _strategy = coping_strategies.get(_lookup_key) or coping_strategies.get(trigger_select)
+    if _strategy:
+        st.info(f"💡 **対処法のヒント：** {_strategy}")
+
+    with st.form("craving_form", clear_on_submit=True):
+        intensity = st.slider(
+            "衝動の強さ",
+            min_value=1,
+            max_value=5,
+            value=3,
+            help="1=軽い気持ち / 5=かなり強い衝動",
+        )
+        intensity_labels = {1: "😌 ちょっとだけ", 2: "😐 やや気になる", 3: "😟 かなり気になる", 4: "😣 強い衝動", 5: "😰 我慢が限界"}
+        st.caption(intensity_labels.get(intensity, ""))
+
+        resisted = st.radio(
+            "結果",
+            options=[True, False],
+            format_func=lambda x: "💪 我慢できた" if x else "😔 吸ってしまった",
+            horizontal=True,
+        )
 
-    submitted = st.form_submit_button("記録する", type="primary", width='stretch')
+        message = st.text_area(
+            "未来の子どもへひとこと（気を紛らわせましょう）",
+            placeholder="例：○○ちゃん、パパ今日も頑張ったよ。早く会いたいな。",
+            max_chars=200,
+        )
 
-if submitted:
-    # 「その他」が選ばれた場合は自由入力テキストを使用
-    trigger = (trigger_other.strip() or "その他") if trigger_select == "その他" else trigger_select
-    add_craving_log(
-        intensity=intensity,
-        trigger=trigger,
-        resisted=resisted,
-        message=message,
-    )
-    if resisted:
-        st.success("💪 よく我慢しました！記録しました。")
-        st.session_state["show_restart_ui"] = False
-    else:
-        st.warning("記録しました。次は絶対に乗り越えられます！")
-        # session_stateで再スタートUIの表示フラグを立てる
-        st.session_state["show_restart_ui"] = True
-        st.session_state["restart_smoke_free_days"] = smoke_free_days
+        submitted = st.form_submit_button("記録する", type="primary", width='stretch')
+
+    if submitted:
+        # 「その他」が選ばれた場合は自由入力テキストを使用
+        trigger = (trigger_other.strip() or "その他") if trigger_select == "その他" else trigger_select
+        add_craving_log(
+            intensity=intensity,
+            trigger=trigger,
+            resisted=resisted,
+            message=message,
+        )
+        if resisted:
+            st.session_state["craving_flash"] = ("success", "💪 よく我慢しました！記録しました。")
+            st.session_state["show_restart_ui"] = False
+        else:
+            st.session_state["craving_flash"] = ("warning", "記録しました。次は絶対に乗り越えられます！")
+            # session_stateで再スタートUIの表示フラグを立てる
+            st.session_state["show_restart_ui"] = True
+            st.session_state["restart_smoke_free_days"] = smoke_free_days
+        # このセクションだけ再実行する（他のセクションの DB 読み込みを待たずに完了を表示する。
+        # 履歴は1分ごとに自動更新される）
+        st.rerun(scope="fragment")
+
+    # 記録直後のメッセージ（再実行の前に保存したもの）
+    flash = st.session_state.pop("craving_flash", None)
+    if flash:
+        kind, text = flash
+        (st.success if kind == "success" else st.warning)(text)
+
+    # 再禁煙サポート（if submitted の外で描画することでボタンが機能する）
+    if st.session_state.get("show_restart_ui"):
+        st.markdown("---")
+        restart_days = st.session_state["restart_smoke_free_days"]
+        st.info(
+            f"**吸ってしまっても失敗ではありません。** 禁煙は挑戦の連続です。\n\n"
+            + (f"あなたはここまで **{restart_days}日間** 禁煙できていました。その頑張りは本物です。\n\n"
+               if restart_days is not None else "")
+            + "また今日から一緒に頑張りましょう！"
+        )
+        if st.button("🔄 今日から再スタートする", type="primary", width='stretch'):
+            try:
+                restart_quit()
+            except CONNECTION_ERRORS:
+                st.error("📴 サーバーに接続できないため再スタートできませんでした。接続が回復してからもう一度お試しください。")
+            else:
+                st.session_state["show_restart_ui"] = False
+                st.rerun()
 
-# ─── 再禁煙サポート（if submitted の外で描画することでボタンが機能する）────
-if st.session_state.get("show_restart_ui"):
-    st.markdown("---")
-    st.info(
-        f"**吸ってしまっても失敗ではありません。** 禁煙は挑戦の連続です。\n\n"
-        f"あなたはここまで **{st.session_state['restart_smoke_free_days']}日間** 禁煙できていました。その頑張りは本物です。\n\n"
-        "また今日から一緒に頑張りましょう！"
-    )
-    if st.button("🔄 今日から再スタートする", type="primary", width='stretch'):
-        restart_quit()
-        st.session_state["show_restart_ui"] = False
-        st.rerun()
 
 # ─── 衝動ヒートマップ ────────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("🗓️ 衝動ヒートマップ（時間帯別）")
-st.caption("衝動が起きやすい時間帯・曜日のパターンを把握しましょう")
-
-logs = get_craving_logs()
-
-if len(logs) >= 3:
-    # 曜日ラベル（月〜日）
-    weekday_labels = ["月", "火", "水", "木", "金", "土", "日"]
-
-    # 時間帯×曜日の件数マトリクスを初期化
-    matrix = [[0] * 24 for _ in range(7)]
-
-    from datetime import timezone, timedelta as _td
-    _JST = timezone(_td(hours=9))
-
-    for log in logs:
-        logged_at_str = log.get("logged_at", "")
-        if not logged_at_str:
-            continue
-        try:
-            # UTCでパースしてJST（UTC+9）に変換
-            logged_at = datetime.fromisoformat(logged_at_str.replace("Z", "+00:00"))
-            logged_at = logged_at.astimezone(_JST)
-            hour = logged_at.hour
-            # 0=月曜、6=日曜（Python weekday）
-            weekday = logged_at.weekday()
-            matrix[weekday][hour] += 1
-        except (ValueError, AttributeError):
-            continue
-
-    fig_heatmap = go.Figure(
-        data=go.Heatmap(
-            z=matrix,
-            x=list(range(24)),
-            y=weekday_labels,
-            colorscale="YlOrRd",
-            hovertemplate="曜日: %{y}<br>時間: %{x}時<br>件数: %{z}件<extra></extra>",
-            showscale=True,
-            colorbar=dict(title="件数"),
+@st.fragment
+@_offline_safe("ヒートマップ")
+def heatmap_section() -> None:
+    """曜日×時間帯の衝動ヒートマップ"""
+    st.markdown("---")
+    st.subheader("🗓️ 衝動ヒートマップ（時間帯別）")
+    st.caption("衝動が起きやすい時間帯・曜日のパターンを把握しましょう")
+
+    hm_col1, hm_col2 = st.columns(2)
+    with hm_col1:
+        heatmap_range = st.radio(
+            "期間", list(HEATMAP_RANGES.keys()), index=3, horizontal=True, key="heatmap_range"
         )
+    with hm_col2:
+        heatmap_modes = {"count": "件数", "intensity": "強さの合計", "resisted": "我慢できた回数"}
+        heatmap_mode = st.radio(
+            "集計方法",
+            list(heatmap_modes.keys()),
+            format_func=lambda x: heatmap_modes[x],
+            horizontal=True,
+            key="heatmap_mode",
+        )
+
+    # 期間・我慢フィルタはクエリ側で絞り込み、必要な列だけ取得する
+    since = get_range_start(HEATMAP_RANGES[heatmap_range])
+    heatmap_logs = get_craving_logs(
+        since=since,
+        columns="logged_at,intensity,resisted",
+        resisted=True if heatmap_mode == "resisted" else None,
     )
-    fig_heatmap.update_layout(
-        xaxis=dict(
-            title="時間帯",
-            tickmode="linear",
-            tick0=0,
-            dtick=3,
-            tickvals=list(range(0, 24, 3)),
-            ticktext=[f"{h}時" for h in range(0, 24, 3)],
+
+    if len(heatmap_logs) >= 3:
+        def build() -> "go.Figure":
+            import plotly.graph_objects as go
+
+            # 曜日ラベル（月〜日）
+            weekday_labels = ["月", "火", "水", "木", "金", "土", "日"]
+
+            # 時間帯×曜日のマトリクス（JST・0=月曜）
+            matrix = build_craving_heatmap(
+                heatmap_logs,
+                weight_by_intensity=heatmap_mode == "intensity",
+                resisted_only=heatmap_mode == "resisted",
+            )
+            z_label = heatmap_modes[heatmap_mode]
+
+            fig_heatmap = go.Figure(
+                data=go.Heatmap(
+                    z=matrix,
+                    x=list(range(24)),
+                    y=weekday_labels,
+                    colorscale="YlOrRd",
+                    hovertemplate="曜日: %{y}<br>時間: %{x}時<br>" + z_label + ": %{z}<extra></extra>",
+                    showscale=True,
+                    colorbar=dict(title=z_label),
+                )
+            )
+            fig_heatmap.update_layout(
+                xaxis=dict(
+                    title="時間帯",
+                    tickmode="linear",
+                    tick0=0,
+                    dtick=3,
+                    tickvals=list(range(0, 24, 3)),
+                    ticktext=[f"{h}時" for h in range(0, 24, 3)],
+                ),
+                yaxis=dict(title="曜日"),
+                height=280,
+                margin=dict(l=10, r=10, t=10, b=10),
+                plot_bgcolor="rgba(0,0,0,0)",
+                paper_bgcolor="rgba(0,0,0,0)",
+            )
+            return fig_heatmap
+
+        # 期間・集計方法・件数・最新時刻が同じなら前回のグラフを使い回す
+        key = fingerprint(
+            since, heatmap_mode, len(heatmap_logs), max(log["logged_at"] for log in heatmap_logs)
+        )
+        fig_heatmap = cached_figure("craving_heatmap", key, build)
+        st.plotly_chart(fig_heatmap, width='stretch')
+    else:
+        st.info("選択した期間に3件以上記録するとヒートマップが表示されます。")
+
+
+# ─── 成功率・衝動の回数の推移 ──────────────────────────────────────────────────
+def _pct(rate) -> Optional[float]:
+    """割合（0〜1、NULL あり）を百分率にする"""
+    return None if rate is None else float(rate) * 100
+
+
+def _build_trend_figure(trends: list[dict]) -> "go.Figure":
+    """我慢できた割合と1日あたりの衝動の回数（7日・30日の移動平均）のグラフを組み立てる"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    dates = [row["date"] for row in trends]
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08)
+    for window, color, dash in (("7d", "#3498DB", None), ("30d", "#8E44AD", "dot")):
+        label = "7日" if window == "7d" else "30日"
+        fig.add_trace(
+            go.Scatter(
+                x=dates,
+                y=[_pct(row[f"resist_rate_{window}"]) for row in trends],
+                mode="lines",
+                line=dict(color=color, width=2, dash=dash),
+                name=f"成功率（{label}）",
+                hovertemplate="%{x}<br>" + label + "の成功率: %{y:.0f}%<extra></extra>",
+            ),
+            row=1, col=1,
+        )
+    fig.add_trace(
+        go.Bar(
+            x=dates,
+            y=[row["cravings"] for row in trends],
+            marker_color="rgba(231,76,60,0.35)",
+            name="その日の回数",
+            hovertemplate="%{x}<br>衝動: %{y}回<extra></extra>",
         ),
-        yaxis=dict(title="曜日"),
-        height=280,
+        row=2, col=1,
+    )
+    for window, color, dash in (("7d", "#E67E22", None), ("30d", "#C0392B", "dot")):
+        label = "7日" if window == "7d" else "30日"
+        fig.add_trace(
+            go.Scatter(
+                x=dates,
+                y=[float(row[f"cravings_per_day_{window}"]) for row in trends],
+                mode="lines",
+                line=dict(color=color, width=2, dash=dash),
+                name=f"1日あたり（{label}）",
+                hovertemplate="%{x}<br>" + label + "平均: %{y:.1f}回/日<extra></extra>",
+            ),
+            row=2, col=1,
+        )
+    fig.update_yaxes(title_text="成功率（%）", range=[0, 105], row=1, col=1)
+    fig.update_yaxes(title_text="衝動（回/日）", rangemode="tozero", row=2, col=1)
+    fig.update_layout(
+        height=420,
         margin=dict(l=10, r=10, t=10, b=10),
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.0, x=0),
         plot_bgcolor="rgba(0,0,0,0)",
         paper_bgcolor="rgba(0,0,0,0)",
     )
-    st.plotly_chart(fig_heatmap, width='stretch')
-else:
-    st.info("3件以上記録するとヒートマップが表示されます。")
-
-# ─── 衝動ログ一覧 ────────────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("📊 衝動ログ履歴")
+    return fig
 
-if logs:
-    # 我慢成功率の計算
-    total = len(logs)
-    resisted_count = sum(1 for l in logs if l.get("resisted"))
-    success_rate = int(resisted_count / total * 100) if total > 0 else 0
-
-    col1, col2, col3 = st.columns(3)
-    col1.metric("記録回数", f"{total} 回")
-    col2.metric("我慢成功", f"{resisted_count} 回")
-    col3.metric("成功率", f"{success_rate}%")
 
+@st.fragment
+@_offline_safe("推移グラフ")
+def trend_section() -> None:
+    """我慢できた割合と衝動の回数の7日・30日移動平均の推移"""
     st.markdown("---")
-    # 最近のログを表示（最大10件）
-    for log in logs[:10]:
-        logged_at = to_jst_str(log.get("logged_at", ""))
-        intensity_val = log.get("intensity", 0)
-        trigger_val = log.get("trigger", "")
-        resisted_val = log.get("resisted", True)
-        message_val = log.get("message", "")
-
-        result_icon = "💪" if resisted_val else "😔"
-        stars = "⭐" * intensity_val + "☆" * (5 - intensity_val)
-
-        with st.container():
-            st.markdown(
-                f"**{logged_at}** {result_icon} 強さ：{stars}  |  きっかけ：{trigger_val}"
-            )
-            if message_val:
-                st.caption(f"💌 {message_val}")
-        st.divider()
-else:
-    st.info("衝動ログはまだありません。上のフォームから記録してみましょう。")
+    st.subheader("📈 成功率と衝動の回数の推移")
+    st.caption("直近7日・30日の移動平均で、我慢できた割合と1日あたりの衝動の回数の変化を確認しましょう")
 
-# ─── マイルストーン一覧 ───────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("🏆 マイルストーン一覧")
+    trend_range = st.radio(
+        "期間", list(_TREND_RANGES.keys()), index=1, horizontal=True, key="trend_range"
+    )
+    # 移動集計は DB 側で日別に計算済みのため、取得するのは表示する日数分の行だけ
+    trends = get_craving_trends(_TREND_RANGES[trend_range])
+    if not any(row["cravings"] for row in trends):
+        st.info("選択した期間に衝動ログを記録すると推移グラフが表示されます。")
+        return
+
+    latest = trends[-1]
+    col1, col2 = st.columns(2)
+    rate_7d, rate_30d = _pct(latest["resist_rate_7d"]), _pct(latest["resist_rate_30d"])
+    col1.metric(
+        "成功率（直近7日）",
+        "—" if rate_7d is None else f"{rate_7d:.0f}%",
+        delta=None if rate_7d is None or rate_30d is None else f"{rate_7d - rate_30d:+.0f}pt（30日比）",
+    )
+    per_day_7d, per_day_30d = float(latest["cravings_per_day_7d"]), float(latest["cravings_per_day_30d"])
+    col2.metric(
+        "1日あたりの衝動（直近7日）",
+        f"{per_day_7d:.1f} 回",
+        delta=f"{per_day_7d - per_day_30d:+.1f} 回（30日比）",
+        delta_color="inverse",
+    )
 
-achieved_keys = {m.key for m in get_achieved_milestones(smoke_free_days)}
+    # 日別の行（数十行）が同じなら前回のグラフを使い回す
+    fig_trend = cached_figure("craving_trend", fingerprint(trends), lambda: _build_trend_figure(trends))
+    st.plotly_chart(fig_trend, width='stretch')
 
-for milestone in MILESTONES:
-    is_achieved = milestone.key in achieved_keys
-    if is_achieved:
-        with st.container():
-            st.success(f"{milestone.emoji} **{milestone.title}** ✅\n\n{milestone.description}")
-    else:
-        remaining = milestone.days - smoke_free_days
-        with st.container():
-            st.markdown(
-                f"🔒 **{milestone.title}** — あと{remaining}日\n\n"
-                f"<span style='color:gray'>{milestone.description}</span>",
-                unsafe_allow_html=True,
-            )
 
-# ─── 挑戦履歴 ────────────────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("🔄 挑戦履歴")
+# ─── 衝動ログ一覧 ────────────────────────────────────────────────────────────
+@st.fragment(run_every="1m")
+def history_section() -> None:
+    """衝動ログのサマリーと直近10件（記録フォームの送信後も1分以内に反映される）"""
+    st.markdown("---")
+    st.subheader("📊 衝動ログ履歴")
+
+    # サマリーは件数のみ問い合わせ、一覧は直近10件だけ取得する
+    # まだサーバーに届いていない記録（ローカルジャーナルの同期待ち）も合わせて表示する
+    pending = get_pending_writes("craving_logs")
+    try:
+        recent = get_craving_logs(limit=10)
+        synced_total = count_craving_logs()
+        synced_resisted = count_craving_logs(resisted=True)
+    except CONNECTION_ERRORS:
+        # 接続できない間は、この端末に保存された未送信の記録だけを表示する
+        recent, synced_total, synced_resisted = [], None, None
+        st.caption("📴 サーバーに接続できないため、この端末に保存された未送信の記録だけを表示しています。")
+    synced_ids = {log["id"] for log in recent}
+    pending = [log for log in pending if log["id"] not in synced_ids]  # 読み出しの間に同期された分
+
+    total = (synced_total or 0) + len(pending)
+    if total:
+        if synced_total is not None:
+            resisted_count = synced_resisted + sum(log["resisted"] for log in pending)
+            success_rate = int(resisted_count / total * 100)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("記録回数", f"{total} 回")
+            col2.metric("我慢成功", f"{resisted_count} 回")
+            col3.metric("成功率", f"{success_rate}%")
+
+        if pending:
+            st.caption(
+                f"⏳ {len(pending)} 件はまだサーバーに送信されていません（通信が回復すると自動で送信されます）"
+            )
 
-attempts = get_quit_attempts()
+        st.markdown("---")
+        # 最近のログを表示（最大10件）
+        for log in (pending + recent)[:10]:
+            logged_at = to_jst_str(log.get("logged_at", ""))
+            intensity_val = log.get("intensity", 0)
+            trigger_val = log.get("trigger", "")
+            resisted_val = log.get("resisted", True)
+            message_val = log.get("message", "")
+
+            result_icon = "💪" if resisted_val else "😔"
+            stars = "⭐" * intensity_val + "☆" * (5 - intensity_val)
+            sync_badge = "  |  ⏳ 同期待ち" if log.get("sync_status") == "pending" else ""
+
+            with st.container():
+                st.markdown(
+                    f"**{logged_at}** {result_icon} 強さ：{stars}  |  きっかけ：{trigger_val}{sync_badge}"
+                )
+                if message_val:
+                    st.caption(f"💌 {message_val}")
+            st.divider()
+    elif synced_total is not None:
+        st.info("衝動ログはまだありません。上のフォームから記録してみましょう。")
 
-if attempts:
-    total_attempts = len(attempts)
 
-    # 過去最長記録（終了済み分）
-    ended = [a for a in attempts if a.get("days_lasted") is not None]
-    max_past_days = max((a["days_lasted"] for a in ended), default=0)
+# ─── マイルストーン一覧 ───────────────────────────────────────────────────────
+@st.fragment
+@_offline_safe("マイルストーン一覧")
+def milestones_section(settings: dict, smoke_free_days: int) -> None:
+    """標準・ユーザー定義マイルストーンの達成状況"""
+    st.markdown("---")
+    st.subheader("🏆 マイルストーン一覧")
+
+    registry = build_milestone_registry(get_custom_milestones())
+    saved_money = build_savings_index(settings, get_settings_history()).total()
+
+    for kind, current in ((KIND_DAYS, smoke_free_days), (KIND_MONEY, saved_money)):
+        for milestone in registry.all(kind):
+            if current >= milestone.threshold:
+                with st.container():
+                    st.success(f"{milestone.emoji} **{milestone.title}** ✅\n\n{milestone.description}")
+            else:
+                remaining = (
+                    f"あと{milestone.days - current}日" if kind == KIND_DAYS
+                    else f"あと{format_money(milestone.amount - current)}"
+                )
+                with st.container():
+                    st.markdown(
+                        f"🔒 **{milestone.title}** — {remaining}\n\n"
+                        f"<span style='color:gray'>{milestone.description}</span>",
+                        unsafe_allow_html=True,
+                    )
 
-    col_a, col_b = st.columns(2)
-    col_a.metric("総挑戦回数", f"{total_attempts} 回")
-    col_b.metric("過去最長記録", f"{max_past_days} 日" if max_past_days > 0 else "—")
 
+# ─── 挑戦履歴 ────────────────────────────────────────────────────────────────
+@st.fragment
+@_offline_safe("挑戦履歴")
+def attempts_section(smoke_free_days: int) -> None:
+    """挑戦回数・過去最長記録・各回の継続日数"""
     st.markdown("---")
-    for i, attempt in enumerate(attempts):
-        attempt_num = i + 1
-        start = attempt["start_date"]
-        end = attempt.get("end_date")
-        days = attempt.get("days_lasted")
-
-        if end is None:
-            # 継続中
-            is_best = smoke_free_days >= max_past_days and max_past_days > 0
-            label = f"**{attempt_num}回目** — {start} 〜 継続中（{smoke_free_days}日目）"
-            st.success(label)
-            if is_best:
-                st.caption("🎉 今回で過去最長更新中！")
-        else:
-            label = f"**{attempt_num}回目** — {start} 〜 {end}（{days}日間）"
-            st.info(label)
-else:
-    st.info("挑戦履歴はまだありません。再スタート機能を使うと記録が残ります。")
+    st.subheader("🔄 挑戦履歴")
+
+    # 回数・最長記録は集計クエリで取得し、一覧は直近の挑戦だけ表示する
+    total_attempts, max_past_days = get_quit_attempt_stats()
+
+    if total_attempts:
+        col_a, col_b = st.columns(2)
+        col_a.metric("総挑戦回数", f"{total_attempts} 回")
+        col_b.metric("過去最長記録", f"{max_past_days} 日" if max_past_days > 0 else "—")
+
+        st.markdown("---")
+        attempts = get_quit_attempts(limit=_ATTEMPTS_SHOWN)
+        if total_attempts > len(attempts):
+            st.caption(f"直近{len(attempts)}回分を表示しています")
+        first_num = total_attempts - len(attempts) + 1
+        for i, attempt in enumerate(attempts):
+            attempt_num = first_num + i
+            start = attempt["start_date"]
+            end = attempt.get("end_date")
+            days = attempt.get("days_lasted")
+
+            if end is None:
+                # 継続中
+                is_best = smoke_free_days >= max_past_days and max_past_days > 0
+                label = f"**{attempt_num}回目** — {start} 〜 継続中（{smoke_free_days}日目）"
+                st.success(label)
+                if is_best:
+                    st.caption("🎉 今回で過去最長更新中！")
+            else:
+                label = f"**{attempt_num}回目** — {start} 〜 {end}（{days}日間）"
+                st.info(label)
+    else:
+        st.info("挑戦履歴はまだありません。再スタート機能を使うと記録が残ります。")
+
+
+risk_section()
+emergency_section()
+st.markdown("---")
+craving_form_section(smoke_free_days)
+heatmap_section()
+trend_section()
+history_section()
+if settings:
+    milestones_section(settings, smoke_free_days)
+    attempts_section(smoke_free_days)
+
+finish_profile()
@@ -2,18 +2,145 @@
 妊活チェックリスト画面 - デイリーチェックと生活習慣記録
 """
 from datetime import date
+from typing import TYPE_CHECKING, Optional
 
-import plotly.graph_objects as go
 import streamlit as st
 
 from utils.supabase_client import (
     get_today_fertility_log,
     upsert_fertility_log,
     get_fertility_logs,
+    get_fertility_logs_version,
+    get_craving_logs_version,
+    get_daily_craving_habits,
 )
+from utils.figure_cache import cached_figure, fingerprint
+from utils.fertility_scores import (
+    HABITS,
+    FertilityAnalytics,
+    build_fertility_analytics,
+    calc_score,
+)
+from utils.craving_analysis import (
+    FACTORS,
+    MIN_DAYS,
+    OUTCOMES,
+    CravingHabitAnalysis,
+    build_craving_habit_analysis,
+)
+from utils.profiling import finish_profile, start_profile
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go  # 実行時はグラフを組み立てるときに初めて読み込む
+
+start_profile("2_妊活チェック")  # ?profile=1 のときだけ計測する
 
 st.set_page_config(page_title="妊活チェック", page_icon="🌿", layout="centered")
 
+
+def _build_score_figure(daily) -> "go.Figure":
+    """妊活スコアと7日・30日平均のグラフを組み立てる"""
+    import plotly.graph_objects as go
+
+    chart_dates = daily.index.strftime("%Y-%m-%d")
+    chart_scores = daily["score"]
+
+    fig_score = go.Figure()
+    fig_score.add_trace(
+        go.Bar(
+            x=chart_dates,
+            y=chart_scores,
+            marker_color=[
+                "#2ECC71" if s >= 80 else "#F39C12" if s >= 50 else "#E74C3C"
+                for s in chart_scores
+            ],
+            name="スコア",
+            hovertemplate="%{x}<br>スコア: %{y}点<extra></extra>",
+        )
+    )
+    fig_score.add_trace(
+        go.Scatter(
+            x=chart_dates,
+            y=daily["score_7d"],
+            mode="lines",
+            line=dict(color="#3498DB", width=2),
+            name="7日平均",
+            hovertemplate="%{x}<br>7日平均: %{y:.1f}点<extra></extra>",
+        )
+    )
+    fig_score.add_trace(
+        go.Scatter(
+            x=chart_dates,
+            y=daily["score_30d"],
+            mode="lines",
+            line=dict(color="#8E44AD", width=2, dash="dot"),
+            name="30日平均",
+            hovertemplate="%{x}<br>30日平均: %{y:.1f}点<extra></extra>",
+        )
+    )
+    # 目標ライン
+    fig_score.add_hline(
+        y=80,
+        line_dash="dash",
+        line_color="rgba(46,204,113,0.6)",
+        annotation_text="目標 80点",
+        annotation_position="top right",
+    )
+    fig_score.update_layout(
+        xaxis_title="日付",
+        yaxis_title="スコア（点）",
+        yaxis=dict(range=[0, 105]),
+        height=280,
+        margin=dict(l=10, r=10, t=10, b=10),
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.0, x=0),
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+    )
+    return fig_score
+
+
+@st.cache_data(max_entries=4)
+def _load_analytics(version: str, today: date) -> FertilityAnalytics:
+    """妊活ログの集計結果を返す（ログの版・日付が変わったときだけ再計算）"""
+    return build_fertility_analytics(get_fertility_logs())
+
+
+@st.cache_data(max_entries=4)
+def _load_craving_habits(version: str) -> Optional[CravingHabitAnalysis]:
+    """衝動と生活習慣の分析結果を返す（衝動ログ・妊活ログの版が変わったときだけ再計算）"""
+    return build_craving_habit_analysis(get_daily_craving_habits())
+
+
+# 相関の向きを文章にするための言い回し（正の相関, 負の相関）
+_FACTOR_PHRASES = {
+    "sleep_hours": "睡眠時間が長い日ほど",
+    "stress": "ストレスが高い日ほど",
+    "exercise": "運動した日ほど",
+}
+_OUTCOME_PHRASES = {
+    "cravings": ("衝動の回数が多い", "衝動の回数が少ない"),
+    "avg_intensity": ("衝動が強い", "衝動が弱い"),
+    "resist_rate": ("我慢できた割合が高い", "我慢できた割合が低い"),
+}
+_MEANINGFUL_CORRELATION = 0.3  # 傾向として表示する相関係数の絶対値の下限
+
+
+def _habit_table(summary, label: str):
+    """区分別の集計を表示用の表にする"""
+    table = summary.reset_index()
+    table.columns = [label, *table.columns[1:]]
+    table["resist_pct"] = (table["resist_rate"] * 100).round()
+    return table[[label, "days", "cravings_per_day", "resist_pct"]]
+
+
+_HABIT_TABLE_COLUMNS = {
+    "days": st.column_config.NumberColumn("日数"),
+    "cravings_per_day": st.column_config.NumberColumn("1日の衝動", format="%.1f 回"),
+    "resist_pct": st.column_config.ProgressColumn("我慢できた割合", format="%d%%", min_value=0, max_value=100),
+}
+
+
 st.title("🌿 妊活チェックリスト")
 st.caption("精子の質を高めるための日々の習慣を記録しましょう")
 
@@ -98,18 +225,14 @@ if submitted:
     )
     st.success("✅ 今日の記録を保存しました！")
 
-    # スコアを簡易計算して表示
-    score = 0
-    if zinc:
-        score += 25
-    if folate:
-        score += 25
-    if exercise:
-        score += 25
-    if 6.0 <= sleep_hours <= 9.0:
-        score += 15
-    if stress <= 2:
-        score += 10
+    # スコアを計算して表示（グラフと同じ計算ロジック）
+    score = calc_score({
+        "zinc": zinc,
+        "folate": folate,
+        "exercise": exercise,
+        "sleep_hours": sleep_hours,
+        "stress": stress,
+    })
 
     if score >= 80:
         st.balloons()
@@ -119,6 +242,18 @@ if submitted:
     else:
         st.warning(f"💡 本日の妊活スコア：{score}点 — もう少し頑張りましょう！")
 
+logs_version = get_fertility_logs_version()
+analytics = _load_analytics(logs_version, date.today())
+
+if submitted:
+    _streak_texts = [
+        f"{label} {analytics.current_streaks[key]}日連続"
+        for key, label in HABITS.items()
+        if analytics.current_streaks[key] >= 2
+    ]
+    if _streak_texts:
+        st.caption("🔥 " + " / ".join(_streak_texts))
+
 # ─── 栄養素の解説 ────────────────────────────────────────────────────────────
 st.markdown("---")
 with st.expander("💡 精子の質を高める栄養素・習慣について"):
@@ -132,91 +267,92 @@ with st.expander("💡 精子の質を高める栄養素・習慣について"):
 | 😌 **ストレス管理** | 高ストレスはコルチゾールを増加させ精子質を低下 | 瞑想・深呼吸・趣味の時間 |
     """)
 
-def _calc_score(log: dict) -> int:
-    """妊活ログのスコアを計算する（0〜100点）"""
-    score = 0
-    if log.get("zinc"):
-        score += 25
-    if log.get("folate"):
-        score += 25
-    if log.get("exercise"):
-        score += 25
-    sleep = log.get("sleep_hours") or 0
-    if 6.0 <= float(sleep) <= 9.0:
-        score += 15
-    stress = log.get("stress") or 3
-    if int(stress) <= 2:
-        score += 10
-    return score
-
-
 # ─── 生活習慣スコア推移グラフ ────────────────────────────────────────────────
 st.markdown("---")
 st.subheader("📈 生活習慣スコアの推移")
-st.caption("日々の妊活スコア（0〜100点）の変化を確認しましょう")
-
-logs = get_fertility_logs()
-if len(logs) >= 2:
-    # 古い順に並べ替え
-    sorted_logs = sorted(logs, key=lambda x: x.get("date", ""))
-    chart_dates = [log.get("date", "") for log in sorted_logs]
-    chart_scores = [_calc_score(log) for log in sorted_logs]
+st.caption("日々の妊活スコア（0〜100点）と7日・30日の平均の変化を確認しましょう")
 
-    fig_score = go.Figure()
-    fig_score.add_trace(
-        go.Bar(
-            x=chart_dates,
-            y=chart_scores,
-            marker_color=[
-                "#2ECC71" if s >= 80 else "#F39C12" if s >= 50 else "#E74C3C"
-                for s in chart_scores
-            ],
-            hovertemplate="%{x}<br>スコア: %{y}点<extra></extra>",
-        )
-    )
-    # 目標ライン
-    fig_score.add_hline(
-        y=80,
-        line_dash="dash",
-        line_color="rgba(46,204,113,0.6)",
-        annotation_text="目標 80点",
-        annotation_position="top right",
-    )
-    fig_score.update_layout(
-        xaxis_title="日付",
-        yaxis_title="スコア（点）",
-        yaxis=dict(range=[0, 105]),
-        height=280,
-        margin=dict(l=10, r=10, t=10, b=10),
-        showlegend=False,
-        plot_bgcolor="rgba(0,0,0,0)",
-        paper_bgcolor="rgba(0,0,0,0)",
+daily = analytics.daily
+if len(daily) >= 2:
+    # 妊活ログが変わっていなければ前回のグラフを使い回す
+    fig_score = cached_figure(
+        "fertility_score", fingerprint(logs_version, date.today()), lambda: _build_score_figure(daily)
     )
     st.plotly_chart(fig_score, width='stretch')
+
+    # 習慣ごとの連続日数
+    streak_cols = st.columns(len(HABITS))
+    for col, (key, label) in zip(streak_cols, HABITS.items()):
+        col.metric(
+            f"{label}の連続",
+            f"{analytics.current_streaks[key]}日",
+            help=f"最長記録：{analytics.longest_streaks[key]}日",
+        )
 else:
     st.info("2日以上記録するとグラフが表示されます。")
 
+# ─── 生活習慣と衝動の関係 ────────────────────────────────────────────────────
+st.markdown("---")
+st.subheader("🔍 生活習慣と衝動の関係")
+st.caption("睡眠やストレスの多い日に「吸いたい」衝動が増えるかを、記録した日ごとに比べます")
+
+habits_analysis = _load_craving_habits(f"{get_craving_logs_version()}|{logs_version}")
+if habits_analysis is None:
+    st.info(f"妊活チェックを{MIN_DAYS}日以上記録すると、衝動ログとの関係が表示されます。")
+else:
+    if habits_analysis.strongest and abs(habits_analysis.strongest[2]) >= _MEANINGFUL_CORRELATION:
+        factor, outcome, corr = habits_analysis.strongest
+        positive, negative = _OUTCOME_PHRASES[outcome]
+        st.info(
+            f"💡 {_FACTOR_PHRASES[factor]}{positive if corr > 0 else negative}傾向があります"
+            f"（順位相関 {corr:+.2f}・{habits_analysis.days}日分）"
+        )
+    else:
+        st.caption(f"{habits_analysis.days}日分の記録では、はっきりした傾向はまだ見られません。")
+
+    stress_col, sleep_col = st.columns(2)
+    with stress_col:
+        st.markdown("**ストレスレベル別**")
+        st.dataframe(
+            _habit_table(habits_analysis.by_stress, "ストレス"),
+            column_config=_HABIT_TABLE_COLUMNS,
+            width='stretch',
+            hide_index=True,
+        )
+    with sleep_col:
+        st.markdown("**睡眠時間別**")
+        st.dataframe(
+            _habit_table(habits_analysis.by_sleep, "睡眠"),
+            column_config=_HABIT_TABLE_COLUMNS,
+            width='stretch',
+            hide_index=True,
+        )
+
+    with st.expander("相関係数の一覧（Spearman の順位相関）"):
+        st.dataframe(
+            habits_analysis.correlations.rename(index=FACTORS, columns=OUTCOMES).round(2),
+            width='stretch',
+        )
+        st.caption("1 に近いほど「多いほど多い」、-1 に近いほど「多いほど少ない」関係です。運動は した=1・しない=0 として計算しています。")
+
 # ─── 記録履歴 ────────────────────────────────────────────────────────────────
 st.markdown("---")
 st.subheader("📋 直近の記録（最大7日間）")
 
-if logs:
-    recent_logs = logs[:7]
+if len(daily):
+    recent = daily.iloc[::-1].head(7).reset_index()
+    # 欠損値（NaN）は未記録として None に揃える
+    recent_logs = recent.astype(object).where(recent.notna(), None).to_dict("records")
     for log in recent_logs:
-        log_date_str = log.get("date", "")
-        try:
-            log_date = date.fromisoformat(log_date_str)
-            date_label = log_date.strftime("%m/%d（%a）").replace(
-                "Mon", "月").replace("Tue", "火").replace("Wed", "水").replace(
-                "Thu", "木").replace("Fri", "金").replace("Sat", "土").replace("Sun", "日")
-        except ValueError:
-            date_label = log_date_str
+        date_label = log["date"].strftime("%m/%d（%a）").replace(
+            "Mon", "月").replace("Tue", "火").replace("Wed", "水").replace(
+            "Thu", "木").replace("Fri", "金").replace("Sat", "土").replace("Sun", "日")
 
         zinc_icon = "✅" if log.get("zinc") else "⬜"
         folate_icon = "✅" if log.get("folate") else "⬜"
         exercise_icon = "✅" if log.get("exercise") else "⬜"
         sleep = log.get("sleep_hours") or "-"
-        stress_val = log.get("stress") or "-"
+        stress_val = int(log["stress"]) if log.get("stress") else "-"
 
         st.markdown(
             f"**{date_label}** | 亜鉛{zinc_icon} 葉酸{folate_icon} 運動{exercise_icon} "
@@ -226,3 +362,5 @@ if logs:
             st.caption(f"  📝 {log['notes']}")
 else:
     st.info("記録はまだありません。上のフォームから入力してみましょう。")
+
+finish_profile()
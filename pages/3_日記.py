@@ -3,20 +3,27 @@
 """
 import streamlit as st
 
-from utils.supabase_client import add_diary_entry, get_diary_entries
+from utils.supabase_client import add_diary_entry, get_diary_page, get_pending_writes
+from utils.profiling import finish_profile, start_profile
+
+start_profile("3_日記")  # ?profile=1 のときだけ計測する
 
 st.set_page_config(page_title="日記", page_icon="💌", layout="centered")
 
+_PAGE_SIZE = 20  # 1ページに表示するメッセージ数
+
+mood_options = {
+    "happy": "😄 うれしい・前向き",
+    "neutral": "😐 普通・まあまあ",
+    "tough": "😔 つらい・しんどい",
+}
+mood_icons = {"happy": "😄", "neutral": "😐", "tough": "😔"}
+
 st.title("💌 未来の子どもへのメッセージ")
 st.caption("禁煙を頑張るあなたの気持ちを、未来の赤ちゃんへ残しておきましょう")
 
 # ─── メッセージ投稿フォーム ───────────────────────────────────────────────────
 with st.form("diary_form", clear_on_submit=True):
-    mood_options = {
-        "happy": "😄 うれしい・前向き",
-        "neutral": "😐 普通・まあまあ",
-        "tough": "😔 つらい・しんどい",
-    }
     mood = st.radio(
         "今日の気分",
         options=list(mood_options.keys()),
@@ -41,28 +48,87 @@ with st.form("diary_form", clear_on_submit=True):
 if submitted:
     if message.strip():
         add_diary_entry(message=message.strip(), mood=mood)
+        st.session_state["diary_cursors"] = [None]  # 新しいメッセージが見えるよう先頭ページへ
         st.success("💌 メッセージを保存しました！")
         st.balloons()
     else:
         st.warning("メッセージを入力してください。")
 
 # ─── メッセージ一覧 ──────────────────────────────────────────────────────────
-st.markdown("---")
-st.subheader("📖 これまでのメッセージ")
-
-entries = get_diary_entries()
-if entries:
-    mood_icons = {"happy": "😄", "neutral": "😐", "tough": "😔"}
-    for entry in entries:
-        entry_date = entry.get("date", "")
-        mood_val = entry.get("mood", "neutral")
-        message_val = entry.get("message", "")
-
-        mood_icon = mood_icons.get(mood_val, "😐")
-
-        with st.container():
-            st.markdown(f"**{entry_date}** {mood_icon}")
-            st.markdown(f"> {message_val}")
-        st.divider()
-else:
-    st.info("メッセージはまだありません。上のフォームから最初のメッセージを書いてみましょう！")
+@st.fragment
+def diary_list_section() -> None:
+    """メッセージ一覧（検索・気分の絞り込み・ページ送り）"""
+    st.markdown("---")
+    st.subheader("📖 これまでのメッセージ")
+
+    search_col, mood_col = st.columns([3, 2])
+    with search_col:
+        query = st.text_input("🔍 メッセージを検索", placeholder="キーワード", key="diary_query")
+    with mood_col:
+        moods = st.multiselect(
+            "気分で絞り込み",
+            options=list(mood_options.keys()),
+            format_func=lambda x: mood_options[x],
+            key="diary_moods",
+        )
+
+    # 検索条件が変わったら先頭ページに戻す
+    # diary_cursors はこれまでに開いたページのカーソル（戻る用のスタック）
+    filters = (query.strip(), tuple(moods))
+    if st.session_state.get("diary_filters") != filters:
+        st.session_state["diary_filters"] = filters
+        st.session_state["diary_cursors"] = [None]
+    cursors = st.session_state["diary_cursors"]
+
+    entries, next_cursor = get_diary_page(
+        limit=_PAGE_SIZE,
+        cursor=cursors[-1],
+        query=query,
+        moods=moods or None,
+    )
+
+    # 先頭ページには、まだサーバーに届いていないメッセージ（同期待ち）も載せる
+    if cursors[-1] is None:
+        synced_ids = {entry["id"] for entry in entries}
+        pending = [
+            entry for entry in get_pending_writes("diary_entries")
+            if entry["id"] not in synced_ids
+            and (not moods or entry.get("mood") in moods)
+            and query.strip().lower() in entry.get("message", "").lower()
+        ]
+        entries = pending + entries
+
+    if entries:
+        for entry in entries:
+            entry_date = entry.get("date", "")
+            mood_icon = mood_icons.get(entry.get("mood", "neutral"), "😐")
+            message_val = entry.get("message", "")
+
+            sync_badge = "  ⏳ 同期待ち" if entry.get("sync_status") == "pending" else ""
+
+            with st.container():
+                st.markdown(f"**{entry_date}** {mood_icon}{sync_badge}")
+                st.markdown(f"> {message_val}")
+            st.divider()
+    elif any(filters):
+        st.info("条件に合うメッセージは見つかりませんでした。")
+    else:
+        st.info("メッセージはまだありません。上のフォームから最初のメッセージを書いてみましょう！")
+
+    prev_col, page_col, next_col = st.columns([1, 1, 1])
+    with prev_col:
+        if len(cursors) > 1 and st.button("◀ 新しいメッセージ", width='stretch'):
+            cursors.pop()
+            st.rerun(scope="fragment")
+    with page_col:
+        if len(cursors) > 1 or next_cursor:
+            st.caption(f"{len(cursors)}ページ目")
+    with next_col:
+        if next_cursor and st.button("古いメッセージ ▶", width='stretch'):
+            cursors.append(next_cursor)
+            st.rerun(scope="fragment")
+
+
+diary_list_section()
+
+finish_profile()
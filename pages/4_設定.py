@@ -1,6 +1,7 @@
 """
 設定画面 - 禁煙開始日・タバコ情報の入力
 """
+import uuid
 from datetime import date
 
 import streamlit as st
@@ -10,8 +11,17 @@ from utils.supabase_client import (
     upsert_user_settings,
     get_coping_strategies,
     upsert_coping_strategy,
+    get_custom_milestones,
+    add_custom_milestone,
+    delete_custom_milestone,
+    get_recent_outbox,
 )
+from utils.calculations import to_jst_str
+from utils.milestones import KIND_DAYS, KIND_MONEY
 from utils.discord_notifier import is_discord_configured, send_test_message
+from utils.profiling import finish_profile, start_profile
+
+start_profile("4_設定")  # ?profile=1 のときだけ計測する
 
 st.set_page_config(page_title="設定", page_icon="⚙️", layout="centered")
 
@@ -101,27 +111,31 @@ st.subheader("🔔 Discord通知設定")
 if is_discord_configured():
     st.success("✅ Discord Webhookが設定されています")
 
-    # 通知ON/OFFのsession_state管理
-    if "discord_notify_enabled" not in st.session_state:
-        st.session_state["discord_notify_enabled"] = True
-
-    notify_enabled = st.toggle(
-        "通知を有効にする",
-        value=st.session_state["discord_notify_enabled"],
-        key="discord_toggle",
+    st.caption(
+        "マイルストーン達成時・妊活チェック未入力時の通知は、"
+        "通知ワーカー（`python worker.py`）が画面とは別に送信します。"
     )
-    st.session_state["discord_notify_enabled"] = notify_enabled
-
-    if notify_enabled:
-        st.caption("マイルストーン達成時・妊活チェック未入力時にDiscordへ通知します。")
-        if st.button("📨 テストメッセージを送信", width='stretch'):
-            success = send_test_message()
-            if success:
-                st.success("✅ Discordにテストメッセージを送信しました！")
-            else:
-                st.error("❌ 送信に失敗しました。Webhook URLを確認してください。")
-    else:
-        st.caption("通知は無効になっています。")
+    if st.button("📨 テストメッセージを送信", width='stretch'):
+        result = send_test_message()
+        if result:
+            st.success("✅ Discordにテストメッセージを送信しました！")
+        elif result.rate_limited:
+            st.warning(
+                f"⏳ Discord の送信回数の制限に達しています。{max(result.retry_after, 1):.0f}秒ほど待ってからもう一度お試しください。"
+            )
+        else:
+            st.error(f"❌ 送信に失敗しました（{result.error}）。Webhook URLを確認してください。")
+
+    _outbox = get_recent_outbox()
+    if _outbox:
+        with st.expander("📬 最近の通知の送信状況"):
+            _status_icons = {"sent": "✅", "pending": "⏳", "sending": "📤", "failed": "❌"}
+            for _row in _outbox:
+                _icon = _status_icons.get(_row["status"], "❔")
+                _title = (_row.get("payload") or {}).get("title") or _row["idempotency_key"]
+                _when = to_jst_str(_row.get("sent_at") or _row["created_at"])
+                _error = f"（{_row['last_error']}）" if _row.get("last_error") else ""
+                st.caption(f"{_icon} {_when} {_title} — 試行 {_row['attempts']} 回{_error}")
 else:
     st.info(
         "Discord通知を利用するには、以下の手順でWebhook URLを設定してください：\n\n"
@@ -167,6 +181,61 @@ if st.button("対処法を保存する", type="primary", width='stretch'):
             _saved += 1
     st.success(f"✅ 対処法を保存しました！（{_saved}件）")
 
+# ─── オリジナルマイルストーン ────────────────────────────────────────────────
+st.markdown("---")
+st.subheader("🎖️ オリジナルマイルストーン")
+st.caption("「禁煙100日」「赤ちゃん貯金 ¥100,000」など、自分だけの目標を追加できます。")
+
+with st.form("custom_milestone_form", clear_on_submit=True):
+    _kind_labels = {KIND_DAYS: "📅 禁煙日数", KIND_MONEY: "💰 節約金額"}
+    ms_kind = st.radio(
+        "種類",
+        options=list(_kind_labels.keys()),
+        format_func=lambda x: _kind_labels[x],
+        horizontal=True,
+    )
+    ms_threshold = st.number_input(
+        "達成条件（日数 または 金額・円）",
+        min_value=1,
+        max_value=10_000_000,
+        value=100,
+        step=1,
+    )
+    ms_col1, ms_col2 = st.columns([1, 4])
+    with ms_col1:
+        ms_emoji = st.text_input("アイコン", value="🎖️", max_chars=4)
+    with ms_col2:
+        ms_title = st.text_input("タイトル", placeholder="例：赤ちゃん貯金10万円達成！", max_chars=50)
+    ms_description = st.text_input(
+        "説明（任意）",
+        placeholder="例：ベビーカーが買える金額になりました！",
+        max_chars=200,
+    )
+    ms_submitted = st.form_submit_button("マイルストーンを追加する", width='stretch')
+
+if ms_submitted:
+    if ms_title.strip():
+        add_custom_milestone(
+            # 同じ達成条件のマイルストーンを複数登録しても上書きされないよう、キーは毎回新しく振る
+            milestone_key=f"custom_{ms_kind}_{uuid.uuid4().hex[:12]}",
+            kind=ms_kind,
+            threshold=int(ms_threshold),
+            title=ms_title.strip(),
+            description=ms_description.strip(),
+            emoji=ms_emoji.strip() or "🎖️",
+        )
+        st.success("✅ マイルストーンを追加しました！")
+    else:
+        st.warning("タイトルを入力してください。")
+
+for _row in get_custom_milestones():
+    _unit = f"{_row['threshold']}日" if _row["kind"] == KIND_DAYS else f"¥{_row['threshold']:,}"
+    _col_text, _col_btn = st.columns([5, 1])
+    _col_text.write(f"{_row.get('emoji') or '🎖️'} **{_row['title']}** — {_unit}")
+    if _col_btn.button("削除", key=f"delete_{_row['milestone_key']}"):
+        delete_custom_milestone(_row["milestone_key"])
+        st.rerun()
+
 # ─── アプリ情報 ──────────────────────────────────────────────────────────────
 st.markdown("---")
 st.subheader("ℹ️ このアプリについて")
@@ -182,3 +251,5 @@ st.markdown("""
 - 💌 日記：未来の子どもへのメッセージ
 - 👫 パートナー共有：進捗をパートナーと共有
 """)
+
+finish_profile()
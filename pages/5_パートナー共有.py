@@ -1,11 +1,10 @@
 """
 パートナー共有画面 - 共有コード生成・双方向メッセージ
 """
-import os
-
 import streamlit as st
 
 from utils.calculations import to_jst_str
+from utils.env import get_env
 from utils.supabase_client import (
     get_partner_share,
     create_partner_share,
@@ -13,6 +12,9 @@ from utils.supabase_client import (
     add_partner_message,
     get_partner_messages,
 )
+from utils.profiling import finish_profile, start_profile
+
+start_profile("5_パートナー共有")  # ?profile=1 のときだけ計測する
 
 st.set_page_config(page_title="パートナー共有", page_icon="👫", layout="centered")
 
@@ -20,7 +22,7 @@ st.title("👫 パートナー共有")
 st.caption("禁煙の進捗をパートナーと共有しましょう")
 
 # ─── 共有URLのベース取得 ────────────────────────────────────────────────────
-app_url = os.environ.get("APP_URL", "").rstrip("/")
+app_url = (get_env("APP_URL") or "").rstrip("/")
 
 # ─── 現在の共有状態を取得 ───────────────────────────────────────────────────
 share = get_partner_share()
@@ -58,9 +60,10 @@ else:
         st.rerun()
 
 # ─── メッセージ送受信 ───────────────────────────────────────────────────────
-if share:
-    share_code = share["share_code"]
-
+# メッセージの送信ではこのセクションだけを再実行する（共有設定の再取得は不要）
+@st.fragment
+def messages_section(share_code: str) -> None:
+    """パートナーとのメッセージ送信・履歴"""
     st.markdown("---")
     st.subheader("💬 パートナーへのメッセージ")
 
@@ -75,10 +78,12 @@ if share:
 
     if send_btn and message_text.strip():
         add_partner_message(share_code, "user", message_text.strip())
-        st.success("✅ メッセージを送信しました！")
-        st.rerun()
+        st.session_state["message_sent"] = True
+        st.rerun(scope="fragment")
     elif send_btn:
         st.warning("メッセージを入力してください。")
+    if st.session_state.pop("message_sent", False):
+        st.success("✅ メッセージを送信しました！")
 
     # メッセージ一覧
     messages = get_partner_messages(share_code)
@@ -98,6 +103,10 @@ if share:
     else:
         st.info("まだメッセージはありません。最初のメッセージを送りましょう！")
 
+
+if share:
+    messages_section(share["share_code"])
+
 # ─── 使い方説明 ──────────────────────────────────────────────────────────────
 st.markdown("---")
 with st.expander("📖 使い方"):
@@ -114,3 +123,5 @@ with st.expander("📖 使い方"):
 - 共有を停止すると新しいコードが必要になります
 - パートナーは閲覧と応援メッセージ送信のみ可能です（データの変更はできません）
 """)
+
+finish_profile()
@@ -0,0 +1,52 @@
+"""
+プロファイル画面 - 保存した実行プロファイルの確認（開発用）
+"""
+import streamlit as st
+
+from utils.profiling import list_reports, load_report, profile_dir
+
+st.set_page_config(page_title="プロファイル", page_icon="⏱️", layout="wide")
+
+st.title("⏱️ 実行プロファイル")
+st.caption(
+    "URL に `?profile=1` を付けて開くか、環境変数 `APP_PROFILE=1` で起動すると、"
+    f"画面の1回の実行を計測したレポートが `{profile_dir()}` に保存されます。"
+)
+
+reports = list_reports()
+if not reports:
+    st.info("レポートはまだありません。")
+    st.stop()
+
+selected = st.selectbox("レポート", reports, format_func=lambda p: p.stem)
+report = load_report(selected)
+
+col1, col2, col3 = st.columns(3)
+col1.metric("実行時間", f"{report['wall_seconds'] * 1000:.0f} ms")
+col2.metric("関数の実行時間の合計", f"{report['profiled_seconds'] * 1000:.0f} ms")
+col3.metric("メモリのピーク", f"{report['peak_memory_kb'] / 1024:.1f} MB")
+
+# ─── 時間の内訳 ──────────────────────────────────────────────────────────────
+st.subheader("🧩 時間の内訳（関数自身の実行時間）")
+st.bar_chart(
+    {"秒": report["breakdown"]},
+    horizontal=True,
+)
+
+# ─── 関数・メモリ ────────────────────────────────────────────────────────────
+st.subheader("🔥 自身の実行時間が長い関数")
+st.dataframe(report["functions"], width='stretch', hide_index=True)
+
+st.subheader("🧠 実行中に増えたメモリ")
+st.dataframe(report["allocations"], width='stretch', hide_index=True)
+
+with st.expander("cProfile の出力（累積時間順）"):
+    st.code(report["stats_text"], language="text")
+
+prof_path = selected.with_suffix(".prof")
+if prof_path.exists():
+    st.download_button(
+        "📥 .prof をダウンロード（snakeviz などで開けます）",
+        data=prof_path.read_bytes(),
+        file_name=prof_path.name,
+    )
@@ -0,0 +1,152 @@
+"""
+データ管理画面 - 全データのエクスポート・過去の記録の一括インポート
+"""
+from pathlib import Path
+
+import streamlit as st
+
+from utils.data_export import (
+    EXPORT_TABLES,
+    FORMATS,
+    default_export_dir,
+    export_all,
+    prune_exports,
+    zip_export,
+)
+from utils.data_import import IMPORT_TABLES, detect_format, import_records, read_records
+from utils.env import get_env
+from utils.profiling import finish_profile, start_profile
+
+start_profile("7_データ管理")  # ?profile=1 のときだけ計測する
+
+st.set_page_config(page_title="データ管理", page_icon="🗂️", layout="centered")
+
+st.title("🗂️ データ管理")
+
+# ─── エクスポート ────────────────────────────────────────────────────────────
+st.subheader("📤 全データのエクスポート")
+st.caption(
+    "すべての記録（衝動ログ・妊活チェック・日記・設定など）を Parquet と CSV に書き出し、"
+    "件数とチェックサムを記録した manifest.json と一緒に zip でダウンロードできます。"
+)
+
+formats = st.multiselect(
+    "出力形式",
+    options=list(FORMATS),
+    default=list(FORMATS),
+    format_func=lambda x: {"parquet": "Parquet（分析ツール向け）", "csv": "CSV（Excel 向け）"}[x],
+)
+
+if st.button("エクスポートを作成", type="primary", width='stretch', disabled=not formats):
+    export_base = Path(get_env("EXPORT_DIR") or "exports")
+    out_dir = default_export_dir(export_base)
+    progress_bar = st.progress(0.0, text="書き出しています…")
+    done_tables: list[str] = []
+
+    def on_progress(table_name: str, rows: int) -> None:
+        if table_name not in done_tables:
+            done_tables.append(table_name)
+        progress_bar.progress(
+            len(done_tables) / len(EXPORT_TABLES),
+            text=f"{table_name}：{rows:,} 行",
+        )
+
+    manifest = export_all(out_dir, formats=formats, progress=on_progress)
+    progress_bar.empty()
+    # ダウンロードには zip だけを使うため、ディレクトリは消して古いエクスポートも整理する
+    st.session_state["export_result"] = (str(zip_export(out_dir, remove_dir=True)), manifest)
+    prune_exports(export_base)
+
+result = st.session_state.get("export_result")
+if result:
+    zip_path, manifest = Path(result[0]), result[1]
+    st.success(f"✅ {manifest['exported_at']} 時点のデータを書き出しました。")
+    st.dataframe(
+        [
+            {"テーブル": name, "行数": info["rows"],
+             **{fmt: info["files"][fmt]["sha256"][:12] for fmt in info["files"]}}
+            for name, info in manifest["tables"].items()
+        ],
+        width='stretch',
+        hide_index=True,
+    )
+    if zip_path.exists():
+        with zip_path.open("rb") as f:
+            st.download_button(
+                "📥 zip をダウンロード",
+                data=f,
+                file_name=zip_path.name,
+                mime="application/zip",
+                width='stretch',
+            )
+
+st.caption("コマンドラインからは `python export_data.py` で同じ内容を書き出せます。")
+
+# ─── インポート ──────────────────────────────────────────────────────────────
+st.markdown("---")
+st.subheader("📥 過去の記録のインポート")
+st.caption(
+    "他のアプリから移行する場合などに、CSV・JSON の記録をまとめて取り込めます。"
+    "1行目（JSON はキー）に列名が必要です。"
+)
+
+_table_labels = {"craving_logs": "衝動ログ", "fertility_logs": "妊活チェック"}
+import_table = st.radio(
+    "取り込み先",
+    options=list(IMPORT_TABLES),
+    format_func=lambda x: _table_labels[x],
+    horizontal=True,
+)
+st.caption("列：" + "・".join(f"`{c}`" for c in IMPORT_TABLES[import_table]))
+uploaded = st.file_uploader("ファイル", type=["csv", "json", "jsonl"])
+overwrite = False
+if import_table == "fertility_logs":
+    overwrite = st.checkbox("同じ日付の記録がある場合は上書きする", value=False)
+
+check_col, run_col = st.columns(2)
+with check_col:
+    check_clicked = st.button("検証する", width='stretch', disabled=uploaded is None)
+with run_col:
+    run_clicked = st.button("取り込む", type="primary", width='stretch', disabled=uploaded is None)
+
+if uploaded is not None and (check_clicked or run_clicked):
+    progress_bar = st.progress(0.0, text="読み込んでいます…")
+
+    def on_import_progress(read: int, written: int) -> None:
+        progress_bar.progress(
+            min(uploaded.tell() / max(uploaded.size, 1), 1.0),
+            text=f"{read:,} 行を読み込み・{written:,} 行を書き込みました",
+        )
+
+    uploaded.seek(0)
+    report = import_records(
+        read_records(uploaded, detect_format(uploaded.name)),
+        import_table,
+        overwrite=overwrite,
+        dry_run=check_clicked,
+        progress=on_import_progress,
+    )
+    progress_bar.empty()
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("読み込み", f"{report.read:,} 行")
+    col2.metric("正常", f"{report.valid:,} 行")
+    col3.metric("書き込み", f"{report.written:,} 行")
+    col4.metric("エラー", f"{report.error_count:,} 行")
+    if report.dry_run:
+        st.info("検証のみ行いました（まだ書き込んでいません）。")
+    else:
+        st.success(f"✅ {report.written:,} 行を取り込みました。")
+        if report.skipped:
+            st.caption(f"既に同じ記録があった {report.skipped:,} 行は読み飛ばしました。")
+    if report.errors:
+        with st.expander(f"⚠️ エラーの内容（{report.error_count:,} 行）"):
+            st.dataframe(
+                [{"行": line, "内容": message} for line, message in report.errors],
+                width='stretch',
+                hide_index=True,
+            )
+
+st.caption("コマンドラインからは `python import_data.py <ファイル> --table craving_logs` で取り込めます。")
+
+finish_profile()
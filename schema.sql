@@ -134,3 +134,206 @@ CREATE TABLE IF NOT EXISTS smoke.coping_strategies (
     strategy TEXT NOT NULL,               -- 対処法
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+
+-- ============================================
+-- 本数・価格の変更履歴テーブル（節約金額の区分計算用）
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS smoke.settings_history (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    effective_from DATE NOT NULL UNIQUE,   -- この設定の適用開始日
+    cigarettes_per_day INTEGER NOT NULL,   -- 1日の本数
+    price_per_pack INTEGER NOT NULL,       -- 1箱の価格（円）
+    cigarettes_per_pack INTEGER DEFAULT 20, -- 1箱の本数
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 既存環境の移行：現在の設定を禁煙開始日からの履歴として登録
+INSERT INTO smoke.settings_history (effective_from, cigarettes_per_day, price_per_pack, cigarettes_per_pack)
+SELECT quit_date, cigarettes_per_day, price_per_pack, cigarettes_per_pack
+FROM smoke.user_settings
+ON CONFLICT (effective_from) DO NOTHING;
+
+-- ============================================
+-- ユーザー定義マイルストーンテーブル
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS smoke.custom_milestones (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    milestone_key TEXT NOT NULL UNIQUE,    -- マイルストーン識別キー（custom_ で始まる）
+    kind TEXT NOT NULL DEFAULT 'days' CHECK (kind IN ('days', 'money')), -- 日数型 / 金額型
+    threshold INTEGER NOT NULL CHECK (threshold > 0), -- 達成に必要な日数または金額（円）
+    title TEXT NOT NULL,                   -- タイトル
+    description TEXT,                      -- 詳細説明
+    emoji TEXT DEFAULT '🎖️',               -- アイコン
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- ============================================
+-- 通知アウトボックス（Discord通知の重複送信防止）
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS smoke.notification_outbox (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,  -- 重複防止キー（例：reminder:2026-10-17, milestone:day_30）
+    kind TEXT NOT NULL,                    -- 通知種別（reminder / milestone / craving_risk）
+    payload JSONB NOT NULL DEFAULT '{}',   -- Discord埋め込みの内容（title, description）
+    status TEXT NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'sending', 'sent', 'failed')), -- 送信状態
+    attempts INTEGER NOT NULL DEFAULT 0,   -- 送信試行回数
+    last_error TEXT,                       -- 最後のエラー内容
+    claimed_at TIMESTAMPTZ,                -- 送信中として確保した日時
+    lease_until TIMESTAMPTZ,               -- 確保の期限（過ぎても sending のままなら送信待ちに戻す）
+    sent_at TIMESTAMPTZ,                   -- 送信完了日時
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS notification_outbox_status_idx
+    ON smoke.notification_outbox (status, created_at);
+
+-- 既存環境の移行：確保の期限の列を追加し、送信中のままの通知には従来どおり10分の期限を付ける
+ALTER TABLE smoke.notification_outbox ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ;
+UPDATE smoke.notification_outbox
+SET lease_until = claimed_at + INTERVAL '10 minutes'
+WHERE status = 'sending' AND lease_until IS NULL;
+
+-- 既存環境の移行：これまでに達成したマイルストーンは通知済みとして登録
+INSERT INTO smoke.notification_outbox (idempotency_key, kind, status, sent_at)
+SELECT 'milestone:' || milestone_key, 'milestone', 'sent', achieved_at
+FROM smoke.milestones
+ON CONFLICT (idempotency_key) DO NOTHING;
+
+-- ============================================
+-- 日記のページ送り・本文検索用インデックス
+-- ============================================
+
+-- キーセット方式のページ送り（新しい順）
+CREATE INDEX IF NOT EXISTS diary_entries_date_created_idx
+    ON smoke.diary_entries (date DESC, created_at DESC);
+
+-- 本文の部分一致検索（ILIKE '%キーワード%'）用のトライグラムインデックス
+-- トライグラムは3文字単位のため、索引を使えるのは3文字以上の検索語だけ
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+CREATE INDEX IF NOT EXISTS diary_entries_message_trgm_idx
+    ON smoke.diary_entries USING GIN (message extensions.gin_trgm_ops);
+
+-- 1〜2文字の検索語（「育児」「禁煙」など日本語に多い）用に、本文の1文字・2文字の断片を
+-- 配列として持たせて GIN インデックスを張る（message_grams @> ARRAY['禁煙'] で検索する）
+CREATE OR REPLACE FUNCTION smoke.text_grams(t TEXT)
+RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(array_agg(DISTINCT substr(lower(t), i, n)), '{}')
+    FROM generate_series(1, char_length(t)) AS i,
+         (VALUES (1), (2)) AS g(n)
+    WHERE i + n - 1 <= char_length(t)
+$$;
+
+ALTER TABLE smoke.diary_entries
+    ADD COLUMN IF NOT EXISTS message_grams TEXT[]
+    GENERATED ALWAYS AS (smoke.text_grams(message)) STORED;
+CREATE INDEX IF NOT EXISTS diary_entries_message_grams_idx
+    ON smoke.diary_entries USING GIN (message_grams);
+
+CREATE INDEX IF NOT EXISTS diary_entries_mood_idx
+    ON smoke.diary_entries (mood, date DESC, created_at DESC);
+
+-- ============================================
+-- パートナービュー用スナップショット（共有コードごとに1行）
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS smoke.partner_snapshots (
+    share_code TEXT PRIMARY KEY,           -- 共有コード
+    version BIGINT NOT NULL,               -- 作り直すたびに増えるバージョン番号
+    payload JSONB NOT NULL,                -- 設定・設定履歴・マイルストーン・妊活ログ・メッセージ
+    generated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- ============================================
+-- 衝動と生活習慣の日別集計（JST の日付で結合）
+-- ============================================
+
+-- 妊活チェックを記録した日ごとに、その日（JST）の衝動の件数・我慢できた件数・平均の強さを並べる
+-- 衝動を記録しなかった日は 0 件として扱う
+CREATE OR REPLACE VIEW smoke.daily_craving_habits AS
+WITH cravings AS (
+    SELECT
+        (logged_at AT TIME ZONE 'Asia/Tokyo')::date AS date,
+        COUNT(*) AS cravings,
+        COUNT(*) FILTER (WHERE resisted) AS resisted,
+        ROUND(AVG(intensity), 2) AS avg_intensity
+    FROM smoke.craving_logs
+    GROUP BY 1
+)
+SELECT
+    f.date,
+    f.sleep_hours,
+    f.stress,
+    f.exercise,
+    f.zinc,
+    f.folate,
+    COALESCE(c.cravings, 0) AS cravings,
+    COALESCE(c.resisted, 0) AS resisted,
+    c.avg_intensity
+FROM smoke.fertility_logs f
+LEFT JOIN cravings c ON c.date = f.date;
+
+-- ============================================
+-- 衝動リスク予測の状態（曜日×時間帯の指数減衰付きの集計）
+-- ============================================
+
+-- 衝動ログが Supabase に届くたびに、新しい行の分だけ状態を更新する（全件の再計算はしない）
+-- version は同時更新の検出用（読んだときの version と一致する場合だけ書き込む）
+CREATE TABLE IF NOT EXISTS smoke.craving_forecast (
+    id TEXT PRIMARY KEY DEFAULT 'default',
+    version BIGINT NOT NULL DEFAULT 0,
+    state JSONB NOT NULL,                  -- 168区分の重み・基準時刻・記録数など
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- ============================================
+-- 衝動の日別推移（JST の日付・7日／30日の移動集計）
+-- ============================================
+
+-- 最初の記録日から今日（JST）までの毎日について、その日の件数と
+-- 直近7日・30日の1日あたりの件数・我慢できた割合をウィンドウ関数で計算する
+-- 衝動を記録しなかった日も 0 件の日として窓に含める（記録開始直後の窓は記録開始日から数える）
+CREATE OR REPLACE VIEW smoke.daily_craving_trends AS
+WITH daily AS (
+    SELECT
+        (logged_at AT TIME ZONE 'Asia/Tokyo')::date AS date,
+        COUNT(*) AS cravings,
+        COUNT(*) FILTER (WHERE resisted) AS resisted
+    FROM smoke.craving_logs
+    GROUP BY 1
+),
+calendar AS (
+    SELECT d::date AS date
+    FROM (SELECT MIN(date) AS first_date FROM daily) b,
+         generate_series(b.first_date, (NOW() AT TIME ZONE 'Asia/Tokyo')::date, INTERVAL '1 day') AS d
+),
+rolling AS (
+    SELECT
+        c.date,
+        COALESCE(d.cravings, 0) AS cravings,
+        COALESCE(d.resisted, 0) AS resisted,
+        COUNT(*) OVER w7 AS days_7d,
+        SUM(COALESCE(d.cravings, 0)) OVER w7 AS cravings_7d,
+        SUM(COALESCE(d.resisted, 0)) OVER w7 AS resisted_7d,
+        COUNT(*) OVER w30 AS days_30d,
+        SUM(COALESCE(d.cravings, 0)) OVER w30 AS cravings_30d,
+        SUM(COALESCE(d.resisted, 0)) OVER w30 AS resisted_30d
+    FROM calendar c
+    LEFT JOIN daily d ON d.date = c.date
+    WINDOW
+        w7 AS (ORDER BY c.date ROWS BETWEEN 6 PRECEDING AND CURRENT ROW),
+        w30 AS (ORDER BY c.date ROWS BETWEEN 29 PRECEDING AND CURRENT ROW)
+)
+SELECT
+    date,
+    cravings,
+    resisted,
+    ROUND(cravings_7d::numeric / days_7d, 2) AS cravings_per_day_7d,
+    ROUND(cravings_30d::numeric / days_30d, 2) AS cravings_per_day_30d,
+    ROUND(resisted_7d::numeric / NULLIF(cravings_7d, 0), 3) AS resist_rate_7d,   -- 窓内に衝動がなければ NULL
+    ROUND(resisted_30d::numeric / NULLIF(cravings_30d, 0), 3) AS resist_rate_30d
+FROM rolling;
@@ -0,0 +1,62 @@
+"""
+utils/calculations.py のテスト（節約金額の累積和インデックス）
+"""
+from datetime import date
+
+import pytest
+
+from utils.calculations import SavingsIndex, build_savings_index, get_daily_saving_rate
+
+QUIT = date(2026, 1, 1)
+
+
+def test_single_rate_accumulates_per_day():
+    index = SavingsIndex(QUIT, [(QUIT, 500.0)])
+    assert index.total(date(2026, 1, 1)) == 0
+    assert index.total(date(2026, 1, 11)) == 5000
+    assert index.saved_between(date(2026, 1, 3), date(2026, 1, 5)) == 1000
+
+
+def test_rate_change_does_not_rewrite_past_savings():
+    index = SavingsIndex(QUIT, [(QUIT, 500.0), (date(2026, 1, 11), 300.0)])
+    assert index.total(date(2026, 1, 11)) == 5000
+    assert index.total(date(2026, 1, 21)) == 8000
+    assert index.daily_rate(date(2026, 1, 10)) == 500.0
+    assert index.daily_rate(date(2026, 1, 11)) == 300.0
+
+
+def test_periods_are_sorted_and_clamped_to_quit_date():
+    index = SavingsIndex(QUIT, [(date(2026, 1, 11), 300.0), (date(2025, 12, 1), 500.0)])
+    assert index.starts == [QUIT, date(2026, 1, 11)]
+    assert index.total(date(2025, 12, 31)) == 0
+
+
+def test_same_day_changes_keep_the_last_rate():
+    index = SavingsIndex(QUIT, [(QUIT, 500.0), (QUIT, 600.0)])
+    assert index.rates == [600.0]
+
+
+def test_empty_periods_are_rejected():
+    with pytest.raises(ValueError):
+        SavingsIndex(QUIT, [])
+
+
+def test_daily_series_matches_total():
+    index = SavingsIndex(QUIT, [(QUIT, 500.0), (date(2026, 1, 3), 250.0)])
+    series = index.daily_series(end=date(2026, 1, 4))
+    assert [row["daily"] for row in series] == [500, 500, 250, 250]
+    assert series[-1]["cumulative"] == index.total(date(2026, 1, 5)) == 1500
+
+
+def test_build_savings_index_backfills_before_first_history_row():
+    settings = {"quit_date": "2026-01-01", "cigarettes_per_day": 20, "price_per_pack": 600}
+    history = [{"effective_from": "2026-01-11", "cigarettes_per_day": 10,
+                "price_per_pack": 600, "cigarettes_per_pack": 20}]
+    index = build_savings_index(settings, history)
+    assert index.daily_rate(QUIT) == get_daily_saving_rate(10, 600)
+    assert index.total(date(2026, 1, 11)) == 3000
+
+
+def test_build_savings_index_without_history_uses_current_settings():
+    settings = {"quit_date": "2026-01-01", "cigarettes_per_day": 20, "price_per_pack": 600}
+    assert build_savings_index(settings, []).total(date(2026, 1, 2)) == 600
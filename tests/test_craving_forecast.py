@@ -0,0 +1,72 @@
+"""
+utils/craving_forecast.py のテスト（曜日×時間帯の衝動リスク予測）
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.craving_forecast import (
+    MIN_LOGS,
+    RISK_HIGH,
+    RISK_LOW,
+    CravingForecaster,
+    slot_of,
+)
+
+_JST = timezone(timedelta(hours=9))
+_MONDAY = datetime(2026, 10, 5, tzinfo=_JST)  # 月曜 0時
+
+
+def _weekly_at(hour: int, weeks: int) -> CravingForecaster:
+    """毎週金曜の hour 時台に強さ5の衝動を記録した状態"""
+    forecaster = CravingForecaster()
+    for week in range(weeks):
+        forecaster.update(_MONDAY + timedelta(weeks=week, days=4, hours=hour, minutes=10), 5)
+    return forecaster
+
+
+def test_slot_of_uses_jst():
+    assert slot_of(_MONDAY) == 0
+    assert slot_of(datetime(2026, 10, 9, 12, 30, tzinfo=timezone.utc)) == 4 * 24 + 21  # 金曜 21時 JST
+
+
+def test_not_ready_without_enough_logs():
+    forecaster = _weekly_at(21, MIN_LOGS - 1)
+    assert forecaster.forecast(_MONDAY + timedelta(weeks=MIN_LOGS)) is None
+
+
+def test_recurring_slot_is_high_risk_and_others_low():
+    forecaster = _weekly_at(21, 12)
+    friday = _MONDAY + timedelta(weeks=12, days=4)
+    high = forecaster.forecast(friday + timedelta(hours=21))
+    assert high.level == RISK_HIGH
+    assert high.label == "金曜 21時台"
+    assert forecaster.forecast(friday + timedelta(hours=9)).level == RISK_LOW
+
+
+def test_forecast_slot_moves_to_the_next_hour_after_half_past():
+    forecaster = _weekly_at(21, 12)
+    friday = _MONDAY + timedelta(weeks=12, days=4)
+    assert forecaster.forecast(friday + timedelta(hours=20, minutes=45)).label == "金曜 21時台"
+
+
+def test_state_round_trip():
+    forecaster = _weekly_at(21, 12)
+    restored = CravingForecaster.from_state(forecaster.to_state())
+    now = _MONDAY + timedelta(weeks=12, days=4, hours=21)
+    assert restored.forecast(now) == forecaster.forecast(now)
+    assert CravingForecaster.from_state(None).count == 0
+
+
+def test_rebase_keeps_rates_unchanged():
+    forecaster = CravingForecaster(half_life_days=1.0)
+    rebased = CravingForecaster(half_life_days=1.0)
+    start = _MONDAY
+    for day in range(0, 120, 3):
+        forecaster.update(start + timedelta(days=day), 3)
+        rebased.update(start + timedelta(days=day), 3)
+        if day == 60:
+            rebased._rebase(start + timedelta(days=day))
+    now = start + timedelta(days=121)
+    slot = slot_of(start)
+    assert rebased.slot_rate(slot, now) == pytest.approx(forecaster.slot_rate(slot, now))
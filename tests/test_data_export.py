@@ -0,0 +1,123 @@
+"""
+utils/data_export.py のテスト（get_table_page をページの並びに差し替えて書き出す）
+"""
+import csv
+import json
+
+import pytest
+
+from utils import data_export
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """get_table_page が返すページを差し替える（呼ばれた列の指定も記録する）"""
+    state = {"pages": [], "columns": []}
+
+    def fake_page(table_name, after_id=None, limit=1000, columns="*"):
+        state["columns"].append(columns)
+        return state["pages"].pop(0) if state["pages"] else []
+
+    monkeypatch.setattr(data_export, "get_table_page", fake_page)
+    return state
+
+
+def _fertility(i, **values):
+    row = {"id": f"00000000-0000-0000-0000-{i:012d}", "date": f"2026-01-{i:02d}"}
+    row.update(values)
+    return row
+
+
+def _read_csv(path):
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_selects_declared_columns(pages, tmp_path):
+    data_export.export_table("diary_entries", tmp_path, formats=("csv",))
+    assert pages["columns"] == ["id,date,message,mood,created_at"]
+
+
+def test_csv_keeps_columns_that_first_appear_on_a_later_page(pages, tmp_path):
+    pages["pages"] = [[_fertility(1), _fertility(2)], [_fertility(3, notes="よく眠れた")]]
+    info = data_export.export_table("fertility_logs", tmp_path, formats=("csv",), page_size=2)
+    rows = _read_csv(tmp_path / "fertility_logs.csv")
+    assert info["rows"] == 3
+    assert list(rows[0]) == [name for name, _ in data_export._TABLE_COLUMNS["fertility_logs"]]
+    assert [row["notes"] for row in rows] == ["", "", "よく眠れた"]
+
+
+def test_empty_table_still_writes_a_header(pages, tmp_path):
+    info = data_export.export_table("milestones", tmp_path, formats=("csv",))
+    assert info["rows"] == 0
+    assert (tmp_path / "milestones.csv").read_text(encoding="utf-8-sig").strip() == \
+        "id,milestone_key,achieved_at,created_at"
+
+
+def test_jsonb_values_are_written_as_json(pages, tmp_path):
+    pages["pages"] = [[{"id": "a", "payload": {"title": "21時のリマインダー"}}]]
+    data_export.export_table("notification_outbox", tmp_path, formats=("csv",))
+    row = _read_csv(tmp_path / "notification_outbox.csv")[0]
+    assert json.loads(row["payload"]) == {"title": "21時のリマインダー"}
+
+
+def test_parquet_schema_comes_from_declared_columns(pages, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    # 最初のページでは sleep_hours・stress が全て NULL、2ページ目で初めて値が入る
+    pages["pages"] = [[_fertility(1), _fertility(2)], [_fertility(3, sleep_hours=7.5, stress=2)]]
+    data_export.export_table("fertility_logs", tmp_path, formats=("parquet",), page_size=2)
+    table = pq.read_table(tmp_path / "fertility_logs.parquet")
+    assert str(table.schema.field("sleep_hours").type) == "double"
+    assert str(table.schema.field("stress").type) == "int64"
+    assert table.column("sleep_hours").to_pylist() == [None, None, 7.5]
+
+
+def test_empty_table_writes_parquet_with_columns(pages, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    info = data_export.export_table("quit_attempts", tmp_path, formats=("parquet",))
+    table = pq.read_table(tmp_path / "quit_attempts.parquet")
+    assert table.num_rows == 0
+    assert table.column_names == ["id", "start_date", "end_date", "days_lasted", "created_at"]
+    assert "parquet" in info["files"]
+
+
+def test_export_all_writes_manifest(pages, tmp_path):
+    manifest = data_export.export_all(tmp_path, formats=("csv",), tables=("milestones",))
+    written = json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8"))
+    assert written == manifest
+    assert written["tables"]["milestones"]["files"]["csv"]["path"] == "milestones.csv"
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        data_export.export_all(tmp_path, formats=("xlsx",))
+
+
+# ─── 出力先の整理 ────────────────────────────────────────────────────────────
+
+def test_zip_export_can_remove_the_directory(tmp_path):
+    out_dir = tmp_path / "20261019-120000"
+    out_dir.mkdir()
+    (out_dir / "manifest.json").write_text("{}", encoding="utf-8")
+    zip_path = data_export.zip_export(out_dir, remove_dir=True)
+    assert zip_path == tmp_path / "20261019-120000.zip"
+    assert zip_path.exists() and not out_dir.exists()
+
+
+def test_prune_exports_keeps_the_newest(tmp_path):
+    for stamp in ("20261017-090000", "20261018-090000", "20261019-090000"):
+        (tmp_path / stamp).mkdir()
+        (tmp_path / f"{stamp}.zip").write_bytes(b"")
+    (tmp_path / "backup").mkdir()  # 時刻付きでないものには触れない
+    (tmp_path / "notes.zip").write_bytes(b"")
+
+    removed = data_export.prune_exports(tmp_path, keep=2)
+    assert sorted(p.name for p in removed) == ["20261017-090000", "20261017-090000.zip"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "20261018-090000", "20261018-090000.zip", "20261019-090000", "20261019-090000.zip",
+        "backup", "notes.zip",
+    ]
+
+
+def test_prune_exports_without_base_dir(tmp_path):
+    assert data_export.prune_exports(tmp_path / "missing") == []
@@ -0,0 +1,101 @@
+"""
+utils/data_import.py のテスト（dry_run で検証だけを行い、Supabase には書き込まない）
+"""
+import io
+from datetime import timedelta
+
+import pytest
+
+from utils.calculations import today_jst
+from utils.data_import import (
+    RowError,
+    _content_id,
+    _validate_craving,
+    _validate_fertility,
+    import_records,
+    read_records,
+)
+
+
+def _dry_run(rows, table_name):
+    return import_records(enumerate(rows, start=1), table_name, dry_run=True)
+
+
+# ─── 妊活チェック ────────────────────────────────────────────────────────────
+
+def test_fertility_row_is_normalized():
+    row = _validate_fertility({"date": "2024/05/01", "zinc": "はい", "sleep_hours": "7.25",
+                               "stress": "2", "notes": " よく眠れた "})
+    assert row == {"date": "2024-05-01", "zinc": True, "folate": False, "sleep_hours": 7.2,
+                   "exercise": False, "stress": 2, "notes": "よく眠れた"}
+
+
+@pytest.mark.parametrize("record", [
+    {},
+    {"date": "2024-13-01"},
+    {"date": "2024-05-01", "stress": "6"},
+    {"date": "2024-05-01", "sleep_hours": "25"},
+    {"date": "2024-05-01", "zinc": "maybe"},
+])
+def test_invalid_fertility_rows_are_rejected(record):
+    with pytest.raises(RowError):
+        _validate_fertility(record)
+
+
+def test_future_fertility_date_is_a_row_error():
+    today = today_jst()
+    rows = [
+        {"date": today.isoformat(), "zinc": "true"},
+        {"date": (today + timedelta(days=1)).isoformat(), "zinc": "true"},
+    ]
+    report = _dry_run(rows, "fertility_logs")
+    assert (report.read, report.valid, report.written, report.error_count) == (2, 1, 0, 1)
+    line, message = report.errors[0]
+    assert line == 2
+    assert "未来" in message
+
+
+def test_duplicate_fertility_dates_in_one_file():
+    rows = [{"date": "2024-05-01"}, {"date": "2024-05-01"}]
+    report = _dry_run(rows, "fertility_logs")
+    assert report.valid == 1
+    assert report.errors[0][0] == 2
+
+
+# ─── 衝動ログ ────────────────────────────────────────────────────────────────
+
+def test_craving_row_defaults():
+    row = _validate_craving({"logged_at": "2024-05-01 21:30", "intensity": "3"})
+    assert row["logged_at"] == "2024-05-01T21:30:00+09:00"
+    assert row["trigger"] == "その他"
+    assert row["resisted"] is True
+    assert row["id"] is None
+
+
+@pytest.mark.parametrize("record", [
+    {"intensity": "3"},
+    {"logged_at": "2024-05-01", "intensity": "0"},
+    {"logged_at": "2024-05-01", "intensity": "2.5"},
+    {"logged_at": "2024-05-01", "intensity": "3", "id": "not-a-uuid"},
+    {"logged_at": "2999-01-01", "intensity": "3"},
+])
+def test_invalid_craving_rows_are_rejected(record):
+    with pytest.raises(RowError):
+        _validate_craving(record)
+
+
+def test_identical_craving_rows_get_distinct_stable_ids():
+    row = _validate_craving({"logged_at": "2024-05-01 21:30", "intensity": "3"})
+    first, second = {}, {}
+    ids = [_content_id(row, first), _content_id(row, first)]
+    assert ids[0] != ids[1]
+    assert [_content_id(row, second), _content_id(row, second)] == ids  # 取り込み直しても同じ id
+
+
+# ─── 読み込み ────────────────────────────────────────────────────────────────
+
+def test_broken_jsonl_line_is_counted_and_reading_continues():
+    stream = io.BytesIO(b'{"date": "2024-05-01"}\n{broken\n{"date": "2024-05-02"}\n')
+    report = import_records(read_records(stream, "jsonl"), "fertility_logs", dry_run=True)
+    assert (report.read, report.valid, report.error_count) == (3, 2, 1)
+    assert report.errors[0][0] == 2
@@ -0,0 +1,30 @@
+"""
+utils/discord_notifier.py のテスト（embed を1メッセージの上限に収める分け方）
+"""
+from utils.discord_notifier import chunk_embeds
+
+
+def _embed(chars: int) -> dict:
+    return {"title": "", "description": "x" * chars}
+
+
+def test_chunks_by_embed_count():
+    assert chunk_embeds([_embed(1)] * 5, max_embeds=2) == [[0, 1], [2, 3], [4]]
+
+
+def test_chunks_by_total_characters():
+    embeds = [_embed(40), _embed(40), _embed(30), _embed(90)]
+    assert chunk_embeds(embeds, max_chars=100) == [[0, 1], [2], [3]]
+
+
+def test_footer_counts_toward_the_limit():
+    embeds = [_embed(50), {"description": "x" * 40, "footer": {"text": "y" * 20}}]
+    assert chunk_embeds(embeds, max_chars=100) == [[0], [1]]
+
+
+def test_oversized_embed_gets_its_own_message():
+    assert chunk_embeds([_embed(10), _embed(500), _embed(10)], max_chars=100) == [[0], [1], [2]]
+
+
+def test_no_embeds():
+    assert chunk_embeds([]) == []
@@ -0,0 +1,56 @@
+"""
+utils/fertility_scores.py のテスト
+"""
+from datetime import timedelta
+
+from utils.calculations import today_jst
+from utils.fertility_scores import HABITS, build_fertility_analytics, calc_score
+
+
+def _log(day, **habits):
+    row = {"date": day.isoformat(), "zinc": False, "folate": False, "exercise": False,
+           "sleep_hours": None, "stress": None}
+    row.update(habits)
+    return row
+
+
+def test_calc_score_full_marks():
+    log = {"zinc": True, "folate": True, "exercise": True, "sleep_hours": 7.5, "stress": 1}
+    assert calc_score(log) == 100
+
+
+def test_empty_logs_have_zero_streaks():
+    analytics = build_fertility_analytics([])
+    assert analytics.daily.empty
+    assert analytics.current_streaks == {key: 0 for key in HABITS}
+    assert analytics.longest_streaks == {key: 0 for key in HABITS}
+
+
+def test_consecutive_days_count_as_streak():
+    today = today_jst()
+    logs = [_log(today - timedelta(days=i), zinc=True) for i in range(3)]
+    analytics = build_fertility_analytics(logs)
+    assert analytics.current_streaks["zinc"] == 3
+    assert analytics.longest_streaks["zinc"] == 3
+    assert analytics.current_streaks["folate"] == 0
+
+
+def test_streak_continues_when_today_is_not_logged_yet():
+    today = today_jst()
+    logs = [_log(today - timedelta(days=i), exercise=True) for i in (1, 2)]
+    assert build_fertility_analytics(logs).current_streaks["exercise"] == 2
+
+
+def test_future_dated_log_does_not_crash():
+    tomorrow = today_jst() + timedelta(days=1)
+    analytics = build_fertility_analytics([_log(tomorrow, zinc=True)])
+    assert analytics.current_streaks["zinc"] == 1
+    assert len(analytics.daily) == 1
+
+
+def test_logs_ahead_of_today_extend_the_calendar():
+    today = today_jst()
+    logs = [_log(today + timedelta(days=i), folate=True) for i in range(3)]
+    analytics = build_fertility_analytics(logs)
+    assert analytics.current_streaks["folate"] == 3
+    assert analytics.longest_streaks["folate"] == 3
@@ -0,0 +1,55 @@
+"""
+utils/milestones.py のテスト（マイルストーンの索引）
+"""
+from utils.milestones import (
+    KIND_MONEY,
+    MILESTONES,
+    MilestoneRegistry,
+    build_milestone_registry,
+    milestone_from_row,
+)
+
+
+def _custom(key, threshold, kind="days"):
+    return {"milestone_key": key, "threshold": threshold, "kind": kind, "title": key}
+
+
+def _keys(milestones):
+    return [m.key for m in milestones]
+
+
+def test_achieved_and_next_follow_thresholds():
+    registry = MilestoneRegistry(MILESTONES)
+    thresholds = sorted(m.days for m in MILESTONES)
+    achieved = registry.achieved(thresholds[1])
+    assert [m.days for m in achieved] == thresholds[:2]
+    assert registry.next(thresholds[1]).days == thresholds[2]
+    assert registry.next(thresholds[-1]) is None
+
+
+def test_crossed_returns_only_new_milestones():
+    registry = MilestoneRegistry([milestone_from_row(_custom(key, days))
+                                  for key, days in (("custom_a", 5), ("custom_b", 8), ("custom_c", 12))])
+    assert _keys(registry.crossed(5, 12)) == ["custom_b", "custom_c"]
+    assert _keys(registry.crossed(4, 5)) == ["custom_a"]
+    assert registry.crossed(8, 8) == []
+    assert registry.crossed(9, 8) == []
+
+
+def test_crossed_without_last_value_returns_everything_so_far():
+    registry = MilestoneRegistry([milestone_from_row(_custom("custom_a", 5))])
+    assert _keys(registry.crossed(None, 5)) == ["custom_a"]
+    assert registry.crossed(None, 4) == []
+
+
+def test_money_milestones_are_indexed_separately():
+    registry = build_milestone_registry([_custom("custom_yen", 10000, kind=KIND_MONEY)])
+    assert "custom_yen" not in _keys(registry.achieved(10000))
+    assert _keys(registry.crossed(9999, 10000, KIND_MONEY)) == ["custom_yen"]
+    assert registry.get("custom_yen").amount == 10000
+
+
+def test_custom_milestone_overrides_same_key():
+    registry = build_milestone_registry([_custom(MILESTONES[0].key, 2)])
+    assert registry.get(MILESTONES[0].key).days == 2
+    assert registry.signature != MilestoneRegistry(MILESTONES).signature
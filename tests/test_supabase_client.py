@@ -0,0 +1,43 @@
+"""
+utils/supabase_client.py のテスト（DB には接続せず、呼び出し内容だけを確認する）
+"""
+from datetime import date
+
+import pytest
+
+from utils import supabase_client
+
+
+class _FakeQuery:
+    """_table() の代わり（どの呼び出しにも自分を返し、execute で data を返す）"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return type("Result", (), {"data": [{"id": 1}]})()
+
+
+@pytest.fixture
+def settings_history(monkeypatch):
+    """既存の設定（1日20本・600円）がある状態にし、追記された履歴の適用開始日を返す"""
+    existing = {"id": 1, "quit_date": "2026-01-01", "quit_datetime": "2026-01-01T00:00:00+09:00",
+                "cigarettes_per_day": 20, "price_per_pack": 600, "cigarettes_per_pack": 20}
+    history = []
+    monkeypatch.setattr(supabase_client, "get_user_settings", lambda: existing)
+    monkeypatch.setattr(supabase_client, "_table", lambda name: _FakeQuery())
+    monkeypatch.setattr(supabase_client, "add_settings_history",
+                        lambda effective_from, *args: history.append(effective_from))
+    monkeypatch.setattr(supabase_client, "refresh_partner_snapshot", lambda: None)
+    return history
+
+
+def test_settings_history_starts_on_today_in_jst(settings_history, monkeypatch):
+    monkeypatch.setattr(supabase_client, "today_jst", lambda: date(2026, 10, 18))
+    supabase_client.upsert_user_settings(date(2026, 1, 1), 10, 600)
+    assert settings_history == [date(2026, 10, 18)]
+
+
+def test_unchanged_rates_add_no_history(settings_history):
+    supabase_client.upsert_user_settings(date(2026, 1, 1), 20, 600)
+    assert settings_history == []
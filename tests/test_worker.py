@@ -0,0 +1,56 @@
+"""
+worker.py のテスト（リマインダーの時刻枠）
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import worker
+
+_JST = timezone(timedelta(hours=9))
+
+
+def _at(hhmm: str) -> datetime:
+    hour, minute = map(int, hhmm.split(":"))
+    return datetime(2026, 10, 17, hour, minute, tzinfo=_JST)
+
+
+def test_parse_times_sorts_and_pads():
+    assert worker._parse_times(" 21:00, 8:30 ,") == ["08:30", "21:00"]
+
+
+@pytest.mark.parametrize("now, expected", [
+    ("00:05", None),
+    ("08:29", None),
+    ("08:30", "08:30"),
+    ("20:59", "08:30"),
+    ("21:00", "21:00"),
+    ("23:59", "21:00"),
+])
+def test_current_slot_is_last_passed_time(now, expected):
+    assert worker._current_slot(["08:30", "21:00"], _at(now)) == expected
+
+
+@pytest.fixture
+def reminders(monkeypatch):
+    """run_once の DB・送信を差し替え、check_reminder に渡された（日付, 時刻枠）を記録する"""
+    calls = []
+    monkeypatch.setattr(worker, "check_milestones", lambda: 0)
+    monkeypatch.setattr(worker, "check_reminder", lambda today, slot: calls.append((today, slot)))
+    monkeypatch.setattr(worker, "deliver_outbox", lambda: 0)
+
+    def run_at(hhmm: str, reminder_times: list[str]) -> list:
+        fixed = type("FixedNow", (datetime,), {"now": classmethod(lambda cls, tz=None: _at(hhmm))})
+        monkeypatch.setattr(worker, "datetime", fixed)
+        worker.run_once(reminder_times, craving_nudge=False)
+        return calls
+
+    return run_at
+
+
+def test_run_once_skips_reminder_before_first_slot(reminders):
+    assert reminders("00:05", ["21:00"]) == []
+
+
+def test_run_once_uses_passed_slot(reminders):
+    assert reminders("21:03", ["08:30", "21:00"]) == [(_at("21:03").date(), "21:00")]
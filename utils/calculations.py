@@ -2,14 +2,18 @@
 禁煙に関する計算ユーティリティ
 """
 import re
+from bisect import bisect_right
 from datetime import date, datetime, timedelta, timezone
-from typing import Optional
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    import numpy as np  # 実行時はヒートマップ集計で初めて読み込む（起動を軽くするため）
 
 # 日本標準時（UTC+9）
 _JST = timezone(timedelta(hours=9))
 
 
-def _parse_ts(ts_str: str) -> datetime:
+def parse_timestamp(ts_str: str) -> datetime:
     """Supabase の TIMESTAMPTZ 文字列を datetime に変換する。
 
     Python 3.10 の fromisoformat() はマイクロ秒が正確に6桁でないと失敗するため、
@@ -30,11 +34,16 @@ def to_jst_str(utc_str: str) -> str:
     if not utc_str:
         return ""
     try:
-        return _parse_ts(utc_str).astimezone(_JST).strftime("%Y-%m-%d %H:%M")
+        return parse_timestamp(utc_str).astimezone(_JST).strftime("%Y-%m-%d %H:%M")
     except (ValueError, AttributeError):
         return utc_str[:16].replace("T", " ")
 
 
+def today_jst() -> date:
+    """日本時間（JST）での今日の日付を返す"""
+    return datetime.now(_JST).date()
+
+
 def get_smoke_free_days(quit_date: date) -> int:
     """禁煙日数を計算する"""
     delta = date.today() - quit_date
@@ -46,14 +55,6 @@ def get_smoke_free_hours(quit_date: date) -> int:
     return get_smoke_free_days(quit_date) * 24
 
 
-def get_saved_money(quit_date: date, cigarettes_per_day: int,
-                    price_per_pack: int, cigarettes_per_pack: int = 20) -> int:
-    """節約金額を計算する（円）"""
-    days = get_smoke_free_days(quit_date)
-    price_per_cigarette = price_per_pack / cigarettes_per_pack
-    return int(days * cigarettes_per_day * price_per_cigarette)
-
-
 def get_cigarettes_not_smoked(quit_date: date, cigarettes_per_day: int) -> int:
     """吸わなかったタバコの本数を計算する"""
     return get_smoke_free_days(quit_date) * cigarettes_per_day
@@ -64,21 +65,25 @@ def format_money(amount: int) -> str:
     return f"¥{amount:,}"
 
 
-def format_days_hours(quit_date: date, quit_datetime_str: Optional[str] = None) -> str:
-    """禁煙期間を「○日○時間」形式で返す。
+def get_quit_start(quit_date: date, quit_datetime_str: Optional[str] = None) -> datetime:
+    """禁煙期間の起点（JST）を返す。
 
-    quit_datetime_str が与えられた場合はその時刻から正確に計算する。
+    quit_datetime_str が与えられた場合はその時刻、
     未指定の場合は quit_date の当日 JST 0時を起点とする。
     """
-    now = datetime.now(_JST)
     if quit_datetime_str:
-        # DBに記録された正確な時刻（タイムゾーン付き）から計算
-        quit_dt = _parse_ts(quit_datetime_str).astimezone(_JST)
-    else:
-        # fallback: 当日 JST 0時を起点にする
-        quit_dt = datetime(quit_date.year, quit_date.month, quit_date.day,
-                           0, 0, 0, tzinfo=_JST)
-    delta = now - quit_dt
+        # DBに記録された正確な時刻（タイムゾーン付き）
+        return parse_timestamp(quit_datetime_str).astimezone(_JST)
+    # fallback: 当日 JST 0時を起点にする
+    return datetime(quit_date.year, quit_date.month, quit_date.day, 0, 0, 0, tzinfo=_JST)
+
+
+def format_days_hours(quit_date: date, quit_datetime_str: Optional[str] = None) -> str:
+    """禁煙期間を「○日○時間」形式で返す。
+
+    起点は get_quit_start() と同じ（quit_datetime_str があればその時刻）。
+    """
+    delta = datetime.now(_JST) - get_quit_start(quit_date, quit_datetime_str)
     total_seconds = int(delta.total_seconds())
     if total_seconds < 0:
         return "0分"
@@ -93,27 +98,172 @@ def format_days_hours(quit_date: date, quit_datetime_str: Optional[str] = None)
     return f"{days}日 {hours}時間"
 
 
-def get_daily_savings_data(
-    quit_date: date,
-    cigarettes_per_day: int,
-    price_per_pack: int,
-    cigarettes_per_pack: int = 20,
-) -> list[dict]:
-    """禁煙開始日から今日までの日別・累積節約金額データを返す
+# ─── 価格・本数の履歴に対応した節約金額エンジン ─────────────────────────────
+
+class SavingsIndex:
+    """設定履歴（区分ごとに一定の1日あたり節約額）に対する累積和インデックス
+
+    区分 i は starts[i] から次の区分の開始日の前日まで rates[i] 円/日 で節約する。
+    prefix[i] には starts[i] 時点までの累積節約額を保持するため、
+    任意の日付の累積額・2日付間の節約額は bisect による O(log n) で求まる。
+    """
+
+    def __init__(self, quit_date: date, periods: Iterable[tuple[date, float]]):
+        """
+        Args:
+            quit_date: 禁煙開始日（これより前の区分は開始日に丸める）
+            periods: (適用開始日, 1日あたり節約額) の組。順不同でよい
+        """
+        self.quit_date = quit_date
+        self.starts: list[date] = []
+        self.rates: list[float] = []
+        for start, rate in sorted(periods, key=lambda p: p[0]):
+            start = max(start, quit_date)
+            if self.starts and self.starts[-1] == start:
+                # 同日に複数回変更された場合は最後の設定を採用
+                self.rates[-1] = rate
+            else:
+                self.starts.append(start)
+                self.rates.append(rate)
+        if not self.starts:
+            raise ValueError("periods が空です")
+
+        self.prefix: list[float] = [0.0]
+        for i in range(1, len(self.starts)):
+            span = (self.starts[i] - self.starts[i - 1]).days
+            self.prefix.append(self.prefix[-1] + self.rates[i - 1] * span)
+
+    def cumulative_until(self, d: date) -> float:
+        """禁煙開始日から d の前日までの累積節約額（円・端数あり）を返す"""
+        i = bisect_right(self.starts, d) - 1
+        if i < 0:
+            return 0.0
+        return self.prefix[i] + self.rates[i] * (d - self.starts[i]).days
+
+    def saved_between(self, start: date, end: date) -> int:
+        """start 以上 end 未満の日付における節約額（円）を返す"""
+        if end <= start:
+            return 0
+        return int(self.cumulative_until(end) - self.cumulative_until(start))
+
+    def total(self, as_of: Optional[date] = None) -> int:
+        """as_of（既定は今日・JST）時点の節約金額（円）を返す"""
+        as_of = as_of or today_jst()
+        return int(self.cumulative_until(as_of))
+
+    def daily_rate(self, d: date) -> float:
+        """d に適用される1日あたり節約額（円）を返す"""
+        i = max(0, bisect_right(self.starts, d) - 1)
+        return self.rates[i]
+
+    def daily_series(self, start: Optional[date] = None,
+                     end: Optional[date] = None) -> list[dict]:
+        """start〜end（両端含む）の日別・累積節約金額データを返す
+
+        各日の値は累積和インデックスから O(log n) で求める。
+
+        Returns:
+            [{"date": date, "daily": int, "cumulative": int}, ...]
+        """
+        start = max(start or self.quit_date, self.quit_date)
+        end = end or today_jst()
+        result = []
+        d = start
+        while d <= end:
+            nxt = d + timedelta(days=1)
+            result.append({
+                "date": d,
+                "daily": int(self.daily_rate(d)),
+                "cumulative": int(self.cumulative_until(nxt)),
+            })
+            d = nxt
+        return result
+
+
+def get_daily_saving_rate(cigarettes_per_day: int, price_per_pack: int,
+                          cigarettes_per_pack: int = 20) -> float:
+    """1日あたりの節約額（円・端数あり）を返す"""
+    return cigarettes_per_day * price_per_pack / (cigarettes_per_pack or 20)
+
+
+def build_savings_index(settings: dict, history: list[dict]) -> SavingsIndex:
+    """user_settings と settings_history の行から SavingsIndex を構築する
+
+    履歴が空（移行前の環境など）の場合は現在の設定を禁煙開始日から適用する。
+    """
+    quit_date = date.fromisoformat(settings["quit_date"])
+    periods = [
+        (
+            date.fromisoformat(row["effective_from"]),
+            get_daily_saving_rate(
+                row["cigarettes_per_day"],
+                row["price_per_pack"],
+                row.get("cigarettes_per_pack") or 20,
+            ),
+        )
+        for row in history
+    ]
+    if not periods or min(p[0] for p in periods) > quit_date:
+        # 最初の履歴より前の期間は、最古の履歴（なければ現在の設定）で補う
+        base = min(history, key=lambda r: r["effective_from"]) if history else settings
+        periods.append((
+            quit_date,
+            get_daily_saving_rate(
+                base["cigarettes_per_day"],
+                base["price_per_pack"],
+                base.get("cigarettes_per_pack") or 20,
+            ),
+        ))
+    return SavingsIndex(quit_date, periods)
+
+
+# ─── 衝動ヒートマップ ─────────────────────────────────────────────────────────
+
+# ヒートマップの集計期間（表示名 → 日数、None は全期間）
+HEATMAP_RANGES: dict[str, Optional[int]] = {
+    "直近7日": 7,
+    "直近30日": 30,
+    "直近90日": 90,
+    "すべて": None,
+}
+
+
+def get_range_start(days: Optional[int]) -> Optional[datetime]:
+    """直近 days 日の起点（JST 0時）を返す。None なら全期間として None"""
+    if days is None:
+        return None
+    start = datetime.now(_JST).date() - timedelta(days=days - 1)
+    return datetime(start.year, start.month, start.day, tzinfo=_JST)
+
+
+def build_craving_heatmap(logs: list[dict], weight_by_intensity: bool = False,
+                          resisted_only: bool = False) -> "np.ndarray":
+    """衝動ログから曜日×時間帯（JST）の 7×24 行列を作る
+
+    タイムスタンプを一括でパースし、曜日*24+時 のインデックスに対して
+    np.bincount を1回呼ぶだけで集計する。パースできない行は無視する。
+
+    Args:
+        logs: logged_at（と intensity・resisted）を含む衝動ログ
+        weight_by_intensity: True なら件数ではなく衝動の強さの合計
+        resisted_only: True なら我慢できたログのみ集計
 
     Returns:
-        [{"date": date, "daily": int, "cumulative": int}, ...]
+        行 0=月曜〜6=日曜、列 0〜23時 の ndarray
     """
-    price_per_cigarette = price_per_pack / cigarettes_per_pack
-    daily_saving = int(cigarettes_per_day * price_per_cigarette)
-
-    today = date.today()
-    total_days = (today - quit_date).days + 1
-
-    result = []
-    cumulative = 0
-    for i in range(total_days):
-        d = quit_date + timedelta(days=i)
-        cumulative += daily_saving
-        result.append({"date": d, "daily": daily_saving, "cumulative": cumulative})
-    return result
+    import numpy as np
+    import pandas as pd
+
+    if not logs:
+        return np.zeros((7, 24))
+    df = pd.DataFrame(logs)
+    if resisted_only:
+        df = df[df["resisted"].fillna(False).astype(bool)]
+    ts = pd.to_datetime(df["logged_at"], utc=True, format="ISO8601", errors="coerce")
+    valid = ts.notna().to_numpy()
+    jst = ts[valid].dt.tz_convert(_JST)
+    index = (jst.dt.weekday * 24 + jst.dt.hour).to_numpy()
+    weights = None
+    if weight_by_intensity:
+        weights = pd.to_numeric(df["intensity"], errors="coerce").fillna(0).to_numpy()[valid]
+    return np.bincount(index, weights=weights, minlength=7 * 24).reshape(7, 24)
@@ -0,0 +1,89 @@
+"""
+衝動と生活習慣の関係の分析
+
+DB 側で JST の日付ごとに結合した「生活習慣 × 衝動の件数」（smoke.daily_craving_habits）から、
+睡眠・ストレス・運動と衝動の件数・我慢できた割合の相関、
+ストレスレベル別・睡眠時間帯別の我慢できた割合を計算する。
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+MIN_DAYS = 7  # 分析に必要な記録日数
+
+# 生活習慣（列名 → 表示名）
+FACTORS = {
+    "sleep_hours": "睡眠時間",
+    "stress": "ストレス",
+    "exercise": "運動",
+}
+# 衝動の指標（列名 → 表示名）
+OUTCOMES = {
+    "cravings": "衝動の回数",
+    "avg_intensity": "衝動の強さ",
+    "resist_rate": "我慢できた割合",
+}
+
+# 睡眠時間帯（下限を含み上限を含まない）
+_SLEEP_BINS = [0, 6, 7, 8, 9, float("inf")]
+SLEEP_BANDS = ["6時間未満", "6〜7時間", "7〜8時間", "8〜9時間", "9時間以上"]
+
+
+@dataclass
+class CravingHabitAnalysis:
+    """衝動と生活習慣の分析結果"""
+    days: int                      # 分析に使った記録日数
+    correlations: pd.DataFrame     # 生活習慣 × 衝動の指標の順位相関（Spearman）
+    by_stress: pd.DataFrame        # ストレスレベル別の日数・1日あたりの衝動・我慢できた割合
+    by_sleep: pd.DataFrame         # 睡眠時間帯別の日数・1日あたりの衝動・我慢できた割合
+    strongest: Optional[tuple[str, str, float]]  # 最も相関の強い（生活習慣, 指標, 相関係数）
+
+
+def _summarize(df: pd.DataFrame, key: pd.Series, categories: list) -> pd.DataFrame:
+    """区分ごとの日数・1日あたりの衝動の回数・我慢できた割合（件数で重み付け）"""
+    grouped = df.groupby(key, observed=False).agg(
+        days=("cravings", "size"),
+        cravings=("cravings", "sum"),
+        resisted=("resisted", "sum"),
+    ).reindex(categories, fill_value=0)
+    grouped["cravings_per_day"] = (grouped["cravings"] / grouped["days"]).where(grouped["days"] > 0)
+    grouped["resist_rate"] = (grouped["resisted"] / grouped["cravings"]).where(grouped["cravings"] > 0)
+    return grouped
+
+
+def build_craving_habit_analysis(rows: list[dict]) -> Optional[CravingHabitAnalysis]:
+    """日別の生活習慣・衝動の件数から分析結果を作る（記録日数が MIN_DAYS 未満なら None）"""
+    if len(rows) < MIN_DAYS:
+        return None
+
+    df = pd.DataFrame(rows)
+    df["sleep_hours"] = pd.to_numeric(df["sleep_hours"], errors="coerce")
+    df["stress"] = pd.to_numeric(df["stress"], errors="coerce")
+    df["exercise"] = df["exercise"].fillna(False).astype(bool).astype("int64")
+    df["cravings"] = pd.to_numeric(df["cravings"]).astype("int64")
+    df["resisted"] = pd.to_numeric(df["resisted"]).astype("int64")
+    df["avg_intensity"] = pd.to_numeric(df["avg_intensity"], errors="coerce")
+    df["resist_rate"] = (df["resisted"] / df["cravings"]).where(df["cravings"] > 0)
+
+    # ストレス（1〜5）は順序尺度のため順位相関を使う。欠損はペアごとに除外される
+    correlations = (
+        df[list(FACTORS) + list(OUTCOMES)]
+        .corr(method="spearman", min_periods=MIN_DAYS)
+        .loc[list(FACTORS), list(OUTCOMES)]
+    )
+
+    strongest = None
+    stacked = correlations.stack().dropna()
+    if len(stacked):
+        factor, outcome = stacked.abs().idxmax()
+        strongest = (factor, outcome, float(stacked[(factor, outcome)]))
+
+    sleep_band = pd.cut(df["sleep_hours"], bins=_SLEEP_BINS, labels=SLEEP_BANDS, right=False)
+    return CravingHabitAnalysis(
+        days=len(df),
+        correlations=correlations,
+        by_stress=_summarize(df, df["stress"], [1, 2, 3, 4, 5]),
+        by_sleep=_summarize(df, sleep_band, SLEEP_BANDS),
+        strongest=strongest,
+    )
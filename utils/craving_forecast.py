@@ -0,0 +1,177 @@
+"""
+曜日×時間帯ごとの衝動リスクの予測
+
+衝動ログを1件受け取るたびに、その曜日・時間帯（JST、1週間 = 168 区分）の
+強さの合計に加算していく。古い記録ほど重みを指数的に減らす（既定の半減期 28 日）ため、
+最近の生活パターンの変化に追従する。
+
+重みの減衰は「基準時刻からの経過で重みを増やして足し込み、読み出すときに割り戻す」
+形で扱うため、1件の更新・1区分の読み出しとも記録の件数によらず一定の手間で済む。
+全記録を読み直す必要があるのは、過去の記録をまとめて取り込んだときの作り直しだけ。
+
+    forecaster = CravingForecaster.from_state(state)   # state は保存していた dict（None なら空）
+    forecaster.update(logged_at, intensity)
+    risk = forecaster.forecast(datetime.now(_JST))      # 次の1時間のリスク
+    save(forecaster.to_state())
+"""
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+_JST = timezone(timedelta(hours=9))
+
+SLOTS = 7 * 24                  # 曜日×時間帯の区分数
+HALF_LIFE_DAYS = 28.0           # 重みが半分になるまでの日数
+MIN_LOGS = 10                   # 予測を出すのに必要な記録数
+MIN_HISTORY_DAYS = 7            # 予測を出すのに必要な記録期間（日）
+_WEEK_SECONDS = 7 * 86400
+_REBASE_EXPONENT = 50.0         # 基準時刻からの重みの倍率がこの指数を超えたら基準時刻を移す
+
+# リスクの段階
+RISK_LOW = "low"
+RISK_MEDIUM = "medium"
+RISK_HIGH = "high"
+
+# 段階の判定（平均的な時間帯に対する倍率, 1時間あたりの強さの合計の期待値）
+_HIGH = (2.0, 1.5)
+_MEDIUM = (1.3, 0.5)
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+
+def slot_of(ts: datetime) -> int:
+    """日時の曜日×時間帯の区分（JST、月曜0時が 0）"""
+    local = ts.astimezone(_JST)
+    return local.weekday() * 24 + local.hour
+
+
+@dataclass
+class RiskForecast:
+    """次の1時間の衝動リスク"""
+    level: str            # low / medium / high
+    expected: float       # 次の1時間に見込まれる衝動の強さの合計
+    ratio: float          # 平均的な時間帯に対する倍率
+    slot: int             # 次の1時間の大部分を占める区分
+
+    @property
+    def label(self) -> str:
+        """「金曜 21時台」のような区分の表示名"""
+        return f"{WEEKDAY_LABELS[self.slot // 24]}曜 {self.slot % 24}時台"
+
+
+class CravingForecaster:
+    """曜日×時間帯ごとの衝動の強さを指数減衰付きで数える
+
+    weights[s] は区分 s の記録の強さに exp(λ(記録時刻 - 基準時刻)) を掛けて足した値。
+    時刻 t における減衰済みの値は weights[s] × exp(-λ(t - 基準時刻)) になる。
+    """
+
+    def __init__(self, half_life_days: float = HALF_LIFE_DAYS):
+        self.half_life_days = half_life_days
+        self.decay = math.log(2) / (half_life_days * 86400)  # λ（1秒あたり）
+        self.weights = [0.0] * SLOTS
+        self.total = 0.0                          # weights の合計（平均の計算用）
+        self.ref: Optional[datetime] = None       # 基準時刻
+        self.first_logged_at: Optional[datetime] = None
+        self.count = 0                            # 取り込んだ記録数
+
+    # ─── 更新 ──────────────────────────────────────────────────────────────────
+
+    def update(self, logged_at: datetime, intensity: int) -> None:
+        """衝動ログ1件を取り込む（記録の件数によらず一定の手間）"""
+        if self.ref is None:
+            self.ref = logged_at
+        exponent = self.decay * (logged_at - self.ref).total_seconds()
+        if exponent > _REBASE_EXPONENT:
+            self._rebase(logged_at)
+            exponent = 0.0
+        weight = intensity * math.exp(exponent)
+        slot = slot_of(logged_at)
+        self.weights[slot] += weight
+        self.total += weight
+        self.count += 1
+        if self.first_logged_at is None or logged_at < self.first_logged_at:
+            self.first_logged_at = logged_at
+
+    def _rebase(self, new_ref: datetime) -> None:
+        """基準時刻を移して重みの桁あふれを防ぐ（まれにしか起きない）"""
+        factor = math.exp(-self.decay * (new_ref - self.ref).total_seconds())
+        self.weights = [w * factor for w in self.weights]
+        self.total *= factor
+        self.ref = new_ref
+
+    # ─── 予測 ──────────────────────────────────────────────────────────────────
+
+    def _exposure_weeks(self, now: datetime) -> float:
+        """記録期間を減衰付きで数えた週数（各区分が何回分観測されたか）"""
+        elapsed = max((now - self.first_logged_at).total_seconds(), 0.0)
+        return -math.expm1(-self.decay * elapsed) / (self.decay * _WEEK_SECONDS)
+
+    def ready(self, now: datetime) -> bool:
+        """予測を出せるだけの記録があるか"""
+        return (
+            self.count >= MIN_LOGS
+            and self.first_logged_at is not None
+            and now - self.first_logged_at >= timedelta(days=MIN_HISTORY_DAYS)
+        )
+
+    def slot_rate(self, slot: int, now: datetime) -> float:
+        """区分 slot の1時間に見込まれる衝動の強さの合計"""
+        factor = math.exp(-self.decay * (now - self.ref).total_seconds())
+        return self.weights[slot] * factor / self._exposure_weeks(now)
+
+    def forecast(self, now: datetime) -> Optional[RiskForecast]:
+        """now からの1時間の衝動リスク（記録が足りなければ None）"""
+        if not self.ready(now):
+            return None
+        # 1時間は今の区分の残りと次の区分にまたがるため、重なる時間で按分する
+        current = slot_of(now)
+        following = (current + 1) % SLOTS
+        fraction = now.astimezone(_JST).minute / 60
+        expected = (self.slot_rate(current, now) * (1 - fraction)
+                    + self.slot_rate(following, now) * fraction)
+        factor = math.exp(-self.decay * (now - self.ref).total_seconds())
+        mean = self.total * factor / self._exposure_weeks(now) / SLOTS
+        ratio = expected / mean if mean > 0 else 0.0
+
+        if ratio >= _HIGH[0] and expected >= _HIGH[1]:
+            level = RISK_HIGH
+        elif ratio >= _MEDIUM[0] and expected >= _MEDIUM[1]:
+            level = RISK_MEDIUM
+        else:
+            level = RISK_LOW
+        return RiskForecast(
+            level=level,
+            expected=expected,
+            ratio=ratio,
+            slot=following if fraction >= 0.5 else current,
+        )
+
+    # ─── 保存・復元 ────────────────────────────────────────────────────────────
+
+    def to_state(self) -> dict:
+        """保存用の dict（JSON にできる値だけ）"""
+        return {
+            "half_life_days": self.half_life_days,
+            "weights": self.weights,
+            "total": self.total,
+            "ref": self.ref.isoformat() if self.ref else None,
+            "first_logged_at": self.first_logged_at.isoformat() if self.first_logged_at else None,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_state(cls, state: Optional[dict]) -> "CravingForecaster":
+        """to_state() の dict から復元する（None なら空の状態）"""
+        if not state:
+            return cls()
+        forecaster = cls(state.get("half_life_days", HALF_LIFE_DAYS))
+        forecaster.weights = [float(w) for w in state["weights"]]
+        forecaster.total = float(state["total"])
+        forecaster.ref = datetime.fromisoformat(state["ref"]) if state.get("ref") else None
+        forecaster.first_logged_at = (
+            datetime.fromisoformat(state["first_logged_at"]) if state.get("first_logged_at") else None
+        )
+        forecaster.count = int(state.get("count", 0))
+        return forecaster
@@ -0,0 +1,287 @@
+"""
+全データのエクスポート（Parquet・CSV）
+
+smoke スキーマの各テーブルを id 順のページ単位（キーセット方式）で取得し、
+取得したページをその場でファイルに追記していく。テーブル全体をメモリに載せないため、
+何年分の記録があっても使うメモリは1ページ分で変わらない。
+
+出力先のディレクトリには、テーブルごとの <テーブル名>.parquet / <テーブル名>.csv と、
+件数・ファイルサイズ・SHA-256 を記録した manifest.json を書き出す。
+列と型は取得したページからではなく、テーブルごとに宣言した列（schema.sql と同じ）で決める。
+
+    manifest = export_all(Path("exports/20261019-120000"))
+"""
+import csv
+import hashlib
+import json
+import re
+import shutil
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
+
+from utils.supabase_client import get_table_page
+
+if TYPE_CHECKING:
+    import pyarrow as pa  # 実行時は Parquet を書くときに初めて読み込む（Streamlit の依存に含まれる）
+
+_JST = timezone(timedelta(hours=9))
+
+_PAGE_SIZE = 1000    # 1回に取得する行数
+_HASH_CHUNK = 1 << 20  # チェックサム計算で1回に読むバイト数
+KEEP_EXPORTS = 3     # 残しておく過去のエクスポートの数
+
+_STAMP = re.compile(r"\d{8}-\d{6}")  # default_export_dir が付ける時刻（20261019-120000）
+
+FORMATS = ("parquet", "csv")
+
+# エクスポートするテーブルと、書き出す列（schema.sql の列と型）
+# 型は PostgREST が返す JSON の値に合わせる：日付・日時・UUID は ISO 8601 などの文字列、
+# NUMERIC は数値、JSONB は JSON 文字列として書き出す。検索用に DB が作る列
+# （diary_entries.message_grams など）と partner_snapshots（他のテーブルから作り直せる）は含めない
+_TABLE_COLUMNS: dict[str, tuple[tuple[str, str], ...]] = {
+    "user_settings": (
+        ("id", "text"), ("quit_date", "text"), ("quit_datetime", "text"),
+        ("cigarettes_per_day", "int"), ("price_per_pack", "int"), ("cigarettes_per_pack", "int"),
+        ("created_at", "text"), ("updated_at", "text"),
+    ),
+    "settings_history": (
+        ("id", "text"), ("effective_from", "text"), ("cigarettes_per_day", "int"),
+        ("price_per_pack", "int"), ("cigarettes_per_pack", "int"), ("created_at", "text"),
+    ),
+    "craving_logs": (
+        ("id", "text"), ("logged_at", "text"), ("intensity", "int"), ("trigger", "text"),
+        ("resisted", "bool"), ("message", "text"), ("created_at", "text"),
+    ),
+    "fertility_logs": (
+        ("id", "text"), ("date", "text"), ("zinc", "bool"), ("folate", "bool"),
+        ("sleep_hours", "float"), ("exercise", "bool"), ("stress", "int"), ("notes", "text"),
+        ("created_at", "text"), ("updated_at", "text"),
+    ),
+    "milestones": (
+        ("id", "text"), ("milestone_key", "text"), ("achieved_at", "text"), ("created_at", "text"),
+    ),
+    "custom_milestones": (
+        ("id", "text"), ("milestone_key", "text"), ("kind", "text"), ("threshold", "int"),
+        ("title", "text"), ("description", "text"), ("emoji", "text"), ("created_at", "text"),
+    ),
+    "diary_entries": (
+        ("id", "text"), ("date", "text"), ("message", "text"), ("mood", "text"), ("created_at", "text"),
+    ),
+    "quit_attempts": (
+        ("id", "text"), ("start_date", "text"), ("end_date", "text"), ("days_lasted", "int"),
+        ("created_at", "text"),
+    ),
+    "coping_strategies": (
+        ("id", "text"), ("trigger", "text"), ("strategy", "text"), ("created_at", "text"),
+    ),
+    "partner_shares": (
+        ("id", "text"), ("share_code", "text"), ("is_active", "bool"),
+        ("created_at", "text"), ("updated_at", "text"),
+    ),
+    "partner_messages": (
+        ("id", "text"), ("share_code", "text"), ("sender", "text"), ("message", "text"),
+        ("sent_at", "text"),
+    ),
+    "notification_outbox": (
+        ("id", "text"), ("idempotency_key", "text"), ("kind", "text"), ("payload", "text"),
+        ("status", "text"), ("attempts", "int"), ("last_error", "text"), ("claimed_at", "text"),
+        ("lease_until", "text"), ("sent_at", "text"), ("created_at", "text"),
+    ),
+}
+EXPORT_TABLES = tuple(_TABLE_COLUMNS)
+
+# 進捗の通知先（テーブル名, そのテーブルでここまでに書き出した行数）
+ProgressFunc = Callable[[str, int], None]
+
+
+def _cell(value: Any) -> Any:
+    """JSONB の値（dict・list）は JSON 文字列にする"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _columns(table_name: str) -> list[str]:
+    return [name for name, _ in _TABLE_COLUMNS[table_name]]
+
+
+class _CsvSink:
+    """CSV への追記（列は宣言した列で固定し、値のない列は空欄にする）"""
+
+    def __init__(self, path: Path, columns: Sequence[tuple[str, str]]):
+        self.path = path
+        self._file = path.open("w", encoding="utf-8-sig", newline="")  # Excel で文字化けしないよう BOM 付き
+        self._writer = csv.DictWriter(self._file, fieldnames=[name for name, _ in columns],
+                                      extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows: list[dict]) -> None:
+        self._writer.writerows({k: _cell(v) for k, v in row.items()} for row in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetSink:
+    """Parquet への追記（ページごとに1つの row group として書く）
+
+    列の型は宣言した列から決めるため、最初のページで全て NULL だった列や
+    途中のページで初めて値が入った列も同じ型で書ける。行が1件もなくても列だけのファイルを作る。
+    """
+
+    def __init__(self, path: Path, columns: Sequence[tuple[str, str]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"text": pa.string(), "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_()}
+        self.path = path
+        self._schema: "pa.Schema" = pa.schema([pa.field(name, types[kind]) for name, kind in columns])
+        self._strings = [name for name, kind in columns if kind == "text"]
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: list[dict]) -> None:
+        import pyarrow as pa
+
+        rows = [{k: _cell(v) for k, v in row.items()} for row in rows]
+        # 文字列の列に数値などが来た場合は文字列にそろえる
+        for row in rows:
+            for col in self._strings:
+                value = row.get(col)
+                if value is not None and not isinstance(value, str):
+                    row[col] = str(value)
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _sha256(path: Path) -> str:
+    """ファイルの SHA-256（少しずつ読むのでファイルの大きさによらずメモリは一定）"""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_table(table_name: str, out_dir: Path, formats: Sequence[str] = FORMATS,
+                 page_size: int = _PAGE_SIZE, progress: Optional[ProgressFunc] = None) -> dict:
+    """1テーブルをページ単位で取得しながらファイルに書き出す
+
+    Returns:
+        manifest に載せるテーブルの情報（件数・ファイルごとのサイズと SHA-256）
+    """
+    columns = _TABLE_COLUMNS[table_name]
+    sinks = {}
+    if "parquet" in formats:
+        sinks["parquet"] = _ParquetSink(out_dir / f"{table_name}.parquet", columns)
+    if "csv" in formats:
+        sinks["csv"] = _CsvSink(out_dir / f"{table_name}.csv", columns)
+
+    rows_written = 0
+    after_id = None
+    try:
+        while True:
+            page = get_table_page(table_name, after_id=after_id, limit=page_size,
+                                  columns=",".join(_columns(table_name)))
+            if not page:
+                break
+            for sink in sinks.values():
+                sink.write(page)
+            rows_written += len(page)
+            after_id = page[-1]["id"]
+            if progress:
+                progress(table_name, rows_written)
+            if len(page) < page_size:
+                break
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+    files = {}
+    for fmt, sink in sinks.items():
+        files[fmt] = {
+            "path": sink.path.name,
+            "bytes": sink.path.stat().st_size,
+            "sha256": _sha256(sink.path),
+        }
+    return {"rows": rows_written, "files": files}
+
+
+def export_all(out_dir: Path, formats: Sequence[str] = FORMATS,
+               tables: Sequence[str] = EXPORT_TABLES, page_size: int = _PAGE_SIZE,
+               progress: Optional[ProgressFunc] = None) -> dict:
+    """全テーブルを書き出し、manifest.json を作る
+
+    テーブルは1つずつ順に読むため、読んでいる間に追加された行が含まれるかどうかは
+    タイミングによる（テーブル間で厳密に同じ時点のスナップショットにはならない）。
+
+    Returns:
+        manifest（manifest.json と同じ内容）
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"未対応の形式です: {', '.join(sorted(unknown))}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "exported_at": datetime.now(_JST).isoformat(timespec="seconds"),
+        "schema": "smoke",
+        "formats": list(formats),
+        "tables": {},
+    }
+    for table_name in tables:
+        manifest["tables"][table_name] = export_table(
+            table_name, out_dir, formats=formats, page_size=page_size, progress=progress
+        )
+    (out_dir / "manifest.json").write_text(
+        json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    return manifest
+
+
+def zip_export(out_dir: Path, remove_dir: bool = False) -> Path:
+    """書き出したディレクトリを1つの zip にまとめる（ファイルは少しずつ読み込んで圧縮する）
+
+    Args:
+        remove_dir: zip にまとめた後、元のディレクトリを削除する（zip だけを残す）
+    """
+    zip_path = out_dir.with_suffix(".zip")
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path in sorted(out_dir.iterdir()):
+            zf.write(path, arcname=f"{out_dir.name}/{path.name}")
+    if remove_dir:
+        shutil.rmtree(out_dir)
+    return zip_path
+
+
+def default_export_dir(base: Path = Path("exports")) -> Path:
+    """時刻付きの出力先（例：exports/20261019-120000）"""
+    return base / datetime.now(_JST).strftime("%Y%m%d-%H%M%S")
+
+
+def prune_exports(base: Path = Path("exports"), keep: int = KEEP_EXPORTS) -> list[Path]:
+    """base 直下の時刻付きのエクスポート（ディレクトリ・zip）を新しい keep 回分だけ残して削除する
+
+    default_export_dir が付けた名前のものだけを対象にし、それ以外のファイルには触れない。
+
+    Returns:
+        削除したパス
+    """
+    if not base.is_dir():
+        return []
+    by_stamp: dict[str, list[Path]] = {}
+    for path in base.iterdir():
+        stamp = path.stem if path.suffix == ".zip" else path.name
+        if _STAMP.fullmatch(stamp) and (path.is_dir() or path.suffix == ".zip"):
+            by_stamp.setdefault(stamp, []).append(path)
+    removed = []
+    for stamp in sorted(by_stamp, reverse=True)[max(keep, 0):]:
+        for path in by_stamp[stamp]:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+            removed.append(path)
+    return removed
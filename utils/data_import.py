@@ -0,0 +1,326 @@
+"""
+過去の記録の一括インポート（CSV・JSON）
+
+他の禁煙アプリなどから移行するための取り込み処理。ファイルを1行ずつ読みながら
+schema.sql の制約（強さ・ストレスは1〜5、妊活チェックは1日1件 など）で検証し、
+正しい行だけを chunk_size 件ずつまとめて Supabase に書き込む。
+
+- 衝動ログ：id がなければ内容（と同じ内容の何件目か）から決まる UUID を振るため、
+  同じファイルを取り込み直しても重複しない
+- 妊活チェック：同じ日付の記録が既にある場合、overwrite=True なら上書き、False なら読み飛ばす
+
+パートナービューのスナップショット・衝動リスク予測など、記録から作られる集計は
+行ごとではなく取り込みの最後に1回だけ作り直す。
+
+    report = import_file(Path("cravings.csv"), "craving_logs")
+"""
+import csv
+import io
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, Optional
+
+from utils.calculations import parse_timestamp, today_jst
+from utils.supabase_client import (
+    bulk_upsert_rows,
+    rebuild_craving_forecast,
+    refresh_partner_snapshot,
+)
+
+_JST = timezone(timedelta(hours=9))
+
+_CHUNK_SIZE = 500    # 1回の書き込みにまとめる行数
+_MAX_ERRORS = 100    # レポートに残すエラーの件数
+
+# 取り込み先のテーブルと、そのテーブルで使う列
+IMPORT_TABLES = {
+    "craving_logs": ("logged_at", "intensity", "trigger", "resisted", "message"),
+    "fertility_logs": ("date", "zinc", "folate", "sleep_hours", "exercise", "stress", "notes"),
+}
+
+# 衝動ログの id を内容から決めるための名前空間
+_CRAVING_NAMESPACE = uuid.UUID("6f1c2a8e-3b7d-4e59-9a41-0c5d8e2f7b13")
+
+_TRUE = {"true", "1", "yes", "y", "t", "はい", "○"}
+_FALSE = {"false", "0", "no", "n", "f", "いいえ", "×", ""}
+
+# 進捗の通知先（読み込んだ行数, 書き込んだ行数）
+ProgressFunc = Callable[[int, int], None]
+
+
+class RowError(ValueError):
+    """1行分の検証エラー"""
+
+
+@dataclass
+class ImportReport:
+    """取り込み結果"""
+    table_name: str
+    read: int = 0        # 読み込んだ行数
+    valid: int = 0       # 検証を通った行数
+    written: int = 0     # 新しく書き込んだ（上書きを含む）行数
+    skipped: int = 0     # 既に同じ記録があったため読み飛ばした行数
+    errors: list[tuple[int, str]] = field(default_factory=list)  # （行番号, 内容）
+    error_count: int = 0
+    dry_run: bool = False
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < _MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+# ─── 読み込み ────────────────────────────────────────────────────────────────
+
+def detect_format(name: str) -> str:
+    """ファイル名の拡張子から形式（csv / json / jsonl）を決める"""
+    suffix = Path(name).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix == ".json":
+        return "json"
+    return "csv"
+
+
+def read_records(stream: IO[bytes], fmt: str) -> Iterator[tuple[int, dict]]:
+    """ファイルから（行番号, レコード）を順に読み出す
+
+    CSV・JSON Lines は1行ずつ読むため、ファイルの大きさによらずメモリは一定。
+    JSON（配列）はファイル全体を読み込んでから返す。
+    """
+    if fmt not in ("csv", "jsonl", "json"):
+        raise ValueError(f"未対応の形式です: {fmt}")
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for record in reader:
+                yield reader.line_num, record
+        elif fmt == "jsonl":
+            for line_no, line in enumerate(text, start=1):
+                if line.strip():
+                    try:
+                        yield line_no, json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line_no, None  # 壊れた行はエラーとして数え、残りは続けて読む
+        else:
+            data = json.load(text)
+            if isinstance(data, dict):
+                data = next((v for v in data.values() if isinstance(v, list)), [])  # {"logs": [...]} 形式
+            for i, record in enumerate(data, start=1):
+                yield i, record
+    finally:
+        text.detach()  # 元のストリームは閉じない（呼び出し側のもの）
+
+
+# ─── 検証 ────────────────────────────────────────────────────────────────────
+
+def _blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _to_bool(value: Any, name: str, default: bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    if _blank(value):
+        return default
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise RowError(f"{name} は true / false で指定してください（{value!r}）")
+
+
+def _to_level(value: Any, name: str, required: bool) -> Optional[int]:
+    """1〜5 の整数（CHECK (… BETWEEN 1 AND 5)）"""
+    if _blank(value):
+        if required:
+            raise RowError(f"{name} は必須です")
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} は数値で指定してください（{value!r}）") from None
+    if not number.is_integer() or not 1 <= number <= 5:
+        raise RowError(f"{name} は 1〜5 の整数で指定してください（{value!r}）")
+    return int(number)
+
+
+def _to_timestamp(value: Any) -> str:
+    """日時を ISO 8601 にそろえる（タイムゾーンがなければ JST、日付だけなら 0 時）"""
+    if _blank(value):
+        raise RowError("logged_at は必須です")
+    text = str(value).strip().replace("/", "-")
+    try:
+        if len(text) == 10:
+            ts = datetime.combine(date.fromisoformat(text), datetime.min.time())
+        else:
+            ts = parse_timestamp(text.replace(" ", "T", 1))
+    except ValueError:
+        raise RowError(f"logged_at の日時の形式が正しくありません（{value!r}）") from None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=_JST)
+    if ts > datetime.now(_JST) + timedelta(days=1):
+        raise RowError(f"logged_at が未来の日時です（{value!r}）")
+    return ts.isoformat()
+
+
+def _to_date(value: Any) -> str:
+    """日付を YYYY-MM-DD にそろえる（今日（JST）より後の日付は受け付けない）"""
+    if _blank(value):
+        raise RowError("date は必須です")
+    try:
+        day = date.fromisoformat(str(value).strip().replace("/", "-")[:10])
+    except ValueError:
+        raise RowError(f"date の日付の形式が正しくありません（{value!r}）") from None
+    if day > today_jst():
+        raise RowError(f"date が未来の日付です（{value!r}）")
+    return day.isoformat()
+
+
+def _to_sleep_hours(value: Any) -> Optional[float]:
+    """睡眠時間（NUMERIC(3,1)・0〜24 時間）"""
+    if _blank(value):
+        return None
+    try:
+        hours = round(float(value), 1)
+    except (TypeError, ValueError):
+        raise RowError(f"sleep_hours は数値で指定してください（{value!r}）") from None
+    if not 0 <= hours <= 24:
+        raise RowError(f"sleep_hours は 0〜24 で指定してください（{value!r}）")
+    return hours
+
+
+def _text(value: Any) -> str:
+    return "" if _blank(value) else str(value).strip()
+
+
+def _validate_craving(record: dict) -> dict:
+    row = {
+        "logged_at": _to_timestamp(record.get("logged_at")),
+        "intensity": _to_level(record.get("intensity"), "intensity", required=True),
+        "trigger": _text(record.get("trigger")) or "その他",
+        "resisted": _to_bool(record.get("resisted"), "resisted", default=True),
+        "message": _text(record.get("message")),
+    }
+    given_id = _text(record.get("id"))
+    try:
+        row["id"] = str(uuid.UUID(given_id)) if given_id else None  # None なら取り込み時に振る
+    except ValueError:
+        raise RowError(f"id は UUID で指定してください（{given_id!r}）") from None
+    return row
+
+
+def _content_id(row: dict, occurrences: dict[str, int]) -> str:
+    """衝動ログの内容から決まる id（同じ内容の行はファイル内の出現順で区別する）"""
+    key = "|".join(str(row[c]) for c in IMPORT_TABLES["craving_logs"])
+    n = occurrences.get(key, 0)
+    occurrences[key] = n + 1
+    return str(uuid.uuid5(_CRAVING_NAMESPACE, f"{key}|{n}"))
+
+
+def _validate_fertility(record: dict) -> dict:
+    return {
+        "date": _to_date(record.get("date")),
+        "zinc": _to_bool(record.get("zinc"), "zinc", default=False),
+        "folate": _to_bool(record.get("folate"), "folate", default=False),
+        "sleep_hours": _to_sleep_hours(record.get("sleep_hours")),
+        "exercise": _to_bool(record.get("exercise"), "exercise", default=False),
+        "stress": _to_level(record.get("stress"), "stress", required=False),
+        "notes": _text(record.get("notes")),
+    }
+
+
+_VALIDATORS = {
+    "craving_logs": _validate_craving,
+    "fertility_logs": _validate_fertility,
+}
+_UNIQUE_KEYS = {
+    "craving_logs": "id",
+    "fertility_logs": "date",  # UNIQUE (date)：1日1件
+}
+
+
+# ─── 取り込み ────────────────────────────────────────────────────────────────
+
+def import_records(records: Iterable[tuple[int, dict]], table_name: str,
+                   overwrite: bool = False, chunk_size: int = _CHUNK_SIZE,
+                   dry_run: bool = False, progress: Optional[ProgressFunc] = None) -> ImportReport:
+    """レコードを検証し、正しい行を chunk_size 件ずつ書き込む
+
+    Args:
+        records: （行番号, レコード）の列
+        table_name: 取り込み先（craving_logs / fertility_logs）
+        overwrite: 既存の記録と重なった行を上書きするか（False なら読み飛ばす）
+        chunk_size: 1回の書き込みにまとめる行数
+        dry_run: 検証だけ行い書き込まない
+        progress: 進捗の通知先（chunk を書き込むたびに呼ばれる）
+    """
+    if table_name not in _VALIDATORS:
+        raise ValueError(f"取り込めないテーブルです: {table_name}")
+    validate = _VALIDATORS[table_name]
+    unique_key = _UNIQUE_KEYS[table_name]
+    report = ImportReport(table_name=table_name, dry_run=dry_run)
+    seen: set[str] = set()  # ファイル内の重複（一意キーのみ保持するので行数に比例して小さく増える）
+    occurrences: dict[str, int] = {}  # 同じ内容の衝動ログが何件目か
+    chunk: list[dict] = []
+
+    def flush() -> None:
+        if not dry_run and chunk:
+            written = bulk_upsert_rows(table_name, chunk, on_conflict=unique_key,
+                                       ignore_duplicates=not overwrite)
+            report.written += written
+            report.skipped += len(chunk) - written
+        chunk.clear()
+        if progress:
+            progress(report.read, report.written)
+
+    for line_no, record in records:
+        report.read += 1
+        if not isinstance(record, dict):
+            report.add_error(line_no, "レコードを読み取れません（JSON のオブジェクトではありません）")
+            continue
+        try:
+            row = validate(record)
+        except RowError as e:
+            report.add_error(line_no, str(e))
+            continue
+        if unique_key == "id" and row["id"] is None:
+            row["id"] = _content_id(row, occurrences)
+        if row[unique_key] in seen:
+            report.add_error(line_no, f"{unique_key}={row[unique_key]} がファイル内で重複しています")
+            continue
+        seen.add(row[unique_key])
+        report.valid += 1
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    if report.written:
+        rebuild_aggregates(table_name)
+    return report
+
+
+def rebuild_aggregates(table_name: str) -> None:
+    """記録から作られる集計を作り直す（取り込みの最後に1回だけ呼ぶ）
+
+    妊活チェックの集計・グラフのキャッシュは記録の版（件数・最新の更新時刻）を
+    キーにしているため、ここで消さなくても次の表示で作り直される。
+    """
+    if table_name == "craving_logs":
+        # 過去の記録は時刻順に届かないため、1件ずつではなく全件から作り直す
+        rebuild_craving_forecast()
+    refresh_partner_snapshot()
+
+
+def import_file(path: Path, table_name: str, fmt: Optional[str] = None,
+                **kwargs: Any) -> ImportReport:
+    """ファイルを取り込む（形式は省略すると拡張子から判断する）"""
+    with path.open("rb") as stream:
+        return import_records(read_records(stream, fmt or detect_format(path.name)),
+                              table_name, **kwargs)
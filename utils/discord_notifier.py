@@ -1,96 +1,648 @@
 """
 Discord Webhook通知ユーティリティ
 環境変数 DISCORD_WEBHOOK_URL が設定されている場合のみ動作する
+
+マイルストーン通知・リマインダーはバックグラウンドのワーカースレッドが送信するため、
+画面の描画が Webhook の応答待ちで止まることはない。
+短時間にまとまって届いた通知は、複数の埋め込み（embed）を持つ1通のメッセージに束ねて送る。
+
+重複させたくない通知は送信箱（smoke.notification_outbox）に重複防止キー付きで登録し、
+deliver_outbox() で送信する。キーごとに1回だけ送られるため、セッションやプロセスが
+いくつあっても同じ通知が二重に届くことはない。
 """
-import os
-from typing import Optional
+import atexit
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Optional, Sequence
+
+from utils.env import get_env
+from utils.metrics import (
+    DISCORD_MESSAGES,
+    DISCORD_NOTIFICATIONS,
+    DISCORD_REQUESTS,
+    DISCORD_RETRIES,
+    DISCORD_SEND_SECONDS,
+)
+
+if TYPE_CHECKING:
+    import requests  # 実行時は送信するときに初めて読み込む（起動を軽くするため）
+
+logger = logging.getLogger("discord")
+
+# 送信設定
+_TIMEOUT = 10            # 1リクエストのタイムアウト（秒）
+_MAX_ATTEMPTS = 5        # 最大試行回数
+_BACKOFF_BASE = 1.0      # 指数バックオフの初期待ち時間（秒）
+_BACKOFF_MAX = 60.0      # バックオフ・retry_after の上限（秒）
+_QUEUE_SIZE = 100        # 送信待ちキューの上限
+_HISTORY_SIZE = 50       # 保持する送信結果の件数
+_COALESCE_WINDOW = 0.5   # 通知を束ねるために待つ時間（秒）
+_MAX_EMBEDS = 10         # 1メッセージあたりの embed 数の上限（Discord の制限）
+_MAX_EMBED_CHARS = 6000  # 1メッセージあたりの embed 文字数合計の上限（Discord の制限）
+_EMBED_COLOR = 0xFF69B4  # embed の色
+_OUTBOX_MAX_ATTEMPTS = 5  # 送信箱の通知を失敗扱いにするまでの試行回数
+_OUTBOX_BATCH = _MAX_EMBEDS  # 送信箱から1回に確保する件数（通常は1メッセージに収まる）
+_OUTBOX_LEASE_MARGIN = 60    # 確保の期限に足す余裕（秒）
+# 1メッセージの送信にかかりうる最大時間（秒）：全試行のタイムアウトと、その間の最大の待ち時間
+_MAX_SEND_SECONDS = (
+    _COALESCE_WINDOW + _MAX_ATTEMPTS * _TIMEOUT + (_MAX_ATTEMPTS - 1) * _BACKOFF_MAX
+)
+
+# 送信状態
+STATUS_PENDING = "pending"  # 送信待ち・再試行中
+STATUS_SENT = "sent"        # 送信成功
+STATUS_FAILED = "failed"    # 再試行しても失敗
+STATUS_DROPPED = "dropped"  # キューが満杯で破棄
+
+
+@dataclass
+class DeliveryTicket:
+    """非同期送信1件の受付票。ワーカーが送信状態を更新する"""
+    id: int
+    label: str
+    status: str = STATUS_PENDING
+    attempts: int = 0
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
 
-import requests
+    @property
+    def done(self) -> bool:
+        return self.status != STATUS_PENDING
+
+
+@dataclass
+class SendResult:
+    """同期送信1回の結果（真偽値としては送信成功かどうか）"""
+    ok: bool
+    error: str = ""                      # 失敗の内容（"HTTP 429" など）
+    retry_after: Optional[float] = None  # レート制限（429）のときに指定された待ち時間（秒）
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.retry_after is not None
+
+
+@dataclass
+class DispatcherStats:
+    """通知の束ね効果の集計"""
+    notifications: int = 0  # 送信した通知の件数
+    messages: int = 0       # 実際に送ったメッセージ（Webhook 呼び出し）の件数
+
+    @property
+    def saved(self) -> int:
+        """束ねたことで減らせたメッセージ数"""
+        return self.notifications - self.messages
 
 
 def is_discord_configured() -> bool:
     """Discord Webhook URLが設定されているか確認する"""
-    return bool(os.environ.get("DISCORD_WEBHOOK_URL"))
+    return bool(get_env("DISCORD_WEBHOOK_URL"))
+
+
+def _new_session() -> "requests.Session":
+    """接続を使い回す requests.Session を作る"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _retry_after(response: "requests.Response") -> float:
+    """429 応答から待ち時間（秒）を取り出す
+
+    Discord は JSON 本文の retry_after（秒・小数）と Retry-After ヘッダーを返す。
+    """
+    try:
+        wait = float(response.json().get("retry_after", 0))
+    except (ValueError, AttributeError):
+        wait = 0.0
+    if not wait:
+        try:
+            wait = float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            wait = 1.0
+    return min(max(wait, 0.0), _BACKOFF_MAX)
+
+
+def _embed_chars(embed: dict) -> int:
+    """Discord の文字数制限の対象となる embed 内の文字数"""
+    footer = embed.get("footer") or {}
+    return sum(len(embed.get(k) or "") for k in ("title", "description")) + len(footer.get("text") or "")
+
+
+def chunk_embeds(embeds: Sequence[dict], max_embeds: int = _MAX_EMBEDS,
+                 max_chars: int = _MAX_EMBED_CHARS) -> list[list[int]]:
+    """embed の並びを、1メッセージの上限（件数・文字数）に収まる塊に分ける
+
+    Returns:
+        各メッセージに含める embed のインデックスのリスト
+    """
+    chunks: list[list[int]] = []
+    current: list[int] = []
+    chars = 0
+    for i, embed in enumerate(embeds):
+        size = _embed_chars(embed)
+        if current and (len(current) >= max_embeds or chars + size > max_chars):
+            chunks.append(current)
+            current, chars = [], 0
+        current.append(i)
+        chars += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _post_with_retry(session: "requests.Session", webhook_url: str, payload: dict,
+                     tickets: Sequence[DeliveryTicket] = (),
+                     max_attempts: int = _MAX_ATTEMPTS,
+                     sleep=time.sleep) -> bool:
+    """Webhook に POST し、429・5xx・通信エラーは待ってから再試行する
+
+    Returns:
+        送信成功なら True、再試行しても失敗なら False
+    """
+    started = time.perf_counter()
+    ok = _attempt_post(session, webhook_url, payload, tickets, max_attempts, sleep)
+    DISCORD_SEND_SECONDS.observe(time.perf_counter() - started)
+    DISCORD_MESSAGES.inc(result="sent" if ok else "failed")
+    return ok
+
+
+def _attempt_post(session: "requests.Session", webhook_url: str, payload: dict,
+                  tickets: Sequence[DeliveryTicket], max_attempts: int, sleep) -> bool:
+    """_post_with_retry の本体（HTTP 呼び出しごとの結果と再試行をメトリクスに記録する）"""
+    import requests
+
+    error = ""
+    for attempt in range(max_attempts):
+        if attempt:
+            DISCORD_RETRIES.inc()
+        for ticket in tickets:
+            ticket.attempts = attempt + 1
+        try:
+            response = session.post(webhook_url, json=payload, timeout=_TIMEOUT)
+        except requests.RequestException as e:
+            error = type(e).__name__
+            DISCORD_REQUESTS.inc(result="error")
+            wait = min(_BACKOFF_BASE * 2 ** attempt, _BACKOFF_MAX)
+        else:
+            DISCORD_REQUESTS.inc(result=str(response.status_code))
+            if response.status_code in (200, 204):
+                return True
+            error = f"HTTP {response.status_code}"
+            if response.status_code == 429:
+                wait = _retry_after(response)
+            elif response.status_code >= 500:
+                wait = min(_BACKOFF_BASE * 2 ** attempt, _BACKOFF_MAX)
+            else:
+                break  # 4xx は再試行しても成功しない
+        for ticket in tickets:
+            ticket.error = error
+        if attempt + 1 < max_attempts:
+            sleep(wait)
+    return False
+
+
+class DiscordDispatcher:
+    """Webhook 送信をバックグラウンドで行うディスパッチャー
+
+    上限付きキューに積まれた送信をワーカースレッド1本が順に処理する。
+    最初の通知を受け取ってから coalesce_window 秒の間に届いた通知は、
+    同じ Webhook 宛てのものを embed の上限ごとに1通へ束ねて送る。
+    submit() は即座に DeliveryTicket を返し、送信結果は後から ticket.status で確認できる。
+    """
+
+    def __init__(self, queue_size: int = _QUEUE_SIZE, max_attempts: int = _MAX_ATTEMPTS,
+                 coalesce_window: float = _COALESCE_WINDOW):
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._max_attempts = max_attempts
+        self._coalesce_window = coalesce_window
+        self.stats = DispatcherStats()
+        self._session = _new_session()
+        self._ids = itertools.count(1)
+        self._history: OrderedDict[int, DeliveryTicket] = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="discord-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, webhook_url: str, embed: dict, label: str = "") -> DeliveryTicket:
+        """embed 1件の送信をキューに積み、受付票を返す（ブロックしない）"""
+        ticket = DeliveryTicket(id=next(self._ids), label=label)
+        self._remember(ticket)
+        try:
+            self._queue.put_nowait((webhook_url, embed, ticket))
+        except queue.Full:
+            ticket.status = STATUS_DROPPED
+            ticket.error = "queue full"
+            ticket.finished_at = time.time()
+            DISCORD_NOTIFICATIONS.inc(result=STATUS_DROPPED)
+        return ticket
+
+    def recent(self) -> list[DeliveryTicket]:
+        """直近の送信結果を新しい順に返す"""
+        with self._lock:
+            return list(reversed(self._history.values()))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューが空になるまで待つ。timeout 内に終われば True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def wait(self, tickets: Sequence[DeliveryTicket], timeout: Optional[float] = None) -> bool:
+        """指定した受付票の送信がすべて終わるまで待つ。timeout 内に終われば True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(ticket.done for ticket in tickets):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _remember(self, ticket: DeliveryTicket) -> None:
+        with self._lock:
+            self._history[ticket.id] = ticket
+            while len(self._history) > _HISTORY_SIZE:
+                self._history.popitem(last=False)
+
+    def _collect(self) -> list[tuple[str, dict, DeliveryTicket]]:
+        """最初の1件を待ち、その後 coalesce_window 秒の間に届いた分もまとめて取り出す"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._coalesce_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send_batch(self, webhook_url: str, embeds: list[dict],
+                    tickets: list[DeliveryTicket]) -> None:
+        for chunk in chunk_embeds(embeds):
+            chunk_tickets = [tickets[i] for i in chunk]
+            try:
+                ok = _post_with_retry(self._session, webhook_url,
+                                      {"embeds": [embeds[i] for i in chunk]},
+                                      chunk_tickets, max_attempts=self._max_attempts)
+                status, error = (STATUS_SENT if ok else STATUS_FAILED), None
+            except Exception as e:  # ワーカーを止めないため想定外の例外も失敗として扱う
+                status, error = STATUS_FAILED, repr(e)
+            with self._lock:
+                self.stats.notifications += len(chunk)
+                self.stats.messages += 1
+            DISCORD_NOTIFICATIONS.inc(len(chunk), result=status)
+            for ticket in chunk_tickets:
+                ticket.status = status
+                if error:
+                    ticket.error = error
+                ticket.finished_at = time.time()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Webhook ごとに受付順を保ったまま束ねる
+            by_url: dict[str, tuple[list[dict], list[DeliveryTicket]]] = {}
+            for webhook_url, embed, ticket in batch:
+                embeds, tickets = by_url.setdefault(webhook_url, ([], []))
+                embeds.append(embed)
+                tickets.append(ticket)
+            try:
+                for webhook_url, (embeds, tickets) in by_url.items():
+                    self._send_batch(webhook_url, embeds, tickets)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
 
+_dispatcher: Optional[DiscordDispatcher] = None
+_dispatcher_lock = threading.Lock()
 
-def send_discord_message(webhook_url: str, content: str) -> bool:
-    """Discord Webhookにメッセージを送信する
+
+def get_dispatcher() -> DiscordDispatcher:
+    """プロセス内で共有するディスパッチャーを返す（初回呼び出し時に起動）"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = DiscordDispatcher()
+            # プロセス終了時に送信待ちを少しだけ待つ
+            atexit.register(_dispatcher.flush, 5)
+        return _dispatcher
+
+
+def get_recent_deliveries() -> list[DeliveryTicket]:
+    """直近のバックグラウンド送信結果を新しい順に返す（未起動なら空）"""
+    return _dispatcher.recent() if _dispatcher else []
+
+
+def get_dispatcher_stats() -> DispatcherStats:
+    """通知の束ね効果（通知件数・メッセージ件数・削減数）を返す"""
+    return _dispatcher.stats if _dispatcher else DispatcherStats()
+
+
+def send_discord_message(webhook_url: str, content: str) -> SendResult:
+    """Discord Webhookにメッセージを送信する（同期・結果を待つ）
+
+    画面のボタンから呼ばれるため、待ち時間が最長でもタイムアウト1回分で済むよう
+    再試行や 429 の待機はせず1回だけ送る。レート制限は結果として呼び出し側に返す。
 
     Args:
         webhook_url: Discord Webhook URL
         content: 送信するメッセージ本文
+    """
+    import requests
+
+    started = time.perf_counter()
+    try:
+        with _new_session() as session:
+            response = session.post(webhook_url, json={"content": content}, timeout=_TIMEOUT)
+    except requests.RequestException as e:
+        DISCORD_REQUESTS.inc(result="error")
+        result = SendResult(ok=False, error=type(e).__name__)
+    else:
+        DISCORD_REQUESTS.inc(result=str(response.status_code))
+        if response.status_code in (200, 204):
+            result = SendResult(ok=True)
+        elif response.status_code == 429:
+            result = SendResult(ok=False, error="HTTP 429", retry_after=_retry_after(response))
+        else:
+            result = SendResult(ok=False, error=f"HTTP {response.status_code}")
+    DISCORD_SEND_SECONDS.observe(time.perf_counter() - started)
+    DISCORD_MESSAGES.inc(result="sent" if result.ok else "failed")
+    return result
+
+
+def send_discord_embed_async(webhook_url: str, title: str, description: str,
+                             label: str = "") -> DeliveryTicket:
+    """Discord Webhookへの embed 送信をバックグラウンドに依頼する
+
+    近いタイミングの通知は1通のメッセージにまとめて送られる。
 
     Returns:
-        送信成功なら True、失敗なら False
+        送信状態を後から確認できる DeliveryTicket
     """
-    try:
-        response = requests.post(
-            webhook_url,
-            json={"content": content},
-            timeout=10,
-        )
-        return response.status_code == 204
-    except requests.RequestException:
-        return False
+    return get_dispatcher().submit(webhook_url, _embed(title, description), label=label or title)
+
+
+def _embed(title: str, description: str) -> dict:
+    return {"title": title, "description": description, "color": _EMBED_COLOR}
 
 
-def send_milestone_notification(milestone_title: str, milestone_description: str) -> bool:
-    """マイルストーン達成通知をDiscordに送信する
+def _milestone_message(milestone_title: str, milestone_description: str) -> tuple[str, str]:
+    """マイルストーン達成通知の（タイトル, 本文）"""
+    return f"🎉 マイルストーン達成！ {milestone_title}", milestone_description
+
+
+def _reminder_message(days: int, saved_money: int) -> tuple[str, str]:
+    """妊活チェック未入力リマインダーの（タイトル, 本文）"""
+    return (
+        "👶 妊活チェックのリマインダー",
+        f"今日の妊活チェックをまだ入力していません！\n"
+        f"禁煙 **{days}日目**、赤ちゃん貯金 **¥{saved_money:,}** 達成中です。\n"
+        f"今日も記録しましょう 💪",
+    )
+
+
+def _craving_risk_message(label: str, ratio: float) -> tuple[str, str]:
+    """衝動が起きやすい時間帯の事前通知の（タイトル, 本文）"""
+    return (
+        "🔔 そろそろ衝動が起きやすい時間です",
+        f"これまでの記録では **{label}** はいつもの **{ratio:.1f}倍** 衝動が起きやすくなっています。\n"
+        f"水を用意する・少し歩くなど、先に手を打っておきましょう 💪",
+    )
+
+
+def send_milestone_notification(milestone_title: str,
+                                milestone_description: str) -> Optional[DeliveryTicket]:
+    """マイルストーン達成通知をDiscordに送信する（バックグラウンド）
 
     Args:
         milestone_title: マイルストーンのタイトル
         milestone_description: マイルストーンの説明
 
     Returns:
-        送信成功なら True、未設定または失敗なら False
+        送信を受け付けたら DeliveryTicket、未設定なら None
     """
-    webhook_url = os.environ.get("DISCORD_WEBHOOK_URL")
+    webhook_url = get_env("DISCORD_WEBHOOK_URL")
     if not webhook_url:
-        return False
+        return None
 
-    content = (
-        f"🎉 **マイルストーン達成！**\n"
-        f"**{milestone_title}**\n"
-        f"{milestone_description}"
-    )
-    return send_discord_message(webhook_url, content)
+    title, description = _milestone_message(milestone_title, milestone_description)
+    return send_discord_embed_async(webhook_url, title, description,
+                                    label=f"マイルストーン：{milestone_title}")
 
 
-def send_daily_reminder(days: int, saved_money: int) -> bool:
-    """妊活チェック未入力リマインダーをDiscordに送信する
+def send_daily_reminder(days: int, saved_money: int) -> Optional[DeliveryTicket]:
+    """妊活チェック未入力リマインダーをDiscordに送信する（バックグラウンド）
 
     Args:
         days: 禁煙継続日数
         saved_money: 現在の節約金額（円）
 
     Returns:
-        送信成功なら True、未設定または失敗なら False
+        送信を受け付けたら DeliveryTicket、未設定なら None
     """
-    webhook_url = os.environ.get("DISCORD_WEBHOOK_URL")
+    webhook_url = get_env("DISCORD_WEBHOOK_URL")
     if not webhook_url:
-        return False
+        return None
 
-    content = (
-        f"👶 **妊活チェックのリマインダー**\n"
-        f"今日の妊活チェックをまだ入力していません！\n"
-        f"禁煙 **{days}日目**、赤ちゃん貯金 **¥{saved_money:,}** 達成中です。\n"
-        f"今日も記録しましょう 💪"
-    )
-    return send_discord_message(webhook_url, content)
+    title, description = _reminder_message(days, saved_money)
+    return send_discord_embed_async(webhook_url, title, description)
 
 
-def send_test_message() -> bool:
-    """テスト用メッセージをDiscordに送信する
+def send_test_message() -> SendResult:
+    """テスト用メッセージをDiscordに送信する（1回だけ・再試行しない）
 
     Returns:
-        送信成功なら True、未設定または失敗なら False
+        送信結果（未設定の場合も失敗として返す）
     """
-    webhook_url = os.environ.get("DISCORD_WEBHOOK_URL")
+    webhook_url = get_env("DISCORD_WEBHOOK_URL")
     if not webhook_url:
-        return False
+        return SendResult(ok=False, error="DISCORD_WEBHOOK_URL が未設定です")
 
     content = (
         "✅ **パパになるための禁煙** - Discord通知テスト\n"
         "通知の設定が正常に完了しています！"
     )
     return send_discord_message(webhook_url, content)
+
+
+# ─── 送信箱（重複防止付きの通知） ────────────────────────────────────────────
+# Supabase への依存はここだけに閉じ込めるため、関数内で import する
+
+def milestone_outbox_key(milestone_key: str) -> str:
+    """マイルストーン通知の重複防止キー（例：milestone:day_30）"""
+    return f"milestone:{milestone_key}"
+
+
+def reminder_outbox_key(day: date, slot: str) -> str:
+    """リマインダーの重複防止キー（例：reminder:2026-10-17@21:00）
+
+    常駐・1回実行のどちらでも同じ時刻枠には同じキーを使うため、両方を動かしても二重に送られない。
+    """
+    return f"reminder:{day.isoformat()}@{slot}"
+
+
+def craving_risk_outbox_key(day: date, hour: int) -> str:
+    """衝動リスクの事前通知の重複防止キー（例：craving-risk:2026-10-17@21）"""
+    return f"craving-risk:{day.isoformat()}@{hour:02d}"
+
+
+def enqueue_milestone_notifications(milestones) -> int:
+    """マイルストーン達成通知を送信箱に登録する（登録済みのものは無視）
+
+    Args:
+        milestones: key・title・description を持つマイルストーンの並び
+
+    Returns:
+        新しく登録した件数
+    """
+    from utils.supabase_client import insert_outbox
+
+    rows = []
+    for m in milestones:
+        title, description = _milestone_message(m.title, m.description)
+        rows.append({
+            "idempotency_key": milestone_outbox_key(m.key),
+            "kind": "milestone",
+            "payload": {"title": title, "description": description},
+        })
+    return insert_outbox(rows)
+
+
+def enqueue_daily_reminder(day: date, days: int, saved_money: int, slot: str) -> bool:
+    """day の slot（"21:00" など）の妊活チェックリマインダーを送信箱に登録する
+
+    Returns:
+        新しく登録した場合 True、登録済みだった場合 False
+    """
+    from utils.supabase_client import insert_outbox
+
+    title, description = _reminder_message(days, saved_money)
+    return insert_outbox([{
+        "idempotency_key": reminder_outbox_key(day, slot),
+        "kind": "reminder",
+        "payload": {"title": title, "description": description},
+    }]) > 0
+
+
+def enqueue_craving_risk_nudge(day: date, hour: int, label: str, ratio: float) -> bool:
+    """衝動が起きやすい時間帯（day の hour 時台）の事前通知を送信箱に登録する
+
+    Returns:
+        新しく登録した場合 True、登録済みだった場合 False
+    """
+    from utils.supabase_client import insert_outbox
+
+    title, description = _craving_risk_message(label, ratio)
+    return insert_outbox([{
+        "idempotency_key": craving_risk_outbox_key(day, hour),
+        "kind": "craving_risk",
+        "payload": {"title": title, "description": description},
+    }]) > 0
+
+
+# 送信は終わったが結果を送信箱に記録できなかった（送信待ちのまま・DB エラー）通知
+# 次の deliver_outbox() で記録し直し、送信済みの通知が期限切れで再送されるのを防ぐ
+_unrecorded: list[tuple[dict, DeliveryTicket]] = []
+_outbox_lock = threading.Lock()
+
+
+def _record_outbox_results(results: Sequence[tuple[dict, DeliveryTicket]]) -> int:
+    """送信結果を送信箱に記録する（記録できなかったものは _unrecorded に残す）
+
+    Returns:
+        送信済みとして記録した件数
+    """
+    from utils.supabase_client import mark_outbox_failed, mark_outbox_sent
+
+    sent = 0
+    for row, ticket in results:
+        if not ticket.done:
+            _unrecorded.append((row, ticket))
+            continue
+        try:
+            if ticket.status == STATUS_SENT:
+                recorded = mark_outbox_sent(row)
+                sent += 1 if recorded else 0
+            else:
+                attempts = (row.get("attempts") or 0) + 1
+                recorded = mark_outbox_failed(row, ticket.error or ticket.status,
+                                              retry=attempts < _OUTBOX_MAX_ATTEMPTS)
+        except Exception:  # 記録できなくても送信済みの事実は手元に残し、次回記録し直す
+            logger.exception("送信結果を記録できませんでした: %s", row["idempotency_key"])
+            _unrecorded.append((row, ticket))
+            continue
+        if not recorded:
+            # 確保の期限が切れて他のプロセスに渡っていた（期限は最大の送信時間から決めているため通常は起きない）
+            logger.warning("確保の期限切れのため結果を記録しませんでした: %s", row["idempotency_key"])
+    return sent
+
+
+def _deliver_outbox_batch(webhook_url: str, rows: list[dict]) -> int:
+    """通知をまとめて確保・送信し、送信が終わるまで待って結果を記録する"""
+    from utils.supabase_client import claim_outbox
+
+    embeds = [_embed(row["payload"]["title"], row["payload"]["description"]) for row in rows]
+    # 確保の期限は、ディスパッチャーがこの通知を送り終えるまでにかかりうる最大の時間から決める
+    timeout = _MAX_SEND_SECONDS * len(chunk_embeds(embeds))
+    lease = timedelta(seconds=timeout + _OUTBOX_LEASE_MARGIN)
+    claimed = [(row, embed) for row, embed in zip(rows, embeds) if claim_outbox(row, lease)]
+    if not claimed:
+        return 0
+
+    dispatcher = get_dispatcher()
+    results = [
+        (row, dispatcher.submit(webhook_url, embed, label=row["idempotency_key"]))
+        for row, embed in claimed
+    ]
+    dispatcher.wait([ticket for _, ticket in results], timeout)
+    return _record_outbox_results(results)
+
+
+def deliver_outbox(limit: int = 50) -> int:
+    """送信箱の送信待ち通知を確保して送信し、結果を記録する
+
+    確保（pending → sending）は条件付き UPDATE のため、複数プロセスが同時に
+    呼び出しても各通知を送るのは1プロセスだけ。確保には送信にかかりうる最大時間から
+    決めた期限を付け、期限を過ぎても sending のままの通知（プロセス停止など）だけを
+    送信待ちへ戻して再送する。結果の記録も確保したときの状態のままの場合に限る。
+
+    Returns:
+        送信できた件数
+    """
+    from utils.supabase_client import get_pending_outbox, release_stale_outbox
+
+    webhook_url = get_env("DISCORD_WEBHOOK_URL")
+    if not webhook_url:
+        return 0
+
+    with _outbox_lock:
+        # 前回記録できなかった結果を先に記録する（送信済みのものを再送しないため）
+        retrying = list(_unrecorded)
+        _unrecorded.clear()
+        sent = _record_outbox_results(retrying)
+
+        release_stale_outbox()
+        rows = get_pending_outbox(limit)
+        for i in range(0, len(rows), _OUTBOX_BATCH):
+            sent += _deliver_outbox_batch(webhook_url, rows[i:i + _OUTBOX_BATCH])
+        return sent
@@ -0,0 +1,22 @@
+"""
+環境変数の読み込み
+
+.env はインポート時ではなく、最初に環境変数が必要になった時点で1回だけ読み込む。
+"""
+import os
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """.env の内容を環境変数に読み込む（プロセスごとに1回だけ）"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """環境変数を返す（初回呼び出し時に .env を読み込む）"""
+    load_env()
+    return os.environ.get(name, default)
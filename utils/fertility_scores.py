@@ -0,0 +1,100 @@
+"""
+妊活スコア・習慣の継続日数の計算ユーティリティ
+
+妊活ログ全件を DataFrame にまとめ、スコア・移動平均・習慣ごとの連続日数を
+行ごとのループではなく列演算で一括計算する。
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+
+from utils.calculations import today_jst
+
+# スコアの配点（合計100点）
+_HABIT_POINTS = {"zinc": 25, "folate": 25, "exercise": 25}
+_SLEEP_POINTS = 15   # 睡眠 6〜9時間
+_STRESS_POINTS = 10  # ストレス 2以下
+
+# 連続日数を数える習慣（列名 → 表示名）
+HABITS = {
+    "zinc": "亜鉛",
+    "folate": "葉酸",
+    "exercise": "運動",
+    "sleep_ok": "睡眠",
+}
+
+
+@dataclass
+class FertilityAnalytics:
+    """妊活ログの集計結果"""
+    daily: pd.DataFrame             # 記録日ごとのログ・スコア・移動平均（古い順）
+    current_streaks: dict[str, int]  # 習慣ごとの現在の連続日数
+    longest_streaks: dict[str, int]  # 習慣ごとの最長連続日数
+
+
+def score_logs(df: pd.DataFrame) -> pd.Series:
+    """妊活ログの DataFrame から各行のスコア（0〜100点）を計算する"""
+    score = pd.Series(0, index=df.index, dtype="int64")
+    for col, points in _HABIT_POINTS.items():
+        score += df[col].fillna(False).astype(bool).astype("int64") * points
+    sleep = pd.to_numeric(df["sleep_hours"], errors="coerce").fillna(0)
+    score += sleep.between(6.0, 9.0).astype("int64") * _SLEEP_POINTS
+    stress = pd.to_numeric(df["stress"], errors="coerce").fillna(3)
+    score += (stress <= 2).astype("int64") * _STRESS_POINTS
+    return score
+
+
+def calc_score(log: dict) -> int:
+    """妊活ログ1件のスコアを計算する（0〜100点）"""
+    return int(score_logs(pd.DataFrame([log])).iloc[0])
+
+
+def _streaks(flags: pd.Series) -> pd.Series:
+    """日ごとの真偽値から、その日までの連続日数を返す"""
+    flags = flags.astype(bool)
+    # False の日で区切ったグループ内の累積和が連続日数になる
+    return flags.astype("int64").groupby((~flags).cumsum()).cumsum()
+
+
+def build_fertility_analytics(logs: list[dict]) -> FertilityAnalytics:
+    """妊活ログ全件からスコア・7日/30日移動平均・習慣の連続日数を計算する"""
+    if not logs:
+        empty = pd.DataFrame(columns=["score", "score_7d", "score_30d"])
+        zeros = {key: 0 for key in HABITS}
+        return FertilityAnalytics(empty, dict(zeros), dict(zeros))
+
+    df = pd.DataFrame(logs)
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.sort_values("date").set_index("date")
+
+    df["score"] = score_logs(df)
+    sleep = pd.to_numeric(df["sleep_hours"], errors="coerce").fillna(0)
+    df["sleep_ok"] = sleep.between(6.0, 9.0)
+    # 記録のない日は平均に含めない（期間ベースの移動平均）
+    df["score_7d"] = df["score"].rolling("7D", min_periods=1).mean()
+    df["score_30d"] = df["score"].rolling("30D", min_periods=1).mean()
+
+    # 連続日数は記録のない日を「未達成」として暦日で数える
+    # 今日は JST で判定し、今日より後の日付の記録（取り込み・時計のずれ）があればその日まで伸ばす
+    end = max(pd.Timestamp(today_jst()), df.index.max())
+    calendar = pd.date_range(df.index.min(), end, freq="D")
+    habits = (
+        df[list(HABITS)]
+        .fillna(False)
+        .astype(bool)
+        .reindex(calendar, fill_value=False)
+    )
+    streaks = habits.apply(_streaks)
+    if streaks.empty:
+        zeros = {key: 0 for key in HABITS}
+        return FertilityAnalytics(df, dict(zeros), dict(zeros))
+    # 今日が未記録でも、昨日まで続いていれば継続中として扱う
+    last = streaks.iloc[-1]
+    if len(streaks) >= 2 and calendar[-1] not in df.index:
+        last = streaks.iloc[-2]
+
+    return FertilityAnalytics(
+        daily=df,
+        current_streaks={key: int(last[key]) for key in HABITS},
+        longest_streaks={key: int(streaks[key].max()) for key in HABITS},
+    )
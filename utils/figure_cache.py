@@ -0,0 +1,93 @@
+"""
+Plotly グラフのキャッシュ
+
+入力データの簡易フィンガープリント（件数・最新時刻・設定の版など）をキーに、
+生成済みグラフを JSON 文字列で保持する（LRU で古いものから破棄）。
+データが変わっていない再実行ではグラフの組み立てと検証を丸ごと省略できる。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from utils.metrics import CACHE_EVENTS
+
+_MAX_ENTRIES = 32  # 保持するグラフの最大数
+
+
+class FigureCache:
+    """グラフ JSON の LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = _MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str, fingerprint: str) -> Any:
+        """キャッシュ済みのグラフを返す（なければ None）
+
+        JSON から復元する際は検証を省略する（保存時に検証済みのため）。
+        """
+        with self._lock:
+            cached = self._entries.get((name, fingerprint))
+            if cached is None:
+                self.misses += 1
+                CACHE_EVENTS.inc(cache="figure", event="miss")
+                return None
+            self._entries.move_to_end((name, fingerprint))
+            self.hits += 1
+            CACHE_EVENTS.inc(cache="figure", event="hit")
+        import plotly.graph_objects as go
+
+        return go.Figure(json.loads(cached), _validate=False)
+
+    def put(self, name: str, fingerprint: str, figure: Any) -> None:
+        """グラフを JSON にしてキャッシュする"""
+        serialized = figure.to_json()
+        with self._lock:
+            self._entries[(name, fingerprint)] = serialized
+            self._entries.move_to_end((name, fingerprint))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                CACHE_EVENTS.inc(cache="figure", event="eviction")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = FigureCache()
+
+
+def get_figure_cache() -> FigureCache:
+    """プロセス内で共有するグラフキャッシュを返す"""
+    return _cache
+
+
+def fingerprint(*parts: Any) -> str:
+    """グラフの入力を表す値から短いフィンガープリントを作る
+
+    行本体ではなく、件数・最新のタイムスタンプ・設定の版など安価に得られる値を渡す。
+    """
+    raw = json.dumps(parts, default=str, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def cached_figure(name: str, key: str, build: Callable[[], Any]) -> Any:
+    """キャッシュ済みならそのグラフを、なければ build() で作ってキャッシュして返す
+
+    Args:
+        name: グラフの種類（ページ内で一意な名前）
+        key: fingerprint() で作った入力データのフィンガープリント
+        build: グラフを組み立てる関数（キャッシュミス時のみ呼ばれる）
+    """
+    figure = _cache.get(name, key)
+    if figure is None:
+        figure = build()
+        _cache.put(name, key, figure)
+    return figure
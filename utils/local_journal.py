@@ -0,0 +1,222 @@
+"""
+書き込みのローカルジャーナル（オフラインでも記録できるようにする）
+
+衝動ログ・日記の書き込みは、まずローカルの SQLite（WAL モード）に追記して即座に返し、
+バックグラウンドの同期スレッドがまとめて Supabase に送る。
+Supabase に届かない間も記録は失われず、つながり次第順に送られる。
+
+各行には書き込み時にクライアント側で UUID を振り、Supabase には id での upsert
+（重複は無視）として送るため、送信後に印を付ける前に落ちて再送しても二重に登録されない。
+同じジャーナルファイルを複数のプロセスが同期しても同様。
+
+    journal = get_journal()
+    journal.start_syncer(push)          # push(テーブル名, 行のリスト) が Supabase への送信
+    row = journal.append("craving_logs", {...})   # row["sync_status"] == "pending"
+
+環境変数:
+    LOCAL_JOURNAL_PATH   ジャーナルファイルの場所（既定 .journal/writes.sqlite3）
+"""
+import atexit
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.env import get_env
+
+# 同期設定
+_BATCH_SIZE = 200          # 1回の送信にまとめる最大行数
+_POLL_SECONDS = 5.0        # 書き込みがないときに未同期行を確認する間隔（秒）
+_BACKOFF_BASE = 2.0        # 送信に失敗したときの待ち時間の初期値（秒）
+_BACKOFF_MAX = 120.0       # 送信に失敗したときの待ち時間の上限（秒）
+_RETAIN_SYNCED = 7 * 86400  # 同期済みの行を残しておく期間（秒）
+
+# 同期状態
+SYNC_PENDING = "pending"  # Supabase への送信待ち
+SYNC_SYNCED = "synced"    # Supabase に送信済み
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id TEXT PRIMARY KEY,              -- クライアントで振った UUID（Supabase 側の id と同じ）
+    table_name TEXT NOT NULL,         -- 送信先のテーブル
+    payload TEXT NOT NULL,            -- 行の内容（JSON）
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS journal_status_idx ON journal (status, table_name, created_at);
+"""
+
+PushFunc = Callable[[str, list[dict]], None]
+
+
+def journal_path() -> Path:
+    """ジャーナルファイルの場所"""
+    return Path(get_env("LOCAL_JOURNAL_PATH") or ".journal/writes.sqlite3")
+
+
+class LocalJournal:
+    """SQLite（WAL モード）に書き込みを追記し、バックグラウンドで Supabase に同期する
+
+    接続はスレッドごとに持つ。WAL モードのため、同期スレッドの書き込み中も
+    画面側の追記・読み出しは待たされない。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL ではコミット済みの行は電源断でも失われにくい
+            self._local.conn = conn
+        return conn
+
+    # ─── 書き込み・読み出し ───────────────────────────────────────────────────
+
+    def append(self, table_name: str, data: dict) -> dict:
+        """行をジャーナルに追記し、id と同期状態を付けて返す（ネットワークを待たない）"""
+        row = {"id": str(uuid.uuid4()), **data}
+        self._conn().execute(
+            "INSERT INTO journal (id, table_name, payload, created_at) VALUES (?, ?, ?, ?)",
+            (row["id"], table_name, json.dumps(row, ensure_ascii=False), time.time()),
+        )
+        self._wake.set()  # 同期スレッドをすぐ起こす
+        return {**row, "sync_status": SYNC_PENDING}
+
+    def pending(self, table_name: str, limit: Optional[int] = None) -> list[dict]:
+        """未同期の行を新しい順に返す（sync_error は直近の送信失敗の内容）"""
+        sql = ("SELECT payload, attempts, last_error FROM journal"
+               " WHERE status = ? AND table_name = ? ORDER BY created_at DESC")
+        params: tuple = (SYNC_PENDING, table_name)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [
+            {**json.loads(r["payload"]), "sync_status": SYNC_PENDING,
+             "sync_attempts": r["attempts"], "sync_error": r["last_error"]}
+            for r in self._conn().execute(sql, params)
+        ]
+
+    def count_pending(self, table_name: Optional[str] = None) -> int:
+        """未同期の行数"""
+        if table_name is None:
+            sql, params = "SELECT COUNT(*) FROM journal WHERE status = ?", (SYNC_PENDING,)
+        else:
+            sql = "SELECT COUNT(*) FROM journal WHERE status = ? AND table_name = ?"
+            params = (SYNC_PENDING, table_name)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    # ─── 同期 ──────────────────────────────────────────────────────────────────
+
+    def sync_once(self, push: PushFunc) -> int:
+        """未同期の行をテーブルごとに古い順でまとめて送る
+
+        Returns:
+            送信できた行数
+
+        Raises:
+            push が送出した例外（送れなかった行は未同期のまま残る）
+        """
+        conn = self._conn()
+        tables = [r[0] for r in conn.execute(
+            "SELECT DISTINCT table_name FROM journal WHERE status = ?", (SYNC_PENDING,)
+        )]
+        synced = 0
+        for table_name in tables:
+            while True:
+                rows = conn.execute(
+                    "SELECT id, payload FROM journal WHERE status = ? AND table_name = ?"
+                    " ORDER BY created_at LIMIT ?",
+                    (SYNC_PENDING, table_name, _BATCH_SIZE),
+                ).fetchall()
+                if not rows:
+                    break
+                ids = [r["id"] for r in rows]
+                placeholders = ",".join("?" * len(ids))
+                try:
+                    push(table_name, [json.loads(r["payload"]) for r in rows])
+                except Exception as e:
+                    conn.execute(
+                        f"UPDATE journal SET attempts = attempts + 1, last_error = ?"
+                        f" WHERE id IN ({placeholders})",
+                        (repr(e)[:500], *ids),
+                    )
+                    raise
+                conn.execute(
+                    f"UPDATE journal SET status = ?, synced_at = ?, last_error = NULL"
+                    f" WHERE id IN ({placeholders})",
+                    (SYNC_SYNCED, time.time(), *ids),
+                )
+                synced += len(ids)
+                if len(rows) < _BATCH_SIZE:
+                    break
+        conn.execute(
+            "DELETE FROM journal WHERE status = ? AND synced_at < ?",
+            (SYNC_SYNCED, time.time() - _RETAIN_SYNCED),
+        )
+        return synced
+
+    def start_syncer(self, push: PushFunc) -> None:
+        """同期スレッドを起動する（起動済みなら何もしない）"""
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(push,), name="journal-syncer", daemon=True
+            )
+            self._thread.start()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """未同期の行がなくなるまで待つ。timeout 内に終われば True"""
+        if self._thread is None:
+            return False  # 同期スレッドが動いていなければ待っても減らない
+        deadline = time.monotonic() + timeout
+        self._wake.set()
+        while self.count_pending():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _run(self, push: PushFunc) -> None:
+        failures = 0
+        while True:
+            self._wake.clear()
+            try:
+                self.sync_once(push)
+                failures = 0
+                wait = _POLL_SECONDS
+            except Exception:  # 通信できない間も同期スレッドは止めず、間隔を空けて再試行する
+                failures += 1
+                wait = min(_BACKOFF_BASE * 2 ** (failures - 1), _BACKOFF_MAX)
+            self._wake.wait(wait)
+
+
+_journal: Optional[LocalJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> LocalJournal:
+    """プロセス内で共有するジャーナルを返す（初回呼び出し時に開く）"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = LocalJournal(journal_path())
+            # プロセス終了時に未同期の行を少しだけ送っておく（残っても次回起動時に送られる）
+            atexit.register(_journal.flush, 3)
+        return _journal
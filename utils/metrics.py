@@ -0,0 +1,335 @@
+"""
+運用メトリクス（カウンター・ヒストグラム）
+
+DB クエリの所要時間・取得件数、キャッシュのヒット率、Discord 通知の送信結果などを
+プロセス内のレジストリに集計し、Prometheus のテキスト形式で書き出す。
+
+書き出し先は環境変数で選ぶ（どちらも未設定なら集計だけ行う）:
+    METRICS_PORT       指定したポートで /metrics を返す HTTP サーバーを起動する
+    METRICS_FILE       指定したファイルへ定期的に書き出す（node_exporter の textfile 向け）
+    METRICS_INTERVAL   ファイルへ書き出す間隔（秒、既定 15）
+
+書き出しは各プロセスの入口（app.py・worker.py）で start_exporters_from_env() を呼んで始める。
+画面とワーカーが同じ .env を読むため、METRICS_PORT_WORKER・METRICS_FILE_WORKER のように
+プロセス名を付けた変数があればそちらを優先する。
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+from utils.env import get_env
+
+logger = logging.getLogger("metrics")
+
+# 所要時間（秒）の既定のバケット
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 件数の既定のバケット
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """ラベルの組み合わせごとに値を持つメトリクスの共通部分"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), self._empty())]  # ラベルなしのメトリクスはまだ 0 でも出力する
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _empty(self) -> Any:
+        raise NotImplementedError
+
+    def _render_sample(self, key: tuple[str, ...], value: Any) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """増える一方の値（件数・回数）"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _empty(self) -> float:
+        return 0
+
+    def _render_sample(self, key: tuple[str, ...], value: float) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """値の分布（所要時間・件数）。バケットごとの累積件数と合計を持つ"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _empty(self) -> tuple[list[int], float]:
+        return [0] * len(self.buckets), 0.0
+
+    def _render_sample(self, key: tuple[str, ...], value: tuple[list[int], float]) -> list[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            )
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録先。同じ名前で登録すると既存のものを返す"""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"{metric.name} は別の種類のメトリクスとして登録済みです")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式で全メトリクスを返す"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ─── アプリで使うメトリクス ───────────────────────────────────────────────────
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "smoke_db_query_seconds", "supabase_client の関数ごとの所要時間（秒）", ["function"]
+)
+DB_ROWS = REGISTRY.histogram(
+    "smoke_db_rows", "supabase_client の関数ごとの取得件数", ["function"], buckets=COUNT_BUCKETS
+)
+DB_ERRORS = REGISTRY.counter(
+    "smoke_db_errors_total", "supabase_client の関数で発生した例外の件数", ["function"]
+)
+CACHE_EVENTS = REGISTRY.counter(
+    "smoke_cache_events_total", "キャッシュのヒット・ミス・破棄の件数", ["cache", "event"]
+)
+DISCORD_REQUESTS = REGISTRY.counter(
+    "smoke_discord_requests_total", "Discord Webhook への HTTP 呼び出しの件数（結果別）", ["result"]
+)
+DISCORD_RETRIES = REGISTRY.counter(
+    "smoke_discord_retries_total", "Discord Webhook への再試行の件数"
+)
+DISCORD_MESSAGES = REGISTRY.counter(
+    "smoke_discord_messages_total", "Discord に送ったメッセージの件数（sent / failed）", ["result"]
+)
+DISCORD_NOTIFICATIONS = REGISTRY.counter(
+    "smoke_discord_notifications_total", "通知（embed）の件数（sent / failed / dropped）", ["result"]
+)
+DISCORD_SEND_SECONDS = REGISTRY.histogram(
+    "smoke_discord_send_seconds", "メッセージ1通の送信にかかった時間（再試行の待ちを含む・秒）"
+)
+
+
+def _row_count(result: Any) -> Optional[int]:
+    """関数の戻り値から取得件数を推定する（件数として扱えなければ None）"""
+    if isinstance(result, (list, set)):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])  # （行のリスト, カーソル）など
+    if isinstance(result, dict):
+        return 1
+    if result is None:
+        return 0
+    return None
+
+
+def instrumented(func: Callable) -> Callable:
+    """関数の所要時間・取得件数・例外を DB メトリクスに記録するデコレーター
+
+    st.cache_data と併用する場合は内側に付ける（実際に DB に問い合わせたときだけ記録される）。
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(function=name)
+            raise
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, function=name)
+        rows = _row_count(result)
+        if rows is not None:
+            DB_ROWS.observe(rows, function=name)
+        return result
+
+    return wrapper
+
+
+# ─── 書き出し ────────────────────────────────────────────────────────────────
+
+def write_metrics_file(path: Path) -> None:
+    """メトリクスをファイルに書き出す（読み手が途中の内容を見ないよう置き換える）"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(REGISTRY.render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def start_http_exporter(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """/metrics を返す HTTP サーバーをバックグラウンドで起動する"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", _CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_exporter(path: Path, interval: float = 15.0) -> threading.Thread:
+    """interval 秒ごとにメトリクスをファイルへ書き出すスレッドを起動する"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    def run():
+        while True:
+            try:
+                write_metrics_file(path)
+            except OSError:
+                pass  # 書き出せなくても次の周期で再試行する
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def _process_env(name: str, process: str) -> Optional[str]:
+    """プロセス名付きの変数（METRICS_PORT_WORKER など）があればその値、なければ共通の値"""
+    return get_env(f"{name}_{process.upper()}") or get_env(name)
+
+
+def start_exporters_from_env(process: str) -> None:
+    """METRICS_PORT・METRICS_FILE に応じて書き出しを始める（プロセスごとに1回だけ）
+
+    ポートが使用中などで起動できなくても例外にはせず、ログに残して集計だけ続ける。
+
+    Args:
+        process: プロセス名（"app" / "worker"）。プロセスごとの変数の選択に使う
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+        port = _process_env("METRICS_PORT", process)
+        if port:
+            try:
+                start_http_exporter(int(port))
+            except (OSError, ValueError) as e:
+                logger.warning("メトリクスの HTTP サーバーを起動できませんでした（METRICS_PORT=%s）: %s", port, e)
+        path = _process_env("METRICS_FILE", process)
+        if path:
+            try:
+                start_file_exporter(Path(path), float(get_env("METRICS_INTERVAL", "15")))
+            except (OSError, ValueError) as e:
+                logger.warning("メトリクスのファイル書き出しを開始できませんでした（METRICS_FILE=%s）: %s", path, e)
@@ -1,18 +1,30 @@
 """
 禁煙マイルストーンの定義（科学的根拠に基づく）
 """
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Optional
+
+# マイルストーンの種類
+KIND_DAYS = "days"    # 禁煙日数で達成
+KIND_MONEY = "money"  # 節約金額（円）で達成
 
 
 @dataclass
 class Milestone:
     """マイルストーンの定義"""
     key: str          # 識別キー
-    days: int         # 達成に必要な禁煙日数
+    days: int         # 達成に必要な禁煙日数（金額型では 0）
     title: str        # タイトル
     description: str  # 詳細説明
     emoji: str        # アイコン
+    kind: str = KIND_DAYS  # 種類（days / money）
+    amount: int = 0        # 達成に必要な節約金額（金額型のみ）
+
+    @property
+    def threshold(self) -> int:
+        """種類に応じた達成しきい値（日数または金額）"""
+        return self.amount if self.kind == KIND_MONEY else self.days
 
 
 # 科学的根拠に基づくマイルストーン一覧
@@ -90,17 +102,96 @@ MILESTONES: list[Milestone] = [
 ]
 
 
+class MilestoneRegistry:
+    """マイルストーンの索引
+
+    種類ごとにしきい値の昇順リストを持ち、bisect で達成済み・次の目標・
+    前回評価以降に新しく達成したものを O(log n + k) で求める。
+    キー検索は dict による O(1)。
+    """
+
+    def __init__(self, milestones: Iterable[Milestone]):
+        self._by_key: dict[str, Milestone] = {}
+        for m in milestones:
+            self._by_key[m.key] = m  # 同じキーは後勝ち（ユーザー定義で上書き可能）
+
+        self._sorted: dict[str, list[Milestone]] = {}
+        self._thresholds: dict[str, list[int]] = {}
+        for m in sorted(self._by_key.values(), key=lambda m: m.threshold):
+            self._sorted.setdefault(m.kind, []).append(m)
+            self._thresholds.setdefault(m.kind, []).append(m.threshold)
+        # 定義の変化を検出するための署名（評価済み地点の無効化に使う）
+        self.signature = hash(tuple(
+            (m.key, m.kind, m.threshold) for m in sorted(self._by_key.values(), key=lambda m: m.key)
+        ))
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def all(self, kind: str = KIND_DAYS) -> list[Milestone]:
+        """指定種類のマイルストーンをしきい値の昇順で返す"""
+        return list(self._sorted.get(kind, []))
+
+    def get(self, key: str) -> Optional[Milestone]:
+        """キーでマイルストーンを返す"""
+        return self._by_key.get(key)
+
+    def achieved(self, value: int, kind: str = KIND_DAYS) -> list[Milestone]:
+        """value 時点で達成済みのマイルストーンを返す"""
+        i = bisect_right(self._thresholds.get(kind, []), value)
+        return self._sorted.get(kind, [])[:i]
+
+    def next(self, value: int, kind: str = KIND_DAYS) -> Optional[Milestone]:
+        """value 時点で次に達成するマイルストーンを返す"""
+        items = self._sorted.get(kind, [])
+        i = bisect_right(self._thresholds.get(kind, []), value)
+        return items[i] if i < len(items) else None
+
+    def crossed(self, last_value: Optional[int], value: int,
+                kind: str = KIND_DAYS) -> list[Milestone]:
+        """last_value より後、value までに新しく達成したマイルストーンを返す
+
+        last_value が None の場合は未評価とみなし、value までの全件を返す。
+        """
+        thresholds = self._thresholds.get(kind, [])
+        hi = bisect_right(thresholds, value)
+        lo = 0 if last_value is None else bisect_right(thresholds, last_value)
+        return self._sorted.get(kind, [])[lo:hi] if lo < hi else []
+
+
+def milestone_from_row(row: dict) -> Milestone:
+    """custom_milestones の行から Milestone を生成する"""
+    kind = row.get("kind") or KIND_DAYS
+    threshold = int(row["threshold"])
+    return Milestone(
+        key=row["milestone_key"],
+        days=threshold if kind == KIND_DAYS else 0,
+        title=row["title"],
+        description=row.get("description") or "",
+        emoji=row.get("emoji") or "🎖️",
+        kind=kind,
+        amount=threshold if kind == KIND_MONEY else 0,
+    )
+
+
+def build_milestone_registry(custom_rows: Iterable[dict] = ()) -> MilestoneRegistry:
+    """標準マイルストーンとDBのユーザー定義マイルストーンから索引を作る"""
+    return MilestoneRegistry([*MILESTONES, *(milestone_from_row(r) for r in custom_rows)])
+
+
+DEFAULT_REGISTRY = MilestoneRegistry(MILESTONES)
+
+
 def get_achieved_milestones(smoke_free_days: int) -> list[Milestone]:
     """現在の禁煙日数で達成済みのマイルストーン一覧を返す"""
-    return [m for m in MILESTONES if smoke_free_days >= m.days]
+    return DEFAULT_REGISTRY.achieved(smoke_free_days)
 
 
 def get_next_milestone(smoke_free_days: int) -> Optional[Milestone]:
     """次のマイルストーンを返す"""
-    upcoming = [m for m in MILESTONES if m.days > smoke_free_days]
-    return upcoming[0] if upcoming else None
+    return DEFAULT_REGISTRY.next(smoke_free_days)
 
 
 def get_milestone_by_key(key: str) -> Optional[Milestone]:
     """キーでマイルストーンを検索する"""
-    return next((m for m in MILESTONES if m.key == key), None)
+    return DEFAULT_REGISTRY.get(key)
@@ -0,0 +1,219 @@
+"""
+画面ごとの実行プロファイル（開発用）
+
+URL に ?profile=1 を付けるか、環境変数 APP_PROFILE=1 で起動すると、
+画面スクリプトの1回の実行を cProfile と tracemalloc で計測し、
+PROFILE_DIR（既定 .profiles/）に時刻付きのレポートを保存する。
+
+    start_profile("app")   # スクリプトの先頭（import の直後）
+    ...
+    finish_profile()       # スクリプトの末尾と、st.stop() の直前
+
+レポートには関数ごとの呼び出し統計、増えたメモリの多い行、
+supabase_client・calculations・Plotly・Streamlit などへの時間の内訳が入る。
+保存したレポートは「プロファイル」画面で確認できる。
+
+cProfile・tracemalloc はプロセス全体で1つずつしか使えないため、
+同時に計測するのは1実行だけ（計測中に来た他のセッションの実行は計測しない）。
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import streamlit as st
+
+from utils.env import get_env
+
+_JST = timezone(timedelta(hours=9))
+
+_TOP_FUNCTIONS = 30    # レポートに残す関数の数
+_TOP_ALLOCATIONS = 20  # レポートに残すメモリ確保元の数
+_TRACEMALLOC_FRAMES = 5
+_STALE_SECONDS = 60    # finish_profile() まで届かなかった計測を破棄するまでの時間
+
+# 時間の内訳の分類（分類名, ファイルパスに含まれる文字列）。先に一致したものを使う
+_CATEGORIES = (
+    ("supabase_client", ("utils/supabase_client.py",)),
+    ("calculations", ("utils/calculations.py",)),
+    ("utils（その他）", ("/utils/",)),
+    ("Plotly", ("/plotly/",)),
+    ("pandas・numpy", ("/pandas/", "/numpy/")),
+    ("通信（supabase・httpx）", ("/supabase/", "/postgrest/", "/gotrue/", "/httpx/", "/httpcore/",
+                            "/requests/", "/urllib3/", "/ssl.py", "/socket.py")),
+    ("Streamlit", ("/streamlit/",)),
+    ("モジュール読み込み", ("<frozen importlib",)),
+)
+
+_lock = threading.Lock()
+_active: Optional["_Run"] = None  # 計測中の実行（同時に1つだけ）
+
+
+def profile_dir() -> Path:
+    """レポートの保存先"""
+    return Path(get_env("PROFILE_DIR") or ".profiles")
+
+
+def profiling_enabled() -> bool:
+    """この実行を計測するか（?profile=1 または APP_PROFILE=1）"""
+    if get_env("APP_PROFILE") == "1":
+        return True
+    return st.query_params.get("profile") == "1"
+
+
+class _Run:
+    """計測中の1回の実行"""
+
+    def __init__(self, name: str, script_path: str):
+        self.name = name
+        self.script_path = script_path.replace("\\", "/")
+        self.started_at = datetime.now(_JST)
+        self.thread_id = threading.get_ident()  # スクリプトは1回の実行中同じスレッドで動く
+        self.own_tracemalloc = not tracemalloc.is_tracing()
+        if self.own_tracemalloc:
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.take_snapshot()
+        self.profiler = cProfile.Profile()
+        self.wall_start = time.perf_counter()
+        self.profiler.enable()
+
+    def discard(self) -> None:
+        self.profiler.disable()
+        if self.own_tracemalloc:
+            tracemalloc.stop()
+
+    def finish(self) -> dict:
+        self.profiler.disable()
+        wall = time.perf_counter() - self.wall_start
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self.own_tracemalloc:
+            tracemalloc.stop()
+
+        stats = pstats.Stats(self.profiler)
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(wall, 4),
+            "profiled_seconds": round(stats.total_tt, 4),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "breakdown": self._breakdown(stats),
+            "functions": self._functions(stats),
+            "allocations": self._allocations(snapshot),
+            "stats_text": self._stats_text(stats),
+        }
+
+    def _category(self, filename: str) -> str:
+        path = filename.replace("\\", "/")
+        if path == self.script_path:
+            return "画面スクリプト"
+        if path == "~":
+            return "組み込み関数"
+        for category, needles in _CATEGORIES:
+            if any(needle in path for needle in needles):
+                return category
+        return "その他"
+
+    def _breakdown(self, stats: pstats.Stats) -> dict[str, float]:
+        """分類ごとの関数自身の実行時間（秒）"""
+        totals: dict[str, float] = {}
+        for (filename, _, _), (_, _, tottime, _, _) in stats.stats.items():
+            category = self._category(filename)
+            totals[category] = totals.get(category, 0.0) + tottime
+        return {k: round(v, 4) for k, v in sorted(totals.items(), key=lambda kv: -kv[1])}
+
+    def _functions(self, stats: pstats.Stats) -> list[dict]:
+        """自身の実行時間の長い関数"""
+        rows = [
+            {
+                "function": f"{funcname} ({Path(filename).name}:{lineno})",
+                "category": self._category(filename),
+                "calls": ncalls,
+                "tottime": round(tottime, 4),
+                "cumtime": round(cumtime, 4),
+            }
+            for (filename, lineno, funcname), (_, ncalls, tottime, cumtime, _) in stats.stats.items()
+        ]
+        rows.sort(key=lambda r: r["tottime"], reverse=True)
+        return rows[:_TOP_FUNCTIONS]
+
+    def _allocations(self, snapshot: tracemalloc.Snapshot) -> list[dict]:
+        """実行中に増えたメモリの多い行（他のセッションの確保も含まれうる）"""
+        rows = []
+        for diff in snapshot.compare_to(self.baseline, "lineno")[:_TOP_ALLOCATIONS]:
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            rows.append({
+                "location": f"{Path(frame.filename).as_posix()}:{frame.lineno}",
+                "size_kb": round(diff.size_diff / 1024, 1),
+                "count": diff.count_diff,
+            })
+        return rows
+
+    @staticmethod
+    def _stats_text(stats: pstats.Stats) -> str:
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(_TOP_FUNCTIONS)
+        return out.getvalue()
+
+
+def start_profile(name: str) -> None:
+    """計測が有効なら、この実行の計測を始める"""
+    global _active
+    if not profiling_enabled():
+        return
+    import __main__
+
+    with _lock:
+        if _active is not None:
+            if time.perf_counter() - _active.wall_start < _STALE_SECONDS:
+                return  # 他のセッションを計測中
+            # 例外などで finish_profile() まで届かなかった計測は捨てる
+            _active.discard()
+            _active = None
+        _active = _Run(name, getattr(__main__, "__file__", ""))
+
+
+def finish_profile() -> Optional[Path]:
+    """計測を終えてレポートを保存する（この実行を計測していなければ何もしない）
+
+    Returns:
+        保存したレポート（.json）のパス
+    """
+    global _active
+    with _lock:
+        run = _active
+        if run is None or run.thread_id != threading.get_ident():
+            return None
+        _active = None
+        report = run.finish()
+
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{run.started_at.strftime('%Y%m%d-%H%M%S-%f')}-{run.name}"
+    run.profiler.dump_stats(directory / f"{stem}.prof")  # snakeviz などで開ける
+    path = directory / f"{stem}.json"
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+    return path
+
+
+def list_reports(limit: int = 50) -> list[Path]:
+    """保存済みレポートを新しい順に返す"""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    return sorted(directory.glob("*.json"), reverse=True)[:limit]
+
+
+def load_report(path: Path) -> dict:
+    """保存済みレポートを読み込む"""
+    return json.loads(path.read_text(encoding="utf-8"))
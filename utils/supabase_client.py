@@ -1,24 +1,39 @@
 """
 Supabaseクライアントの初期化と共通データアクセス関数
+
+各関数の所要時間・取得件数は utils/metrics.py のメトリクスに記録される。
+衝動ログ・日記の追加はローカルジャーナル（utils/local_journal.py）に書いて即座に返し、
+Supabase へはバックグラウンドでまとめて送る。
 """
-import os
+import logging
+import re
 from datetime import date, datetime, timezone, timedelta
 from typing import Optional
 
 _JST = timezone(timedelta(hours=9))
 
+import httpx
 import streamlit as st
-from dotenv import load_dotenv
 from supabase import create_client, Client
 
-load_dotenv()
+from utils.calculations import parse_timestamp, today_jst
+from utils.craving_forecast import CravingForecaster
+from utils.env import get_env
+from utils.local_journal import LocalJournal, get_journal
+from utils.metrics import instrumented
+
+
+logger = logging.getLogger("supabase")
+
+# Supabase に接続できないときに送出される例外（画面をオフライン表示に切り替える判定に使う）
+CONNECTION_ERRORS = (httpx.TransportError, OSError)
 
 
 @st.cache_resource
 def get_supabase_client() -> Client:
     """Supabaseクライアントをシングルトンで返す"""
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
+    url = get_env("SUPABASE_URL")
+    key = get_env("SUPABASE_KEY")
     if not url or not key:
         st.error("⚠️ .envファイルにSUPABASE_URLとSUPABASE_KEYを設定してください。")
         st.stop()
@@ -30,14 +45,53 @@ def _table(table_name: str):
     return get_supabase_client().schema("smoke").table(table_name)
 
 
+# ─── ローカルジャーナル ──────────────────────────────────────────────────────
+
+@instrumented
+def _push_journal_rows(table_name: str, rows: list[dict]) -> None:
+    """ジャーナルの行をまとめて送る（id が既にあれば無視するので再送しても重複しない）
+
+    衝動ログは、新しく追加された行だけを衝動リスク予測に取り込む。
+    予測の更新に失敗しても送信は成功として扱う（失敗を返すと再送されるが、再送では
+    新しい行が返らず予測に取り込めない）。代わりに予測を古いものとして捨て、次に
+    読むときに全件から作り直させる。
+    """
+    res = _table(table_name).upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+    if table_name == "craving_logs" and res.data:
+        try:
+            update_craving_forecast(res.data)
+        except Exception:
+            logger.exception("衝動リスク予測を更新できませんでした（次に読むときに作り直します）")
+            _discard_craving_forecast()
+
+
+def _journal() -> LocalJournal:
+    """同期スレッドを起動済みのジャーナルを返す"""
+    journal = get_journal()
+    journal.start_syncer(_push_journal_rows)
+    return journal
+
+
+def get_pending_writes(table_name: str, limit: Optional[int] = None) -> list[dict]:
+    """まだ Supabase に届いていない書き込みを新しい順に返す（sync_status は "pending"）"""
+    return _journal().pending(table_name, limit)
+
+
+def count_pending_writes(table_name: Optional[str] = None) -> int:
+    """まだ Supabase に届いていない書き込みの件数（table_name 省略時は全テーブル）"""
+    return _journal().count_pending(table_name)
+
+
 # ─── user_settings ──────────────────────────────────────────────────────────
 
+@instrumented
 def get_user_settings() -> Optional[dict]:
     """ユーザー設定を取得する（最新1件）"""
     res = _table("user_settings").select("*").order("created_at", desc=True).limit(1).execute()
     return res.data[0] if res.data else None
 
 
+@instrumented
 def upsert_user_settings(quit_date: date, cigarettes_per_day: int,
                          price_per_pack: int, cigarettes_per_pack: int = 20) -> dict:
     """ユーザー設定を保存する（既存があれば上書き）
@@ -73,6 +127,15 @@ def upsert_user_settings(quit_date: date, cigarettes_per_day: int,
         res = _table("user_settings").update(data).eq("id", existing["id"]).execute()
     else:
         res = _table("user_settings").insert(data).execute()
+
+    # 本数・価格が変わった場合のみ履歴に追記（過去の節約額を書き換えないため）
+    rate_keys = ("cigarettes_per_day", "price_per_pack", "cigarettes_per_pack")
+    if not existing or any(existing.get(k) != data[k] for k in rate_keys):
+        # 適用開始日は JST の今日（サーバーが UTC でも 0〜9時の変更を前日扱いにしない）
+        effective_from = quit_date if not existing else today_jst()
+        add_settings_history(effective_from, cigarettes_per_day,
+                             price_per_pack, cigarettes_per_pack)
+    refresh_partner_snapshot()
     return res.data[0]
 
 
@@ -89,36 +152,122 @@ def _make_quit_datetime(quit_date: date) -> str:
     return dt.isoformat()
 
 
+# ─── settings_history ────────────────────────────────────────────────────────
+
+@instrumented
+def get_settings_history() -> list[dict]:
+    """本数・価格の変更履歴を全件取得（適用開始日の古い順）"""
+    res = (
+        _table("settings_history")
+        .select("*")
+        .order("effective_from")
+        .order("created_at")
+        .execute()
+    )
+    return res.data
+
+
+@instrumented
+def add_settings_history(effective_from: date, cigarettes_per_day: int,
+                         price_per_pack: int, cigarettes_per_pack: int = 20) -> dict:
+    """本数・価格の変更を履歴として記録する（同日の変更は上書き）"""
+    data = {
+        "effective_from": str(effective_from),
+        "cigarettes_per_day": cigarettes_per_day,
+        "price_per_pack": price_per_pack,
+        "cigarettes_per_pack": cigarettes_per_pack,
+    }
+    res = _table("settings_history").upsert(data, on_conflict="effective_from").execute()
+    return res.data[0]
+
+
 # ─── craving_logs ────────────────────────────────────────────────────────────
 
 def add_craving_log(intensity: int, trigger: str, resisted: bool,
                     message: str = "") -> dict:
-    """衝動ログを追加する"""
+    """衝動ログを追加する
+
+    ローカルジャーナルに書いて即座に返す（Supabase へは同期スレッドが送る）。
+    日時は記録した時点のものを入れておく。
+
+    Returns:
+        追加した行（sync_status が "pending"）
+    """
+    now = datetime.now(_JST).isoformat()
     data = {
+        "logged_at": now,
         "intensity": intensity,
         "trigger": trigger,
         "resisted": resisted,
         "message": message,
+        "created_at": now,
     }
-    res = _table("craving_logs").insert(data).execute()
-    return res.data[0]
+    return _journal().append("craving_logs", data)
 
 
-def get_craving_logs() -> list[dict]:
-    """衝動ログを全件取得（新しい順）"""
-    res = _table("craving_logs").select("*").order("logged_at", desc=True).execute()
-    return res.data
+@instrumented
+def get_craving_logs(since: Optional[datetime] = None, columns: str = "*",
+                     resisted: Optional[bool] = None, limit: Optional[int] = None) -> list[dict]:
+    """衝動ログを取得（新しい順）
+
+    Args:
+        since: 指定した日時以降のログのみ取得（None なら全件）
+        columns: 取得する列（カンマ区切り）
+        resisted: 我慢できたか否かで絞り込む（None なら絞り込まない）
+        limit: 取得する最大件数（None なら全件）
+    """
+    query = _table("craving_logs").select(columns)
+    if since is not None:
+        query = query.gte("logged_at", since.isoformat())
+    if resisted is not None:
+        query = query.eq("resisted", resisted)
+    query = query.order("logged_at", desc=True)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.execute().data
+
+
+@instrumented
+def count_craving_logs(resisted: Optional[bool] = None) -> int:
+    """衝動ログの件数を返す（行は転送せず件数だけを取得する）
+
+    Args:
+        resisted: 我慢できたか否かで絞り込む（None なら全件）
+    """
+    query = _table("craving_logs").select("id", count="exact", head=True)
+    if resisted is not None:
+        query = query.eq("resisted", resisted)
+    return query.execute().count or 0
+
+
+@instrumented
+def get_craving_logs_version() -> str:
+    """衝動ログの版を返す（最新の created_at と件数）
+
+    集計結果のキャッシュキーに使う。行本体は取得しない。
+    """
+    res = (
+        _table("craving_logs")
+        .select("created_at", count="exact")
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    latest = res.data[0]["created_at"] if res.data else ""
+    return f"{latest}:{res.count or 0}"
 
 
 # ─── fertility_logs ──────────────────────────────────────────────────────────
 
-def get_today_fertility_log() -> Optional[dict]:
-    """今日の妊活ログを取得する"""
-    today = str(date.today())
+@instrumented
+def get_today_fertility_log(log_date: Optional[date] = None) -> Optional[dict]:
+    """今日（log_date 指定時はその日）の妊活ログを取得する"""
+    today = str(log_date or date.today())
     res = _table("fertility_logs").select("*").eq("date", today).limit(1).execute()
     return res.data[0] if res.data else None
 
 
+@instrumented
 def upsert_fertility_log(log_date: date, zinc: bool, folate: bool,
                          sleep_hours: float, exercise: bool,
                          stress: int, notes: str = "") -> dict:
@@ -137,49 +286,431 @@ def upsert_fertility_log(log_date: date, zinc: bool, folate: bool,
         res = _table("fertility_logs").update(data).eq("id", existing["id"]).execute()
     else:
         res = _table("fertility_logs").insert(data).execute()
+    refresh_partner_snapshot()
     return res.data[0]
 
 
+@instrumented
 def get_fertility_logs() -> list[dict]:
     """妊活ログを全件取得（新しい順）"""
     res = _table("fertility_logs").select("*").order("date", desc=True).execute()
     return res.data
 
 
+@instrumented
+def get_fertility_logs_version() -> str:
+    """妊活ログの版を返す（最新の updated_at と件数）
+
+    集計結果のキャッシュキーに使う。行本体は取得しない。
+    """
+    res = (
+        _table("fertility_logs")
+        .select("updated_at", count="exact")
+        .order("updated_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    latest = res.data[0]["updated_at"] if res.data else ""
+    return f"{latest}:{res.count or 0}"
+
+
+# ─── craving_forecast ────────────────────────────────────────────────────────
+_FORECAST_ID = "default"
+_FORECAST_MAX_RETRIES = 5  # 作り直しが同時更新で書き込めなかったときにやり直す回数
+
+
+def _read_forecast_row() -> Optional[dict]:
+    res = _table("craving_forecast").select("version,state").eq("id", _FORECAST_ID).limit(1).execute()
+    return res.data[0] if res.data else None
+
+
+def _write_forecast(version: Optional[int], forecaster: CravingForecaster) -> bool:
+    """読んだときの version のままの場合だけ、version を1つ進めて状態を書き込む
+
+    まだ行がなければ version 1 として作る（同時に作られていたら書き込まない）。
+    """
+    row = {"state": forecaster.to_state(), "updated_at": datetime.now(_JST).isoformat()}
+    if version is None:
+        res = _table("craving_forecast").upsert(
+            {"id": _FORECAST_ID, "version": 1, **row},
+            on_conflict="id",
+            ignore_duplicates=True,
+        ).execute()
+    else:
+        res = (
+            _table("craving_forecast")
+            .update({"version": version + 1, **row})
+            .eq("id", _FORECAST_ID)
+            .eq("version", version)
+            .execute()
+        )
+    if res.data:
+        _load_craving_forecast.clear()
+    return bool(res.data)
+
+
+def _discard_craving_forecast() -> None:
+    """予測の状態を捨てる（取り込み漏れがあるとき。次に読むときに全件から作り直される）"""
+    try:
+        _table("craving_forecast").delete().eq("id", _FORECAST_ID).execute()
+    except Exception:
+        logger.exception("衝動リスク予測を破棄できませんでした")
+    _load_craving_forecast.clear()
+
+
+@instrumented
+def rebuild_craving_forecast() -> CravingForecaster:
+    """衝動ログ全件から予測の状態を作り直す（初回と、過去の記録をまとめて取り込んだとき）
+
+    version を読んでから全件を読むため、書き込めた状態にはその時点までのログがすべて入る。
+    その間に他のプロセスが更新していたら（version が変わっていたら）読み直してやり直す。
+    """
+    for _ in range(_FORECAST_MAX_RETRIES):
+        row = _read_forecast_row()
+        forecaster = CravingForecaster()
+        for log in get_craving_logs(columns="logged_at,intensity"):
+            forecaster.update(parse_timestamp(log["logged_at"]), log["intensity"])
+        if _write_forecast(row["version"] if row else None, forecaster):
+            return forecaster
+    # 競合が続いた場合も、作った状態は全件から作ったものなので表示にはそのまま使える
+    return forecaster
+
+
+@instrumented
+def update_craving_forecast(new_logs: list[dict]) -> None:
+    """新しく追加された衝動ログを予測の状態に取り込む（1件あたり一定の手間）
+
+    読んだときの version と一致する場合だけ書き込む。他のプロセスが先に更新していたら、
+    その更新（全件からの作り直しを含む）に new_logs が入っているかは分からないため、
+    足し直さずに全件から作り直す（取り込み漏れ・二重取り込みを防ぐ）。
+    """
+    row = _read_forecast_row()
+    if row is not None:
+        forecaster = CravingForecaster.from_state(row["state"])
+        for log in new_logs:
+            forecaster.update(parse_timestamp(log["logged_at"]), log["intensity"])
+        if _write_forecast(row["version"], forecaster):
+            return
+    rebuild_craving_forecast()  # 追加済みの new_logs も全件の中に含まれる
+
+
+@st.cache_data(ttl=60)
+@instrumented
+def _load_craving_forecast() -> Optional[dict]:
+    row = _read_forecast_row()
+    return row["state"] if row else None
+
+
+def get_craving_forecaster() -> Optional[CravingForecaster]:
+    """保存済みの衝動リスク予測を返す（1行読むだけ。衝動ログがまだなければ None）
+
+    状態がまだ作られていない既存環境では、初回だけ全件から作る。
+    """
+    state = _load_craving_forecast()
+    if state is None:
+        if not count_craving_logs():
+            return None
+        return rebuild_craving_forecast()
+    return CravingForecaster.from_state(state)
+
+
+# ─── daily_craving_habits（ビュー） ─────────────────────────────────────────
+
+@instrumented
+def get_daily_craving_habits() -> list[dict]:
+    """妊活チェックを記録した日ごとの生活習慣とその日（JST）の衝動の件数を返す（古い順）
+
+    結合・日別の集計は DB 側（smoke.daily_craving_habits ビュー）で行うため、
+    転送されるのは記録日数分の行だけ。
+    """
+    return _table("daily_craving_habits").select("*").order("date").execute().data
+
+
+# ─── daily_craving_trends（ビュー） ──────────────────────────────────────────
+
+@instrumented
+def get_craving_trends(days: int = 90) -> list[dict]:
+    """直近 days 日（JST）の衝動の件数と7日・30日の移動集計を返す（古い順・1日1行）
+
+    移動集計は DB 側（smoke.daily_craving_trends ビュー）でウィンドウ関数を使って
+    全期間の日別件数から計算するため、期間の先頭の日の窓にもそれ以前の記録が含まれる。
+    転送されるのは days 行だけ。
+    """
+    since = today_jst() - timedelta(days=days - 1)
+    return (
+        _table("daily_craving_trends")
+        .select("*")
+        .gte("date", since.isoformat())
+        .order("date")
+        .execute()
+        .data
+    )
+
+
 # ─── milestones ──────────────────────────────────────────────────────────────
 
+@instrumented
 def get_achieved_milestones() -> set[str]:
     """達成済みマイルストーンのキーセットを返す"""
     res = _table("milestones").select("milestone_key").execute()
     return {row["milestone_key"] for row in res.data}
 
 
+@instrumented
 def achieve_milestone(milestone_key: str) -> None:
     """マイルストーンを達成済みとして記録する"""
     _table("milestones").upsert({"milestone_key": milestone_key}).execute()
+    refresh_partner_snapshot()
+
+
+# ─── custom_milestones ───────────────────────────────────────────────────────
+
+@st.cache_data(ttl=600)
+@instrumented
+def get_custom_milestones() -> list[dict]:
+    """ユーザー定義マイルストーンを全件取得（しきい値の小さい順）"""
+    res = _table("custom_milestones").select("*").order("threshold").execute()
+    return res.data
+
+
+@instrumented
+def add_custom_milestone(milestone_key: str, kind: str, threshold: int,
+                         title: str, description: str = "", emoji: str = "🎖️") -> dict:
+    """ユーザー定義マイルストーンを保存する（同じキーは上書き）
+
+    Args:
+        kind: 'days'（禁煙日数）または 'money'（節約金額・円）
+        threshold: 達成に必要な日数または金額
+    """
+    data = {
+        "milestone_key": milestone_key,
+        "kind": kind,
+        "threshold": threshold,
+        "title": title,
+        "description": description,
+        "emoji": emoji,
+    }
+    res = _table("custom_milestones").upsert(data, on_conflict="milestone_key").execute()
+    get_custom_milestones.clear()
+    refresh_partner_snapshot()
+    return res.data[0]
+
+
+@instrumented
+def delete_custom_milestone(milestone_key: str) -> None:
+    """ユーザー定義マイルストーンを削除する"""
+    _table("custom_milestones").delete().eq("milestone_key", milestone_key).execute()
+    get_custom_milestones.clear()
+    refresh_partner_snapshot()
+
+
+# ─── notification_outbox ─────────────────────────────────────────────────────
+
+@instrumented
+def insert_outbox(rows: list[dict]) -> int:
+    """通知を送信待ちとしてまとめて登録する
+
+    各行は idempotency_key・kind・payload を持つ。
+    同じ idempotency_key が既にある行は無視する。
+
+    Returns:
+        新しく登録した件数
+    """
+    if not rows:
+        return 0
+    res = _table("notification_outbox").upsert(
+        rows,
+        on_conflict="idempotency_key",
+        ignore_duplicates=True,
+    ).execute()
+    return len(res.data)
+
+
+@instrumented
+def get_pending_outbox(limit: int = 50) -> list[dict]:
+    """送信待ちの通知を古い順に取得する"""
+    res = (
+        _table("notification_outbox")
+        .select("*")
+        .eq("status", "pending")
+        .order("created_at")
+        .limit(limit)
+        .execute()
+    )
+    return res.data
+
+
+@instrumented
+def claim_outbox(row: dict, lease: timedelta) -> bool:
+    """送信待ちの通知を、lease の間だけ送信中として確保する
+
+    status が pending のままの場合だけ更新する条件付き UPDATE のため、
+    複数のプロセスが同時に確保しようとしても成功するのは1つだけ。
+    成功すると row["claimed_at"] に確保した日時を入れる（結果の記録で確保の確認に使う）。
+    """
+    now = datetime.now(timezone.utc)
+    res = (
+        _table("notification_outbox")
+        .update({
+            "status": "sending",
+            "attempts": (row.get("attempts") or 0) + 1,
+            "claimed_at": now.isoformat(),
+            "lease_until": (now + lease).isoformat(),
+        })
+        .eq("id", row["id"])
+        .eq("status", "pending")
+        .execute()
+    )
+    if res.data:
+        row["claimed_at"] = res.data[0]["claimed_at"]
+    return bool(res.data)
+
+
+def _update_claimed_outbox(row: dict, values: dict) -> bool:
+    """自分が確保したままの通知（sending・確保日時が一致）だけを更新する"""
+    res = (
+        _table("notification_outbox")
+        .update(values)
+        .eq("id", row["id"])
+        .eq("status", "sending")
+        .eq("claimed_at", row["claimed_at"])
+        .execute()
+    )
+    return bool(res.data)
+
+
+@instrumented
+def mark_outbox_sent(row: dict) -> bool:
+    """確保した通知を送信済みとして記録する
+
+    Returns:
+        記録できた場合 True（確保の期限が切れて他に渡っていた場合は False）
+    """
+    return _update_claimed_outbox(row, {
+        "status": "sent",
+        "sent_at": datetime.now(timezone.utc).isoformat(),
+        "last_error": None,
+    })
+
+
+@instrumented
+def mark_outbox_failed(row: dict, error: str, retry: bool) -> bool:
+    """確保した通知の送信失敗を記録する（retry なら送信待ちに戻す）
+
+    Returns:
+        記録できた場合 True（確保の期限が切れて他に渡っていた場合は False）
+    """
+    return _update_claimed_outbox(row, {
+        "status": "pending" if retry else "failed",
+        "last_error": error,
+    })
+
+
+@instrumented
+def release_stale_outbox() -> None:
+    """確保の期限を過ぎても送信中のままの通知（プロセス停止など）を送信待ちに戻す"""
+    (
+        _table("notification_outbox")
+        .update({"status": "pending"})
+        .eq("status", "sending")
+        .lt("lease_until", datetime.now(timezone.utc).isoformat())
+        .execute()
+    )
+
+
+@instrumented
+def get_recent_outbox(limit: int = 10) -> list[dict]:
+    """最近の通知を新しい順に取得する"""
+    res = (
+        _table("notification_outbox")
+        .select("idempotency_key,kind,payload,status,attempts,last_error,created_at,sent_at")
+        .order("created_at", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return res.data
 
 
 # ─── diary_entries ───────────────────────────────────────────────────────────
 
 def add_diary_entry(message: str, mood: str) -> dict:
-    """日記エントリーを追加する"""
+    """日記エントリーを追加する
+
+    ローカルジャーナルに書いて即座に返す（Supabase へは同期スレッドが送る）。
+
+    Returns:
+        追加した行（sync_status が "pending"）
+    """
     data = {
         "date": str(date.today()),
         "message": message,
         "mood": mood,
+        "created_at": datetime.now(_JST).isoformat(),
     }
-    res = _table("diary_entries").insert(data).execute()
-    return res.data[0]
+    return _journal().append("diary_entries", data)
 
 
-def get_diary_entries() -> list[dict]:
-    """日記エントリーを全件取得（新しい順）"""
-    res = _table("diary_entries").select("*").order("date", desc=True).execute()
-    return res.data
+# 断片の配列（message_grams）で探す検索語：1〜2文字で、配列リテラルで引用が必要な文字を含まないもの
+_SHORT_QUERY = re.compile(r'[^\s,{}"\\]{1,2}')
+
+
+def _escape_like(text: str) -> str:
+    """LIKE パターンの特殊文字（%, _, \\）をエスケープする"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@instrumented
+def get_diary_page(limit: int = 20, cursor: Optional[tuple[str, str]] = None,
+                   query: str = "", moods: Optional[list[str]] = None
+                   ) -> tuple[list[dict], Optional[tuple[str, str]]]:
+    """日記エントリーを新しい順に1ページ分取得する（キーセット方式）
+
+    OFFSET を使わず、前ページ最後の（date, created_at）より古い行から読むため、
+    エントリーが何年分あっても1ページの取得コストは変わらない。
+    本文検索は部分一致。3文字以上は pg_trgm の GIN インデックスを使う ILIKE、
+    1〜2文字はトライグラムでは索引を引けないため、本文の1・2文字の断片の配列
+    （message_grams）の GIN インデックスで探す。
+
+    Args:
+        limit: 1ページの件数
+        cursor: 前ページの最後の（date, created_at）。None なら先頭ページ
+        query: 本文の検索文字列（空なら絞り込まない）
+        moods: 絞り込む気分のリスト（None なら全て）
+
+    Returns:
+        （エントリーのリスト, 次ページのカーソル。最終ページなら None）
+    """
+    q = (
+        _table("diary_entries")
+        .select("id,date,message,mood,created_at")
+        .order("date", desc=True)
+        .order("created_at", desc=True)
+        .limit(limit + 1)  # 1件多く取って次ページの有無を判定する
+    )
+    if cursor:
+        cursor_date, cursor_created = cursor
+        q = q.or_(
+            f'date.lt.{cursor_date},'
+            f'and(date.eq.{cursor_date},created_at.lt."{cursor_created}")'
+        )
+    query = query.strip()
+    if _SHORT_QUERY.fullmatch(query):
+        q = q.contains("message_grams", [query.lower()])
+    elif query:
+        q = q.ilike("message", f"%{_escape_like(query)}%")
+    if moods is not None:
+        q = q.in_("mood", moods)
+    rows = q.execute().data
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["date"], rows[-1]["created_at"])
 
 
 # ─── partner_shares ──────────────────────────────────────────────────────────
 
+@instrumented
 def get_partner_share() -> Optional[dict]:
     """有効なパートナー共有設定を取得する（最新1件）"""
     res = (
@@ -193,6 +724,7 @@ def get_partner_share() -> Optional[dict]:
     return res.data[0] if res.data else None
 
 
+@instrumented
 def get_partner_share_by_code(code: str) -> Optional[dict]:
     """共有コードで有効なパートナー共有設定を取得する"""
     res = (
@@ -206,6 +738,7 @@ def get_partner_share_by_code(code: str) -> Optional[dict]:
     return res.data[0] if res.data else None
 
 
+@instrumented
 def create_partner_share() -> dict:
     """パートナー共有コードを新規生成して保存する
 
@@ -223,18 +756,22 @@ def create_partner_share() -> dict:
     share_code = secrets.token_urlsafe(6)[:8].upper()
 
     res = _table("partner_shares").insert({"share_code": share_code, "is_active": True}).execute()
+    refresh_partner_snapshot(share_code)
     return res.data[0]
 
 
+@instrumented
 def deactivate_partner_share() -> None:
     """有効なパートナー共有を無効化する"""
     existing = get_partner_share()
     if existing:
         _table("partner_shares").update({"is_active": False}).eq("id", existing["id"]).execute()
+        _table("partner_snapshots").delete().eq("share_code", existing["share_code"]).execute()
 
 
 # ─── partner_messages ────────────────────────────────────────────────────────
 
+@instrumented
 def add_partner_message(share_code: str, sender: str, message: str) -> dict:
     """パートナーメッセージを追加する
 
@@ -249,23 +786,53 @@ def add_partner_message(share_code: str, sender: str, message: str) -> dict:
         "message": message,
     }
     res = _table("partner_messages").insert(data).execute()
+    refresh_partner_snapshot(share_code)
     return res.data[0]
 
 
 # ─── quit_attempts ───────────────────────────────────────────────────────────
 
-def get_quit_attempts() -> list[dict]:
-    """挑戦履歴を全件取得（古い順）"""
-    res = _table("quit_attempts").select("*").order("start_date").execute()
-    return res.data
+@instrumented
+def get_quit_attempts(limit: Optional[int] = None) -> list[dict]:
+    """挑戦履歴を取得（古い順）
+
+    Args:
+        limit: 新しい方から取得する最大件数（None なら全件）
+    """
+    query = _table("quit_attempts").select("*")
+    if limit is None:
+        return query.order("start_date").execute().data
+    rows = query.order("start_date", desc=True).limit(limit).execute().data
+    return rows[::-1]
+
 
+@instrumented
+def get_quit_attempt_stats() -> tuple[int, int]:
+    """（総挑戦回数, 終了済みの挑戦の最長継続日数）を返す
 
+    件数は count のみ、最長記録は1行だけ取得するため、挑戦履歴全件は転送しない。
+    """
+    count_res = _table("quit_attempts").select("id", count="exact", head=True).execute()
+    best_res = (
+        _table("quit_attempts")
+        .select("days_lasted")
+        .not_.is_("days_lasted", "null")
+        .order("days_lasted", desc=True)
+        .limit(1)
+        .execute()
+    )
+    max_days = best_res.data[0]["days_lasted"] if best_res.data else 0
+    return count_res.count or 0, max_days
+
+
+@instrumented
 def start_quit_attempt(start_date: date) -> dict:
     """新しい挑戦を記録する"""
     res = _table("quit_attempts").insert({"start_date": str(start_date)}).execute()
     return res.data[0]
 
 
+@instrumented
 def end_quit_attempt(end_date: date) -> None:
     """継続中の挑戦（end_date=NULL）を終了として記録する"""
     res = (
@@ -286,6 +853,7 @@ def end_quit_attempt(end_date: date) -> None:
         }).eq("id", current["id"]).execute()
 
 
+@instrumented
 def restart_quit() -> Optional[dict]:
     """禁煙を再スタートする（quit_dateを今日に更新・挑戦履歴を記録）"""
     existing = get_user_settings()
@@ -307,12 +875,14 @@ def restart_quit() -> Optional[dict]:
 
 # ─── coping_strategies ───────────────────────────────────────────────────────
 
+@instrumented
 def get_coping_strategies() -> dict:
     """トリガー別コーピング戦略を取得する → {trigger: strategy} のdictで返す"""
     res = _table("coping_strategies").select("*").execute()
     return {row["trigger"]: row["strategy"] for row in res.data}
 
 
+@instrumented
 def upsert_coping_strategy(trigger: str, strategy: str) -> dict:
     """トリガー別コーピング戦略を保存する"""
     res = _table("coping_strategies").upsert(
@@ -324,6 +894,7 @@ def upsert_coping_strategy(trigger: str, strategy: str) -> dict:
 
 # ─── partner_messages ────────────────────────────────────────────────────────
 
+@instrumented
 def get_partner_messages(share_code: str) -> list[dict]:
     """指定した共有コードのメッセージを最新50件取得する（新しい順）"""
     res = (
@@ -335,3 +906,179 @@ def get_partner_messages(share_code: str) -> list[dict]:
         .execute()
     )
     return res.data
+
+
+# ─── partner_snapshots ───────────────────────────────────────────────────────
+# パートナービューに必要なデータ（設定・設定履歴・ユーザー定義マイルストーン・
+# 最新の妊活ログ・メッセージ）を共有コードごとに1行へまとめておく。
+# 書き込み時に作り直し、閲覧時はバージョン番号だけを読んで、
+# 同じバージョンの中身はプロセス内のキャッシュから返す。
+
+def _build_partner_snapshot(share_code: str) -> dict:
+    """パートナービューに表示する元データを集める"""
+    fertility = (
+        _table("fertility_logs")
+        .select("date,zinc,folate,exercise,sleep_hours")
+        .order("date", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return {
+        "settings": get_user_settings(),
+        "settings_history": get_settings_history(),
+        "custom_milestones": get_custom_milestones(),
+        "latest_fertility_log": fertility.data[0] if fertility.data else None,
+        "messages": get_partner_messages(share_code),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+_SNAPSHOT_MAX_RETRIES = 5  # 同時に作り直されて書き込めなかったときにやり直す回数
+
+
+def _read_snapshot_version(share_code: str) -> Optional[int]:
+    res = (
+        _table("partner_snapshots")
+        .select("version")
+        .eq("share_code", share_code)
+        .limit(1)
+        .execute()
+    )
+    return res.data[0]["version"] if res.data else None
+
+
+def _write_partner_snapshot(share_code: str, version: Optional[int], payload: dict) -> bool:
+    """読んだときのバージョンのままの場合だけ、バージョンを1つ進めて書き込む
+
+    まだ行がなければ version 1 として作る（同時に作られていたら書き込まない）。
+    """
+    row = {"payload": payload, "generated_at": payload["generated_at"]}
+    if version is None:
+        res = _table("partner_snapshots").upsert(
+            {"share_code": share_code, "version": 1, **row},
+            on_conflict="share_code",
+            ignore_duplicates=True,
+        ).execute()
+    else:
+        res = (
+            _table("partner_snapshots")
+            .update({"version": version + 1, **row})
+            .eq("share_code", share_code)
+            .eq("version", version)
+            .execute()
+        )
+    return bool(res.data)
+
+
+@instrumented
+def refresh_partner_snapshot(share_code: Optional[str] = None) -> Optional[int]:
+    """パートナースナップショットを作り直す
+
+    バージョン番号は DB の値を1つずつ進める。読んだときのバージョンのままの場合だけ
+    書き込む条件付き更新のため、同時に作り直されても古いデータが新しいデータを
+    上書きしたり、バージョンが戻ったりすることはない（競合したら読み直してやり直す）。
+
+    Args:
+        share_code: 対象の共有コード（None なら有効な共有。共有がなければ何もしない）
+
+    Returns:
+        新しいバージョン番号（作り直さなかった場合は None）
+    """
+    if share_code is None:
+        share = get_partner_share()
+        if not share:
+            return None
+        share_code = share["share_code"]
+    for _ in range(_SNAPSHOT_MAX_RETRIES):
+        # バージョンを先に読むため、その後に集めたデータが書き込まれるのは
+        # 誰もバージョンを進めていない場合だけ
+        version = _read_snapshot_version(share_code)
+        if _write_partner_snapshot(share_code, version, _build_partner_snapshot(share_code)):
+            return (version or 0) + 1
+    # 競合が続いた場合は、その間に他のプロセスが作り直した最新のものを使う
+    return _read_snapshot_version(share_code)
+
+
+@st.cache_data(max_entries=16)
+@instrumented
+def _load_partner_snapshot(share_code: str, version: int) -> Optional[dict]:
+    """指定バージョンのスナップショット本体を取得する（バージョンごとに1回だけ読む）
+
+    読む間に作り直されていた場合は None（別のバージョンの中身をこのキーで覚えないため）。
+    """
+    res = (
+        _table("partner_snapshots")
+        .select("payload")
+        .eq("share_code", share_code)
+        .eq("version", version)
+        .limit(1)
+        .execute()
+    )
+    return res.data[0]["payload"] if res.data else None
+
+
+@instrumented
+def get_partner_snapshot(share_code: str) -> Optional[dict]:
+    """共有コードのパートナースナップショットを返す（共有が無効なら None）
+
+    閲覧ごとの DB アクセスはバージョン番号の取得1回のみ。
+    まだ作られていなければ、共有が有効な場合に限りその場で作る。
+    """
+    for _ in range(_SNAPSHOT_MAX_RETRIES):
+        version = _read_snapshot_version(share_code)
+        if version is None:
+            if not get_partner_share_by_code(share_code):
+                return None
+            version = refresh_partner_snapshot(share_code)
+            if version is None:
+                return None
+        payload = _load_partner_snapshot(share_code, version)
+        if payload is not None:
+            return payload
+        # バージョンを読んでから中身を読むまでに作り直された（共有の停止で消された場合も含む）
+    return None
+
+
+# ─── エクスポート ────────────────────────────────────────────────────────────
+
+@instrumented
+def get_table_page(table_name: str, after_id: Optional[str] = None,
+                   limit: int = 1000, columns: str = "*") -> list[dict]:
+    """テーブルの行を id 順に1ページ分取得する（キーセット方式）
+
+    Args:
+        table_name: smoke スキーマのテーブル名（id 列を持つもの）
+        after_id: 前ページ最後の id。None なら先頭ページ
+        limit: 1ページの件数
+        columns: 取得する列（カンマ区切り）
+    """
+    query = _table(table_name).select(columns).order("id").limit(limit)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return query.execute().data
+
+
+# ─── インポート ──────────────────────────────────────────────────────────────
+
+@instrumented
+def bulk_upsert_rows(table_name: str, rows: list[dict], on_conflict: str,
+                     ignore_duplicates: bool = False) -> int:
+    """複数行をまとめて書き込む（一括インポート用）
+
+    パートナースナップショットの作り直しなどは行わない（呼び出し側で最後に1回行う）。
+
+    Args:
+        table_name: smoke スキーマのテーブル名
+        rows: 書き込む行
+        on_conflict: 重複を判定する一意キーの列
+        ignore_duplicates: True なら既存の行は変更しない（False なら上書き）
+
+    Returns:
+        書き込んだ行数（ignore_duplicates のときは新しく追加された行数）
+    """
+    res = (
+        _table(table_name)
+        .upsert(rows, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+        .execute()
+    )
+    return len(res.data)
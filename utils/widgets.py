@@ -0,0 +1,57 @@
+"""
+画面内ウィジェット（5分タイマー・深呼吸ガイド・禁煙期間カウンター）
+
+HTML・JavaScript を毎回 components.html に渡すと、再実行のたびに全文が送られ
+iframe も作り直される（動いているタイマーもリセットされる）。
+ここでは utils/widgets_frontend/ を静的なカスタムコンポーネントとして登録し、
+アセットは一度だけ読み込ませて、再実行時には小さな引数だけを送る。
+"""
+from datetime import datetime
+from pathlib import Path
+
+import streamlit.components.v1 as components
+
+_FRONTEND_DIR = Path(__file__).with_name("widgets_frontend")
+
+_widget = components.declare_component("papa_widgets", path=str(_FRONTEND_DIR))
+
+
+def emergency_timer(seconds: int = 300, key: str = "emergency_timer") -> None:
+    """衝動をやり過ごすためのカウントダウンタイマーを表示する
+
+    終了時刻はブラウザに保存されるため、再実行やページ移動でリセットされない。
+    """
+    _widget(
+        widget="timer",
+        seconds=seconds,
+        storage_key=key,
+        note="「衝動のピークは5分で過ぎます。この時間を乗り切れば大丈夫！」",
+        key=key,
+        default=None,
+    )
+
+
+def breathing_guide(phase_seconds: int = 4, cycles: int = 3, key: str = "breathing_guide") -> None:
+    """ボックス呼吸（吸う→止める→吐く→止める）のガイドを表示する"""
+    _widget(widget="breathing", phase_seconds=phase_seconds, cycles=cycles, key=key, default=None)
+
+
+def quit_counter(quit_start: datetime, label: str = "禁煙期間", initial: str = "",
+                 key: str = "quit_counter") -> None:
+    """禁煙期間をブラウザ側で毎秒カウントアップして表示する
+
+    サーバーから送るのは起点の時刻だけで、表示の更新に再実行は要らない。
+
+    Args:
+        quit_start: 禁煙の起点（タイムゾーン付き）
+        label: 見出し
+        initial: スクリプトが動くまでに表示しておく文字列
+    """
+    _widget(
+        widget="counter",
+        start_ms=int(quit_start.timestamp() * 1000),
+        label=label,
+        initial=initial,
+        key=key,
+        default=None,
+    )
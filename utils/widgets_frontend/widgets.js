@@ -0,0 +1,215 @@
+/*
+ * 画面内ウィジェット（Streamlit カスタムコンポーネント）
+ *
+ * このファイルは静的ファイルとして配信され、ブラウザにキャッシュされる。
+ * 再実行のたびに届くのは props（args）だけで、iframe も作り直されない。
+ * 表示するウィジェットは args.widget で切り替える。
+ * 各ウィジェットの mount は、再実行時に新しい args を受け取る update 関数を返してよい。
+ */
+(function () {
+  "use strict";
+
+  // ─── Streamlit とのやりとり ─────────────────────────────────────────────
+  function sendMessage(type, data) {
+    window.parent.postMessage(
+      Object.assign({ isStreamlitMessage: true, type: type }, data || {}),
+      "*"
+    );
+  }
+
+  function setFrameHeight() {
+    sendMessage("streamlit:setFrameHeight", { height: document.body.scrollHeight });
+  }
+
+  function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function pad2(n) {
+    return String(n).padStart(2, "0");
+  }
+
+  // ─── 5分タイマー ────────────────────────────────────────────────────────
+  // 終了時刻を localStorage に保存するため、ページを移動して戻っても続きから数える
+  function mountTimer(root, args) {
+    const seconds = args.seconds || 300;
+    const storageKey = "papa-widgets:timer:" + (args.storage_key || "default");
+
+    const wrap = el("div", "widget");
+    const display = el("div", "timer-display");
+    const buttons = el("div", "timer-buttons");
+    const start = el("button", "timer-start", "スタート");
+    const reset = el("button", "timer-reset", "リセット");
+    buttons.append(start, reset);
+    wrap.append(display, buttons, el("p", "note", args.note || ""));
+    root.append(wrap);
+
+    let interval = null;
+
+    function endsAt() {
+      const value = Number(window.localStorage.getItem(storageKey));
+      return value > 0 ? value : null;
+    }
+
+    function render() {
+      const end = endsAt();
+      if (end === null) {
+        display.textContent = pad2(Math.floor(seconds / 60)) + ":" + pad2(seconds % 60);
+        return;
+      }
+      const remaining = Math.ceil((end - Date.now()) / 1000);
+      if (remaining <= 0) {
+        display.textContent = "✅ 乗り越えました！";
+        stop();
+        return;
+      }
+      display.textContent = pad2(Math.floor(remaining / 60)) + ":" + pad2(remaining % 60);
+    }
+
+    function run() {
+      if (interval === null) interval = setInterval(render, 250);
+      render();
+    }
+
+    function stop() {
+      clearInterval(interval);
+      interval = null;
+    }
+
+    start.addEventListener("click", function () {
+      if (endsAt() === null) {
+        window.localStorage.setItem(storageKey, String(Date.now() + seconds * 1000));
+      }
+      run();
+    });
+    reset.addEventListener("click", function () {
+      stop();
+      window.localStorage.removeItem(storageKey);
+      render();
+    });
+
+    if (endsAt() !== null) run();
+    else render();
+  }
+
+  // ─── 深呼吸ガイド（ボックス呼吸） ─────────────────────────────────────────
+  function mountBreathing(root, args) {
+    const phaseSeconds = args.phase_seconds || 4;
+    const cycles = args.cycles || 3;
+    const phases = ["吸う", "止める", "吐く", "止める"].map(function (label) {
+      return { label: label + "（" + phaseSeconds + "秒）", duration: phaseSeconds };
+    });
+
+    const wrap = el("div", "widget");
+    const text = el("div", "breath-text", "準備完了");
+    const barWrap = el("div", "breath-bar-wrap");
+    const bar = el("div", "breath-bar");
+    const start = el("button", "breath-start", "開始");
+    barWrap.append(bar);
+    wrap.append(
+      text, barWrap, start,
+      el("p", "note", phases.map(function (p) { return p.label; }).join(" → "))
+    );
+    root.append(wrap);
+
+    let running = false;
+
+    function sleep(ms) {
+      return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    start.addEventListener("click", async function () {
+      if (running) return;
+      running = true;
+      for (let cycle = 0; cycle < cycles; cycle++) {
+        for (const phase of phases) {
+          text.textContent = phase.label;
+          bar.style.transition = "none";
+          bar.style.width = "0%";
+          await sleep(50);
+          bar.style.transition = "width " + phase.duration + "s linear";
+          bar.style.width = "100%";
+          await sleep(phase.duration * 1000 - 50);
+        }
+      }
+      text.textContent = "✅ お疲れ様でした";
+      running = false;
+    });
+  }
+
+  // ─── 禁煙期間カウンター ───────────────────────────────────────────────────
+  // 起点の時刻だけを受け取り、経過時間はブラウザ側で毎秒数える（サーバーの再実行は不要）
+  function formatElapsed(totalSeconds) {
+    if (totalSeconds < 0) totalSeconds = 0;
+    const days = Math.floor(totalSeconds / 86400);
+    const hours = Math.floor((totalSeconds % 86400) / 3600);
+    const minutes = Math.floor((totalSeconds % 3600) / 60);
+    const seconds = totalSeconds % 60;
+    const hms = (hours ? hours + "時間 " : "") + pad2(minutes) + "分 " + pad2(seconds) + "秒";
+    return days ? days + "日 " + hms : hms;
+  }
+
+  function mountCounter(root, args, theme) {
+    const wrap = el("div", "counter");
+    const label = el("div", "counter-label", args.label || "");
+    const value = el("div", "counter-value", args.initial || "");
+    wrap.append(label, value);
+    root.append(wrap);
+    if (theme) {
+      if (theme.textColor) wrap.style.color = theme.textColor;
+      if (theme.font) wrap.style.fontFamily = theme.font;
+    }
+
+    let startMs = args.start_ms;
+
+    function tick() {
+      value.textContent = formatElapsed(Math.floor((Date.now() - startMs) / 1000));
+    }
+
+    tick();
+    // 秒の変わり目に合わせて更新する
+    setTimeout(function () {
+      tick();
+      setInterval(tick, 1000);
+    }, 1000 - ((Date.now() - startMs) % 1000));
+
+    return function update(newArgs) {
+      label.textContent = newArgs.label || "";
+      startMs = newArgs.start_ms;  // 再スタートなどで起点が変わった場合
+      tick();
+    };
+  }
+
+  const WIDGETS = {
+    timer: mountTimer,
+    breathing: mountBreathing,
+    counter: mountCounter,
+  };
+
+  // ─── 描画 ─────────────────────────────────────────────────────────────
+  // 初回の render で DOM を組み立て、以降の render（再実行）では update だけを呼ぶ
+  let mounted = false;
+  let update = null;
+
+  window.addEventListener("message", function (event) {
+    if (!event.data || event.data.type !== "streamlit:render") return;
+    const args = event.data.args || {};
+    if (!mounted) {
+      const mount = WIDGETS[args.widget];
+      if (!mount) return;
+      update = mount(document.getElementById("root"), args, event.data.theme) || null;
+      mounted = true;
+    } else if (update) {
+      update(args);
+    }
+    setFrameHeight();
+  });
+
+  // 文字数が変わって折り返したときなども iframe の高さを合わせる
+  new ResizeObserver(setFrameHeight).observe(document.body);
+
+  sendMessage("streamlit:componentReady", { apiVersion: 1 });
+})();
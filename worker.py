@@ -0,0 +1,184 @@
+"""
+通知ワーカー - 妊活チェックのリマインダー・マイルストーン達成通知・衝動リスクの事前通知を送信する
+
+画面の表示とは別プロセスで動かし、通知処理を描画から切り離す。
+通知は送信箱（smoke.notification_outbox）を経由するため、ワーカーを複数動かしたり
+再起動したりしても同じ通知が二重に送られることはない。
+
+    python worker.py          # 常駐して定期的にチェックする
+    python worker.py --once   # 1回だけチェックして終了する（cron 向け）
+
+環境変数:
+    REMINDER_TIMES        リマインダーを送る時刻（JST・カンマ区切り、既定 "21:00"）
+    WORKER_POLL_SECONDS   常駐時のチェック間隔（秒、既定 60）
+    CRAVING_NUDGE         衝動が起きやすい時間帯の前に通知するか（"0" で無効、既定 "1"）
+"""
+import argparse
+import logging
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from utils.calculations import build_savings_index, get_smoke_free_days
+from utils.craving_forecast import RISK_HIGH
+from utils.discord_notifier import (
+    deliver_outbox,
+    enqueue_craving_risk_nudge,
+    enqueue_daily_reminder,
+    enqueue_milestone_notifications,
+    is_discord_configured,
+)
+from utils.env import get_env
+from utils.metrics import start_exporters_from_env
+from utils.milestones import KIND_MONEY, build_milestone_registry
+from utils.supabase_client import (
+    get_craving_forecaster,
+    get_custom_milestones,
+    get_settings_history,
+    get_today_fertility_log,
+    get_user_settings,
+)
+
+_JST = timezone(timedelta(hours=9))
+
+logger = logging.getLogger("worker")
+
+
+def _current_progress(settings: dict) -> tuple[int, int]:
+    """設定から（禁煙日数, 節約金額）を計算する"""
+    quit_date = date.fromisoformat(settings["quit_date"])
+    days = get_smoke_free_days(quit_date)
+    money = build_savings_index(settings, get_settings_history()).total()
+    return days, money
+
+
+def check_milestones() -> int:
+    """達成済みのマイルストーンを送信箱に登録する（通知済み・登録済みは無視される）
+
+    Returns:
+        新しく登録した件数
+    """
+    settings = get_user_settings()
+    if not settings:
+        return 0
+    days, money = _current_progress(settings)
+    registry = build_milestone_registry(get_custom_milestones())
+    return enqueue_milestone_notifications(
+        registry.achieved(days) + registry.achieved(money, KIND_MONEY)
+    )
+
+
+def check_reminder(today: date, slot: str) -> bool:
+    """today（JST）の妊活チェックが未入力なら、slot（"21:00" など）のリマインダーを送信箱に登録する
+
+    Returns:
+        新しく登録した場合 True
+    """
+    if get_today_fertility_log(today):
+        return False
+    settings = get_user_settings()
+    if not settings:
+        return False
+    days, money = _current_progress(settings)
+    return enqueue_daily_reminder(today, days, money, slot)
+
+
+def check_craving_risk(now: datetime) -> bool:
+    """次の1時間の衝動リスクが高ければ、事前通知を送信箱に登録する（1時間帯につき1回）
+
+    Returns:
+        新しく登録した場合 True
+    """
+    forecaster = get_craving_forecaster()
+    risk = forecaster.forecast(now) if forecaster else None
+    if risk is None or risk.level != RISK_HIGH:
+        return False
+    slot_start = now.astimezone(_JST).replace(minute=0, second=0, microsecond=0)
+    if risk.slot != (slot_start.weekday() * 24 + slot_start.hour):
+        slot_start += timedelta(hours=1)
+    return enqueue_craving_risk_nudge(slot_start.date(), slot_start.hour, risk.label, risk.ratio)
+
+
+def _parse_times(value: str) -> list[str]:
+    """"21:00,8:30" → ["08:30", "21:00"]"""
+    times = []
+    for part in value.split(","):
+        part = part.strip()
+        if part:
+            hour, minute = part.split(":")
+            times.append(f"{int(hour):02d}:{int(minute):02d}")
+    return sorted(times)
+
+
+def _current_slot(reminder_times: list[str], now: datetime) -> Optional[str]:
+    """now 時点のリマインダーの時刻枠（過ぎた時刻のうち最後のもの）
+
+    1回実行でも常駐と同じ時刻枠のキーを使う。まだどの時刻も過ぎていなければ None
+    （日付が変わった直後の実行で、その日の枠を先回りして登録しない）。
+    """
+    passed = [t for t in reminder_times if t <= now.strftime("%H:%M")]
+    return passed[-1] if passed else None
+
+
+def run_once(reminder_times: list[str], craving_nudge: bool = True) -> None:
+    """マイルストーン・リマインダー・衝動リスクを1回チェックし、送信箱を送信する"""
+    now = datetime.now(_JST)
+    check_milestones()
+    slot = _current_slot(reminder_times, now)
+    if slot is not None:
+        check_reminder(now.date(), slot)
+    if craving_nudge:
+        check_craving_risk(now)
+    sent = deliver_outbox()
+    logger.info("通知を送信しました: %d件", sent)
+
+
+def run_forever(reminder_times: list[str], poll_seconds: int, craving_nudge: bool = True) -> None:
+    """常駐してマイルストーン・衝動リスクを定期チェックし、指定時刻にリマインダーを登録・送信する"""
+    checked: set[tuple[date, str]] = set()  # チェック済みの（日付, 時刻）
+    while True:
+        now = datetime.now(_JST)
+        try:
+            check_milestones()
+            for t in reminder_times:
+                if now.strftime("%H:%M") >= t and (now.date(), t) not in checked:
+                    check_reminder(now.date(), t)
+                    checked.add((now.date(), t))
+            if craving_nudge:
+                check_craving_risk(now)
+            sent = deliver_outbox()
+            if sent:
+                logger.info("通知を送信しました: %d件", sent)
+        except Exception:  # 一時的なDB・通信エラーで常駐を止めない
+            logger.exception("チェック中にエラーが発生しました")
+        checked = {key for key in checked if key[0] == now.date()}
+        time.sleep(poll_seconds)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Discord通知ワーカー")
+    parser.add_argument("--once", action="store_true", help="1回だけチェックして終了する")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start_exporters_from_env("worker")
+    if not is_discord_configured():
+        logger.error("DISCORD_WEBHOOK_URL が設定されていません")
+        return 1
+
+    reminder_times = _parse_times(get_env("REMINDER_TIMES", "21:00"))
+    craving_nudge = get_env("CRAVING_NUDGE", "1") != "0"
+    if args.once:
+        run_once(reminder_times, craving_nudge)
+    else:
+        run_forever(
+            reminder_times,
+            int(get_env("WORKER_POLL_SECONDS", "60")),
+            craving_nudge,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())